@@ -0,0 +1,127 @@
+# bench_bulk_encoding.py
+"""
+Bulk payload size and serialization speed of the vector storage modes.
+
+Serializes --docs indexer-style documents (chunk text + --dims vector) the
+way the bulk helpers do (`expand_action`, then one `serializer.dumps` per
+action line and document):
+
+- "list (before)": vector as a Python float list, stock JsonSerializer;
+- "float" / "int8_hnsw": float32 NumPy vector, VectorJsonSerializer
+  (identical payload; int8_hnsw only changes the index);
+- "byte": int8 vector as JSON integers;
+- "byte hex": int8 vector as a hex string (Elasticsearch 8.14+).
+
+With --live, each mode is also bulk-indexed into a scratch index on the
+configured cluster to measure end-to-end indexing throughput.
+
+    python benchmarks/bench_bulk_encoding.py --docs 2000 --dims 4096
+    python benchmarks/bench_bulk_encoding.py --live
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from elasticsearch.helpers import expand_action, streaming_bulk
+from elasticsearch.serializer import JsonSerializer
+
+from src.config import INDEX_NAME
+import src.services.vector_codec as codec
+
+TEXT = "Biofilms protect bacteria from antibiotics by limiting diffusion and slowing growth. " * 6
+
+MODES = [
+    # name, VECTOR_STORAGE, hex, vector form
+    ("list (before)", "float", False, "list"),
+    ("float", "float", False, "array"),
+    ("int8_hnsw", "int8_hnsw", False, "array"),
+    ("byte", "byte", False, "array"),
+    ("byte hex", "byte", True, "array"),
+]
+
+
+def _actions(vectors, index, form):
+    for i, vector in enumerate(vectors):
+        yield {
+            "_op_type": "index",
+            "_index": index,
+            "_id": str(i),
+            "_source": {
+                "file_path": "bench.txt",
+                "section": "Bench",
+                "chunk_id": i,
+                "text": TEXT,
+                "vector": vector.tolist() if form == "list" else codec.to_stored(vector),
+            },
+        }
+
+
+def _serialize(actions, serializer):
+    total = 0
+    for action in actions:
+        header, data = expand_action(action)
+        total += len(serializer.dumps(header)) + 1 + len(serializer.dumps(data)) + 1
+    return total
+
+
+def _live(es, name, vectors, form, dims):
+    index = f"{INDEX_NAME}-bench-{name.split()[0]}"
+    if es.indices.exists(index=index):
+        es.indices.delete(index=index)
+    es.indices.create(index=index, mappings={"properties": {"text": {"type": "text"}, "vector": codec.vector_mapping(dims)}})
+    start = time.perf_counter()
+    failed = sum(not ok for ok, _ in streaming_bulk(es, _actions(vectors, index, form), chunk_size=256, raise_on_error=False))
+    es.indices.refresh(index=index)
+    seconds = time.perf_counter() - start
+    es.indices.delete(index=index)
+    return seconds, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--dims", type=int, default=4096)
+    parser.add_argument("--live", action="store_true", help="also bulk-index into the configured cluster")
+    args = parser.parse_args()
+
+    # Mean-pooled LLM hidden states are dense with a few large components
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.docs, args.dims)).astype(np.float32)
+    vectors[:, :8] *= 50
+
+    es = None
+    if args.live:
+        from src.services.es_client import get_es_client
+
+        es = get_es_client()
+
+    print(f"{args.docs} documents, {args.dims}-dim vectors\n")
+    header = f"{'mode':<14} {'MB':>8} {'bytes/doc':>10} {'ser docs/s':>11}"
+    print(header + (f" {'bulk docs/s':>12} {'failed':>7}" if es else ""))
+    baseline = None
+    for name, storage, hex_encoding, form in MODES:
+        codec.VECTOR_STORAGE, codec.VECTOR_HEX_ENCODING = storage, hex_encoding
+        serializer = JsonSerializer() if form == "list" else codec.VectorJsonSerializer()
+        start = time.perf_counter()
+        total = _serialize(_actions(vectors, INDEX_NAME, form), serializer)
+        seconds = time.perf_counter() - start
+        baseline = baseline or total
+        line = (
+            f"{name:<14} {total / 2**20:>8.1f} {total / args.docs:>10.0f} {args.docs / seconds:>11.0f}"
+            f"   ({total / baseline:.0%} of before)"
+        )
+        if es is not None:
+            try:
+                bulk_seconds, failed = _live(es, name, vectors, form, args.dims)
+                line = line.replace("   (", f" {args.docs / bulk_seconds:>12.0f} {failed:>7}   (")
+            except Exception as e:
+                line += f"  live run failed: {e}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench_chunker.py
+"""
+Benchmark of the chunking modes on the documents/ corpus.
+
+Compares fixed character windows (chunk_text) with sentence-aligned token
+chunks (chunk_text_by_tokens), plus a naive token chunker that tokenizes
+every sentence separately and rebuilds chunks by string concatenation.
+Reports chunking time, chunk token-length spread, how many chunks end on a
+sentence boundary, and how much of an embedding batch is real tokens rather
+than padding (batches of --batch-size in document order).
+
+    python benchmarks/bench_chunker.py --max-tokens 128 --overlap-tokens 24
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from transformers import AutoTokenizer
+
+from src.config import DOCS_FOLDER, MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP
+from src.agents.chunker import chunk_text, chunk_text_by_tokens
+from src.services.docs_loader import iter_documents
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def naive_token_chunks(text, tokenizer, max_tokens, overlap_tokens):
+    """
+    Baseline: one tokenizer call per sentence, chunks built by concatenation.
+    """
+    sentences = [s for s in _SENTENCE.split(text) if s.strip()]
+    chunks, current, counts = [], [], []
+    for sentence in sentences:
+        n = len(tokenizer(sentence, add_special_tokens=False)["input_ids"])
+        if current and sum(counts) + n > max_tokens:
+            chunks.append(" ".join(current))
+            while current and sum(counts) > overlap_tokens:
+                current.pop(0)
+                counts.pop(0)
+        current.append(sentence)
+        counts.append(n)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def report(name, seconds, chunks, tokenizer, batch_size):
+    lengths = [len(ids) for ids in tokenizer(chunks, add_special_tokens=False)["input_ids"]]
+    sentence_end = sum(c.rstrip().endswith((".", "!", "?")) for c in chunks) / len(chunks)
+    real = padded = 0
+    for start in range(0, len(lengths), batch_size):
+        batch = lengths[start:start + batch_size]
+        real += sum(batch)
+        padded += max(batch) * len(batch)
+    print(
+        f"{name:<18} {seconds:>8.2f} {len(chunks):>8} {statistics.mean(lengths):>8.1f} "
+        f"{statistics.pstdev(lengths):>7.1f} {max(lengths):>6} {sentence_end:>11.1%} {real / padded:>10.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokenizer", default=MODEL_NAME, help="tokenizer name or path")
+    parser.add_argument("--docs", default=DOCS_FOLDER)
+    parser.add_argument("--max-tokens", type=int, default=128)
+    parser.add_argument("--overlap-tokens", type=int, default=24)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    texts = [doc["text"] for doc in iter_documents(args.docs)]
+    print(f"{len(texts)} sections, {sum(map(len, texts)) / 1e6:.1f}M characters\n")
+
+    modes = {
+        f"chars {CHUNK_SIZE}/{CHUNK_OVERLAP}": lambda t: chunk_text(t),
+        "tokens (naive)": lambda t: naive_token_chunks(t, tokenizer, args.max_tokens, args.overlap_tokens),
+        "tokens": lambda t: chunk_text_by_tokens(t, args.max_tokens, args.overlap_tokens, tokenizer),
+    }
+    print(f"{'mode':<18} {'seconds':>8} {'chunks':>8} {'mean tok':>8} {'stdev':>7} {'max':>6} {'sentence end':>11} {'real/padded':>10}")
+    for name, chunker in modes.items():
+        start = time.perf_counter()
+        chunks = [c for t in texts for c in chunker(t)]
+        report(name, time.perf_counter() - start, chunks, tokenizer, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# bench_embedding_backends.py
+"""
+Throughput and retrieval recall of the embedding backends on documents/.
+
+Chunks are built as the indexer builds them (chunk_document). The corpus
+has no labelled queries, so recall is measured by self-retrieval: for
+--queries sampled chunks, one of their sentences is used as the query and
+a hit means the source chunk ranks in the top k by cosine similarity
+among all chunks. Reported per backend: load time, chunks/sec, tokens/sec,
+vector size, raw float32 vector storage, recall@1, recall@k and MRR.
+
+    python benchmarks/bench_embedding_backends.py --chunks 2000 --queries 200
+    python benchmarks/bench_embedding_backends.py --backends sentence-transformers --st-model BAAI/bge-small-en-v1.5
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from src.config import EMBEDDING_DIMS, EMBEDDING_MODEL, MODEL_NAME
+from src.agents.chunker import chunk_document
+from src.agents.embedding_backends import LLMBackend, SentenceTransformerBackend
+from src.services.docs_loader import iter_documents
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _llm_backend(path: str) -> LLMBackend:
+    """
+    The llm backend on its own copy of `path` (the app shares the causal LM
+    through the registry instead).
+    """
+    backend = LLMBackend()
+    backend.model_id = path
+    backend.tokenizer = AutoTokenizer.from_pretrained(path)
+    if backend.tokenizer.pad_token is None:
+        backend.tokenizer.pad_token = backend.tokenizer.eos_token
+    backend.model = AutoModel.from_pretrained(
+        path, torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+    ).eval()
+    if torch.cuda.is_available():
+        backend.model.to("cuda")
+    backend.config = backend.model.config
+    return backend
+
+
+def _load(name: str, args):
+    start = time.perf_counter()
+    if name == "llm":
+        backend = _llm_backend(args.llm_model)
+    else:
+        backend = SentenceTransformerBackend(args.st_model, args.dims)
+        backend.load()
+    return backend, time.perf_counter() - start
+
+
+def _embed(backend, texts: list, batch_size: int):
+    """
+    Vectors for `texts` in length-sorted batches, plus real token count.
+    """
+    device = next(backend.model.parameters()).device
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    vectors = [None] * len(texts)
+    tokens = 0
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        enc = backend.tokenizer([texts[i] for i in batch], padding=True, truncation=True, return_tensors="pt")
+        tokens += int(enc["attention_mask"].sum())
+        out = backend.embed(enc["input_ids"].to(device), enc["attention_mask"].to(device)).float().cpu()
+        for i, vector in zip(batch, out):
+            vectors[i] = vector
+    return torch.nn.functional.normalize(torch.stack(vectors), dim=-1), tokens
+
+
+def _queries(chunks: list, count: int, seed: int):
+    """
+    (query, chunk index) pairs: the longest sentence of a sampled chunk.
+    """
+    rng = random.Random(seed)
+    pairs = []
+    for i in rng.sample(range(len(chunks)), min(count, len(chunks))):
+        sentences = [s for s in _SENTENCE.split(chunks[i]) if len(s.split()) >= 5]
+        if sentences:
+            pairs.append((max(sentences, key=len), i))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["llm", "sentence-transformers"],
+                        choices=["llm", "sentence-transformers"])
+    parser.add_argument("--llm-model", default=MODEL_NAME, help="causal LM name or path for the llm backend")
+    parser.add_argument("--st-model", default=EMBEDDING_MODEL, help="sentence-transformers model name or path")
+    parser.add_argument("--dims", type=int, default=EMBEDDING_DIMS, help="truncate sentence-transformers vectors (0 = native)")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chunks = []
+    for doc in iter_documents():
+        chunks.extend(chunk_document(doc["text"]))
+        if len(chunks) >= args.chunks:
+            break
+    chunks = chunks[:args.chunks]
+    pairs = _queries(chunks, args.queries, args.seed)
+    print(f"{len(chunks)} chunks, {len(pairs)} self-retrieval queries\n")
+
+    print(
+        f"{'backend':<22} {'load s':>7} {'chunks/s':>9} {'tokens/s':>9} {'dims':>5} "
+        f"{'vectors MB':>10} {'R@1':>6} {f'R@{args.top_k}':>6} {'MRR':>6}"
+    )
+    for name in args.backends:
+        try:
+            backend, load_seconds = _load(name, args)
+        except ImportError as e:
+            print(f"{name:<22} skipped: {e}")
+            continue
+        start = time.perf_counter()
+        chunk_vectors, tokens = _embed(backend, chunks, args.batch_size)
+        seconds = time.perf_counter() - start
+        query_vectors, _ = _embed(backend, [q for q, _ in pairs], args.batch_size)
+
+        scores = query_vectors @ chunk_vectors.T
+        targets = torch.tensor([i for _, i in pairs])
+        ranks = (scores > scores.gather(1, targets[:, None])).sum(dim=1) + 1
+        print(
+            f"{name:<22} {load_seconds:>7.1f} {len(chunks) / seconds:>9.1f} {tokens / seconds:>9.0f} "
+            f"{chunk_vectors.shape[1]:>5} {chunk_vectors.numel() * 4 / 2**20:>10.1f} "
+            f"{(ranks == 1).float().mean():>6.1%} {(ranks <= args.top_k).float().mean():>6.1%} "
+            f"{(1 / ranks.float()).mean():>6.3f}"
+        )
+        del backend
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# bench_hybrid_modes.py
+"""
+script_score vs. reciprocal rank fusion (HYBRID_MODE) for hybrid retrieval.
+
+Local (default): builds a LocalIndex in a temporary folder from synthetic
+clustered vectors paired with chunk texts from documents/. Each query is
+one stored chunk's vector plus noise and a few of its words, so the chunk
+it came from is the known answer. Reported per mode: ms/query, hit rate
+and MRR of the source chunk in the top k, and the overlap of the two
+modes' result lists.
+
+With --live, the given --query texts are run through `retrieve_many`
+against the configured cluster in both modes (embedding with the
+configured backend), reporting latency and the per-leg candidate counts
+and search times of `retrieval_stats`.
+
+    python benchmarks/bench_hybrid_modes.py --synthetic 50000 --dims 384
+    python benchmarks/bench_hybrid_modes.py --live --query "biofilm antibiotic tolerance" --query "quorum sensing"
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+
+import src.services.local_index as local_mod
+import src.services.retriever as retriever
+from src.agents.chunker import chunk_document
+from src.services.docs_loader import iter_documents
+
+MODES = ["script_score", "rrf"]
+
+
+def _texts(count: int) -> list:
+    chunks = []
+    for doc in iter_documents():
+        chunks.extend(chunk_document(doc["text"]))
+        if len(chunks) >= count:
+            break
+    return [chunks[i % len(chunks)] for i in range(count)]
+
+
+def _local(args):
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((args.clusters, args.dims)).astype(np.float32)
+    vectors = centers[rng.integers(0, args.clusters, args.synthetic)]
+    vectors = local_mod._normalize(vectors + 0.5 * rng.standard_normal(vectors.shape).astype(np.float32))
+    texts = _texts(len(vectors))
+    print(f"{len(vectors)} chunks x {args.dims} dims, {args.queries} queries, top {args.top_k}\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = local_mod.LocalIndex(os.path.join(tmp, "index"))
+        index.create({"embedding_dims": args.dims})
+        actions = (
+            {"_id": str(i), "_source": {"file_path": str(i), "section": "", "chunk_id": i, "text": t, "vector": v}}
+            for i, (t, v) in enumerate(zip(texts, vectors))
+        )
+        for _ in index.bulk(actions):
+            pass
+        index.save()
+
+        picks = rng.choice(len(vectors), args.queries, replace=False)
+        query_vectors = local_mod._normalize(vectors[picks] + args.noise * rng.standard_normal((args.queries, args.dims)))
+        query_texts = []
+        for i in picks:
+            words = texts[i].split()
+            start = int(rng.integers(0, max(1, len(words) - 6)))
+            query_texts.append(" ".join(words[start:start + 6]))
+
+        print(f"{'mode':<13} {'ms/query':>9} {f'hit@{args.top_k}':>7} {'MRR':>6}")
+        found = {}
+        for mode in MODES:
+            start = time.perf_counter()
+            results = [index.search_many([t], [v], args.top_k, fusion=mode)[0] for t, v in zip(query_texts, query_vectors)]
+            ms = (time.perf_counter() - start) / args.queries * 1e3
+            ranks = [
+                next((rank for rank, hit in enumerate(hits, 1) if hit["file_path"] == str(i)), None)
+                for hits, i in zip(results, picks)
+            ]
+            hit_rate = statistics.mean(rank is not None for rank in ranks)
+            mrr = statistics.mean(1 / rank if rank else 0 for rank in ranks)
+            print(f"{mode:<13} {ms:>9.2f} {hit_rate:>7.1%} {mrr:>6.3f}")
+            found[mode] = [{hit["file_path"] for hit in hits} for hits in results]
+        overlap = statistics.mean(len(a & b) / args.top_k for a, b in zip(found["script_score"], found["rrf"]))
+        print(f"\noverlap of the two modes' top {args.top_k}: {overlap:.1%}")
+
+
+def _live(args):
+    from src.services.es_client import get_es_client
+
+    es = get_es_client()
+    queries = args.query or ["biofilm antibiotic tolerance"]
+    retriever.retrieve_many(queries, es, args.top_k)  # warm up model and caches
+    for mode in MODES:
+        retriever.HYBRID_MODE = mode
+        retriever._leg_stats.clear()
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            retriever.retrieve_many(queries, es, args.top_k)
+            times.append(time.perf_counter() - start)
+        print(f"{mode}: {statistics.median(times) * 1e3:.1f} ms per batch of {len(queries)}")
+        for leg, stats in retriever.retrieval_stats()["legs"].items():
+            print(f"  {leg:<8} candidates {stats['mean_candidates']:>6}  took {stats['mean_took_ms']:>6} ms  errors {stats['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--synthetic", type=int, default=50000, help="number of synthetic chunks")
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.6, help="query vector noise")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--live", action="store_true", help="query the configured cluster instead")
+    parser.add_argument("--query", action="append", help="query text for --live (repeatable)")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+    _live(args) if args.live else _local(args)
+
+
+if __name__ == "__main__":
+    main()
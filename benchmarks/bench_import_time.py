@@ -0,0 +1,89 @@
+# bench_import_time.py
+"""
+Cold-start time of each entry point.
+
+Every measurement runs in a fresh interpreter: the import of the module
+behind an entry point (median of --repeats runs), whether it pulled in
+torch/transformers, and pytest collection of each test file. With
+--warm-up, the time `src.agents.executor.warm_up()` takes to load the
+configured models (what the API does in the background after startup) is
+reported too.
+
+For a per-module breakdown of one entry point, use
+`python -X importtime -c "import src.api"`.
+
+    python benchmarks/bench_import_time.py
+    python benchmarks/bench_import_time.py --repeats 5 --warm-up
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+ENTRY_POINTS = [
+    # label, module imported
+    ("config", "src.config"),
+    ("delete_index.py", "src.services.delete_index"),
+    ("indexer.py", "src.services.indexer"),
+    ("API app (uvicorn)", "src.api"),
+    ("main.py", "main"),
+]
+TEST_FILES = ["tests/test_api.py", "tests/test_services.py", "tests/test_agents.py"]
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, int("torch" in sys.modules), int("transformers" in sys.modules))
+"""
+
+
+def _python(code: str) -> str:
+    proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return proc.stdout.strip().splitlines()[-1]
+
+
+def _wall(cmd) -> float:
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=ROOT, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--warm-up", action="store_true", help="also time loading the models")
+    args = parser.parse_args()
+
+    print(f"{'entry point':<22} {'import s':>9} {'torch':>6} {'transformers':>13}")
+    for label, module in ENTRY_POINTS:
+        try:
+            runs = [_python(_PROBE.format(module=module)).split() for _ in range(args.repeats)]
+        except RuntimeError as e:
+            print(f"{label:<22} failed: {e}")
+            continue
+        seconds = statistics.median(float(r[0]) for r in runs)
+        torch_loaded, transformers_loaded = ("yes" if flag == "1" else "no" for flag in runs[-1][1:])
+        print(f"{label:<22} {seconds:>9.2f} {torch_loaded:>6} {transformers_loaded:>13}")
+
+    print(f"\n{'pytest collection':<22} {'wall s':>9}")
+    for test_file in TEST_FILES:
+        seconds = statistics.median(
+            _wall([sys.executable, "-m", "pytest", "--collect-only", "-q", "-p", "no:cacheprovider", test_file])
+            for _ in range(args.repeats)
+        )
+        print(f"{test_file:<22} {seconds:>9.2f}")
+
+    if args.warm_up:
+        code = "import json, src.agents.executor as e; print(json.dumps(e.warm_up()))"
+        print(f"\nwarm-up (model loading): {_python(code)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench_local_index.py
+"""
+Recall and latency of the local index's IVF search against exact search.
+
+Builds a LocalIndex in a temporary folder through the same `bulk()`/`save()`
+path the indexer uses, from either the vectors of an existing local index
+(--index-dir, e.g. after `RETRIEVAL_BACKEND=local python indexer.py`) or
+synthetic clustered vectors paired with chunk texts from documents/.
+Queries are stored vectors plus noise. Reported: build time (BM25 + IVF),
+exact search latency over the memory-mapped matrix, and for each nprobe
+the IVF latency and recall@k relative to exact search; then BM25 and full
+hybrid (`search_many`) latency.
+
+    python benchmarks/bench_local_index.py --synthetic 200000 --dims 384
+    python benchmarks/bench_local_index.py --index-dir local_index
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+
+import src.services.local_index as local_mod
+from src.agents.chunker import chunk_document
+from src.services.docs_loader import iter_documents
+
+
+def _synthetic(count: int, dims: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dims)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dims)).astype(np.float32)
+    return local_mod._normalize(vectors)
+
+
+def _texts(count: int) -> list:
+    chunks = []
+    for doc in iter_documents():
+        chunks.extend(chunk_document(doc["text"]))
+        if len(chunks) >= count:
+            break
+    # Cycle the corpus when asked for more chunks than it has
+    return [chunks[i % len(chunks)] for i in range(count)]
+
+
+def _median_ms(fn, repeats) -> float:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=None, help="take vectors and texts from this local index")
+    parser.add_argument("--synthetic", type=int, default=100000, help="number of synthetic vectors")
+    parser.add_argument("--dims", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = 2 * sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    if args.index_dir:
+        source = local_mod.LocalIndex(args.index_dir)
+        vectors = np.asarray(source.vectors, dtype=np.float32)
+        texts = [doc["text"] for doc in source.docs]
+    else:
+        vectors = _synthetic(args.synthetic, args.dims, args.clusters, rng)
+        texts = _texts(len(vectors))
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.dtype} storage")
+
+    local_mod.LOCAL_INDEX_ANN_MIN_DOCS = 1
+    local_mod.LOCAL_INDEX_NLIST = args.nlist
+    with tempfile.TemporaryDirectory() as tmp:
+        index = local_mod.LocalIndex(os.path.join(tmp, "index"), dtype=args.dtype)
+        index.create({"embedding_dims": int(vectors.shape[1])})
+        actions = (
+            {"_id": str(i), "_source": {"file_path": "bench", "section": "", "chunk_id": i, "text": t, "vector": v}}
+            for i, (t, v) in enumerate(zip(texts, vectors))
+        )
+        for _ in index.bulk(actions):
+            pass
+        start = time.perf_counter()
+        index.save()
+        print(f"build (BM25 + IVF with {index.meta['nlist']} lists): {time.perf_counter() - start:.1f}s\n")
+
+        picks = rng.choice(len(vectors), args.queries, replace=False)
+        queries = local_mod._normalize(vectors[picks] + 0.3 * rng.standard_normal((args.queries, vectors.shape[1])))
+        query_texts = [" ".join(texts[i].split()[:8]) for i in picks]
+
+        # Exact search over the same memory-mapped matrix, one query at a time
+        stored = np.asarray(index.vectors, dtype=np.float32)
+        exact = [set(local_mod._top(stored @ q, args.top_k).tolist()) for q in queries]
+        exact_ms = _median_ms(lambda: local_mod._top(np.asarray(index.vectors, dtype=np.float32) @ queries[0], args.top_k), 5)
+
+        print(f"{'search':<14} {'ms/query':>9} {f'recall@{args.top_k}':>10}")
+        print(f"{'exact':<14} {exact_ms:>9.2f} {1:>10.1%}")
+        for nprobe in args.nprobe:
+            found = index.knn(queries, args.top_k, nprobe=nprobe)
+            recall = statistics.mean(len(set(rows.tolist()) & truth) / args.top_k for (rows, _), truth in zip(found, exact))
+            ms = _median_ms(lambda: index.knn(queries[:1], args.top_k, nprobe=nprobe), 20)
+            print(f"{f'ivf nprobe={nprobe}':<14} {ms:>9.2f} {recall:>10.1%}")
+
+        bm25_ms = statistics.mean(_median_ms(lambda: index.bm25.scores(q), 3) for q in query_texts[:20])
+        hybrid_ms = _median_ms(lambda: index.search_many(query_texts[:1], queries[:1], args.top_k), 20)
+        print(f"{'bm25':<14} {bm25_ms:>9.2f}")
+        print(f"{'hybrid':<14} {hybrid_ms:>9.2f}   (nprobe={local_mod.LOCAL_INDEX_NPROBE}, as configured)")
+
+
+if __name__ == "__main__":
+    main()
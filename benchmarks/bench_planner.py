@@ -0,0 +1,85 @@
+# bench_planner.py
+"""
+Planner latency and retrieval fan-out per PLANNER_MODE.
+
+Runs a mixed set of simple and multi-part questions (or --queries-file,
+one per line) through `planner.plan` twice per mode: a cold pass with an
+empty plan cache and a warm pass that repeats each query with different
+case and spacing. Reported per mode: ms/query of both passes, the share
+of queries that took the fast path, and the mean number of subqueries
+(each subquery is one retrieval).
+
+The model comes from the shared registry (MODEL_NAME), or from --model
+for a quick run against a small local checkpoint.
+
+    python benchmarks/bench_planner.py
+    python benchmarks/bench_planner.py --model /path/to/small-llama --max-new-tokens 32
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import src.agents.planner as planner
+
+QUERIES = [
+    "What is a biofilm?",
+    "Define quorum sensing.",
+    "biofilm antibiotic tolerance mechanisms",
+    "Which bacteria form biofilms on catheters?",
+    "What is the role of extracellular polymeric substances in biofilm formation?",
+    "How do persister cells survive antibiotic treatment?",
+    "How do antibiotics affect biofilms and how does resistance occur?",
+    "Compare biofilm formation in Pseudomonas aeruginosa and Staphylococcus aureus.",
+    "What are the advantages and disadvantages of phage therapy against biofilms?",
+    "Why are biofilm infections hard to treat, and which new therapies target the matrix?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries-file", default=None)
+    parser.add_argument("--modes", nargs="+", default=["llm", "auto"], choices=planner.PLANNER_MODES)
+    parser.add_argument("--model", default=None, help="load this checkpoint instead of the shared registry model")
+    parser.add_argument("--max-new-tokens", type=int, default=planner.PLANNER_MAX_NEW_TOKENS)
+    args = parser.parse_args()
+
+    queries = QUERIES
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    planner.PLANNER_MAX_NEW_TOKENS = args.max_new_tokens
+    if args.model:
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        planner._tokenizer = AutoTokenizer.from_pretrained(args.model)
+        planner._model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+    planner._lazy_load()
+    # Warm up generate (and the prompt prefix cache) outside the timings
+    planner.PLANNER_MODE = "llm"
+    planner.plan("warm up question and how does it work?")
+
+    complex_share = statistics.mean(planner.is_complex(q) for q in queries)
+    print(f"{len(queries)} queries, {complex_share:.0%} classified complex, max_new_tokens={args.max_new_tokens}\n")
+    print(f"{'mode':<6} {'cold ms/q':>10} {'warm ms/q':>10} {'fast path':>10} {'subqueries':>11}")
+    for mode in args.modes:
+        planner.PLANNER_MODE = mode
+        planner._plan_cache.clear()
+        before = dict(planner._stats)
+        start = time.perf_counter()
+        plans = [planner.plan(q) for q in queries]
+        cold = (time.perf_counter() - start) / len(queries) * 1e3
+        start = time.perf_counter()
+        for q in queries:
+            planner.plan("  " + q.upper() + " ")
+        warm = (time.perf_counter() - start) / len(queries) * 1e3
+        fast = (planner._stats["fast_path"] - before["fast_path"]) / (2 * len(queries))
+        fan_out = statistics.mean(len(p) for p in plans)
+        print(f"{mode:<6} {cold:>10.1f} {warm:>10.1f} {fast:>10.0%} {fan_out:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# bench_prefix_cache.py
+"""
+Time-to-first-token of the planner and reasoner prompts with and without
+the prompt-prefix key/value cache.
+
+TTFT is measured as a `generate(max_new_tokens=1)` call, i.e. the prefill
+of the prompt plus one decoding step. The reasoner prompt gets context
+from the documents/ corpus of roughly --context-tokens tokens; the gain
+shrinks as the per-request suffix grows relative to the shared prefix.
+
+    python benchmarks/bench_prefix_cache.py --context-tokens 0 500 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from src.config import MODEL_NAME
+from src.agents.batcher import encode_left_padded
+from src.agents.planner import PLAN_PROMPT, PLAN_PREFIX
+from src.agents.prefix_cache import PrefixCache
+from src.agents.reasoner import PROMPT_PREFIX, _build_prompt
+from src.services.docs_loader import iter_documents
+
+QUERY = "How do antibiotics affect biofilms and how does resistance occur?"
+
+
+def _context(tokenizer, tokens: int) -> list:
+    blocks, used = [], 0
+    for doc in iter_documents():
+        if used >= tokens:
+            break
+        ids = tokenizer(doc["text"], add_special_tokens=False)["input_ids"][: tokens - used]
+        blocks.append(tokenizer.decode(ids))
+        used += len(ids)
+    return blocks
+
+
+def _ttft(model, make_inputs, repeats: int) -> float:
+    times = []
+    for _ in range(repeats + 1):
+        inputs = make_inputs()
+        start = time.perf_counter()
+        with torch.no_grad():
+            model.generate(**inputs, max_new_tokens=1, do_sample=False, pad_token_id=model.config.eos_token_id)
+        times.append(time.perf_counter() - start)
+    # First run is a warm-up
+    return statistics.median(times[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_NAME, help="model name or path")
+    parser.add_argument("--context-tokens", type=int, nargs="+", default=[0, 500, 2000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model = AutoModelForCausalLM.from_pretrained(
+        args.model, torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+    ).eval()
+    if torch.cuda.is_available():
+        model.to("cuda")
+
+    cases = [("planner", PLAN_PREFIX, PLAN_PROMPT.format(query=QUERY))]
+    for tokens in args.context_tokens:
+        cases.append((f"reasoner +{tokens} ctx", PROMPT_PREFIX, _build_prompt(QUERY, _context(tokenizer, tokens))))
+
+    print(f"{'prompt':<20} {'tokens':>7} {'prefix':>7} {'full ms':>9} {'cached ms':>10} {'speedup':>8}")
+    for name, prefix, prompt in cases:
+        cache = PrefixCache(model, tokenizer, prefix)
+        full = _ttft(model, lambda: encode_left_padded(tokenizer, [prompt], model.device), args.repeats)
+        cached = _ttft(model, lambda: cache.build_inputs([prompt[len(prefix):]]), args.repeats)
+        total = len(tokenizer(prompt)["input_ids"])
+        print(
+            f"{name:<20} {total:>7} {len(cache.prefix_ids):>7} {full * 1e3:>9.1f} "
+            f"{cached * 1e3:>10.1f} {full / cached:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
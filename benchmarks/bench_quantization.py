@@ -0,0 +1,156 @@
+# bench_quantization.py
+"""
+Accuracy, latency and memory of int8 dynamic quantization vs. float32 on CPU.
+
+The model is loaded in float32, measured, then quantized with the same
+`quantize_int8` the registry uses (QUANTIZATION_MODE=int8) and measured
+again. Reported per mode:
+
+- embedding latency for --chunks corpus chunks (batches of --batch-size),
+  and for int8 the cosine agreement with the float32 vectors plus the
+  overlap of each query's top-k chunks;
+- greedy answer latency for the benchmark questions, and for int8 the share
+  of answers identical to float32 and the token agreement of the rest;
+- weight footprint and process RSS.
+
+    python benchmarks/bench_quantization.py --chunks 256 --new-tokens 64
+"""
+import argparse
+import gc
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import psutil
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from src.config import MODEL_NAME
+from src.agents.chunker import chunk_document
+from src.agents.model_registry import _footprint_bytes, quantize_int8
+from src.agents.reasoner import _build_prompt
+from src.services.docs_loader import iter_documents
+
+QUERIES = [
+    "How do antibiotics affect biofilms?",
+    "What mechanisms lead to antimicrobial resistance?",
+    "Which factors influence bacterial growth rates?",
+    "How is gene expression regulated in bacteria?",
+]
+
+
+def _chunks(count: int) -> list:
+    chunks = []
+    for doc in iter_documents():
+        chunks.extend(chunk_document(doc["text"]))
+        if len(chunks) >= count:
+            break
+    return chunks[:count]
+
+
+def _embed(model, tokenizer, texts: list, batch_size: int):
+    vectors, start = [], time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        enc = tokenizer(texts[i:i + batch_size], padding=True, truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            hidden = model.base_model(input_ids=enc.input_ids, attention_mask=enc.attention_mask).last_hidden_state
+        mask = enc.attention_mask.unsqueeze(-1)
+        vectors.append((hidden * mask).sum(1) / mask.sum(1))
+    return torch.cat(vectors), time.perf_counter() - start
+
+
+def _answers(model, tokenizer, prompts: list, new_tokens: int):
+    outputs, times = [], []
+    for prompt in prompts:
+        enc = tokenizer(prompt, return_tensors="pt", return_token_type_ids=False)
+        start = time.perf_counter()
+        with torch.no_grad():
+            out = model.generate(
+                **enc, max_new_tokens=new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id
+            )
+        times.append(time.perf_counter() - start)
+        outputs.append(out[0, enc.input_ids.shape[1]:].tolist())
+    return outputs, statistics.median(times)
+
+
+def _measure(name, model, tokenizer, chunks, prompts, args):
+    chunk_vectors, embed_seconds = _embed(model, tokenizer, chunks, args.batch_size)
+    query_vectors, _ = _embed(model, tokenizer, QUERIES, args.batch_size)
+    answers, answer_seconds = _answers(model, tokenizer, prompts, args.new_tokens)
+    gc.collect()
+    return {
+        "name": name,
+        "chunks": chunk_vectors,
+        "queries": query_vectors,
+        "answers": answers,
+        "embed_ms": embed_seconds / len(chunks) * 1e3,
+        "answer_s": answer_seconds,
+        "footprint_mb": _footprint_bytes(model) / 2**20,
+        "rss_mb": psutil.Process().memory_info().rss / 2**20,
+    }
+
+
+def _top_k(queries, chunks, k):
+    scores = torch.nn.functional.normalize(queries, dim=-1) @ torch.nn.functional.normalize(chunks, dim=-1).T
+    return [set(row.tolist()) for row in scores.topk(min(k, chunks.shape[0]), dim=-1).indices]
+
+
+def _token_agreement(a: list, b: list) -> float:
+    same = sum(x == y for x, y in zip(a, b))
+    return same / max(len(a), len(b), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=MODEL_NAME, help="model name or path")
+    parser.add_argument("--chunks", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    chunks = _chunks(args.chunks)
+    prompts = [_build_prompt(q, chunks[i * 2:i * 2 + 2]) for i, q in enumerate(QUERIES)]
+
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=torch.float32, low_cpu_mem_usage=True).eval()
+    baseline = _measure("float32", model, tokenizer, chunks, prompts, args)
+    model = quantize_int8(model)
+    gc.collect()
+    quantized = _measure("int8", model, tokenizer, chunks, prompts, args)
+
+    print(f"{len(chunks)} chunks, {len(prompts)} prompts, {args.new_tokens} new tokens, {torch.get_num_threads()} threads\n")
+    print(f"{'mode':<8} {'embed ms/chunk':>14} {'answer s':>9} {'weights MB':>11} {'RSS MB':>8}")
+    for r in (baseline, quantized):
+        print(f"{r['name']:<8} {r['embed_ms']:>14.2f} {r['answer_s']:>9.2f} {r['footprint_mb']:>11.0f} {r['rss_mb']:>8.0f}")
+
+    cosine = torch.nn.functional.cosine_similarity(baseline["chunks"], quantized["chunks"], dim=-1)
+    overlap = [
+        len(a & b) / len(a)
+        for a, b in zip(_top_k(baseline["queries"], baseline["chunks"], args.top_k),
+                        _top_k(quantized["queries"], quantized["chunks"], args.top_k))
+    ]
+    exact = sum(a == b for a, b in zip(baseline["answers"], quantized["answers"]))
+    agreement = [_token_agreement(a, b) for a, b in zip(baseline["answers"], quantized["answers"])]
+    print(
+        f"\nembedding cosine (int8 vs float32): mean {cosine.mean():.4f}, min {cosine.min():.4f}"
+        f"\ntop-{args.top_k} neighbour overlap: {statistics.mean(overlap):.1%}"
+        f"\nidentical answers: {exact}/{len(prompts)}, mean token agreement {statistics.mean(agreement):.1%}"
+        f"\nspeedup: embed {baseline['embed_ms'] / quantized['embed_ms']:.2f}x, "
+        f"answer {baseline['answer_s'] / quantized['answer_s']:.2f}x"
+    )
+    # RSS rarely drops after freeing the float32 weights (allocator keeps the
+    # pages); start the server with QUANTIZATION_MODE=int8 for the real figure
+    print("note: int8 RSS is measured after quantizing in-process and overstates a fresh int8 load")
+
+
+if __name__ == "__main__":
+    main()
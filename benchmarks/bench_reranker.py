@@ -0,0 +1,100 @@
+# bench_reranker.py
+"""
+Latency of the cross-encoder rerank stage and how often a budget holds.
+
+Builds candidate lists from chunk texts in documents/ (--queries queries x
+--candidates hits, each query a few words of one of its candidates), then
+times `reranker.rerank_many` for each --batch-size without a budget, and
+reports the fallback rate for each --budget-ms over --repeats calls. Also
+reports how often the chunk the query came from ends up in the top k
+after reranking versus at its original (shuffled) position.
+
+    python benchmarks/bench_reranker.py --model cross-encoder/ms-marco-MiniLM-L-6-v2
+    python benchmarks/bench_reranker.py --queries 4 --candidates 20 --budget-ms 100 200 400
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import src.agents.reranker as reranker
+from src.agents.chunker import chunk_document
+from src.config import RERANK_MODEL
+from src.services.docs_loader import iter_documents
+
+
+def _candidates(queries: int, candidates: int, top_k: int, rng):
+    chunks = []
+    for doc in iter_documents():
+        chunks.extend(chunk_document(doc["text"]))
+        if len(chunks) >= queries * candidates:
+            break
+    query_texts, hit_lists = [], []
+    for _ in range(queries):
+        texts = rng.sample(chunks, min(candidates, len(chunks)))
+        words = texts[0].split()
+        start = rng.randrange(max(1, len(words) - 8))
+        query_texts.append(" ".join(words[start:start + 8]))
+        hits = [{"chunk_id": i, "text": t, "score": 0.0} for i, t in enumerate(texts)]
+        # The source chunk starts outside the top k, as a weak first stage might leave it
+        hits.insert(top_k, hits.pop(0))
+        hit_lists.append(hits)
+    return query_texts, hit_lists
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=RERANK_MODEL)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--queries", type=int, default=3, help="subqueries per retrieve_many call")
+    parser.add_argument("--candidates", type=int, default=20, help="hits per query before reranking")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[8, 16, 32, 64])
+    parser.add_argument("--max-length", type=int, default=256)
+    parser.add_argument("--budget-ms", type=float, nargs="+", default=[100, 200, 300, 500])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    reranker.RERANK_MODEL, reranker.RERANK_DEVICE, reranker.RERANK_MAX_LENGTH = args.model, args.device, args.max_length
+    start = time.perf_counter()
+    reranker._lazy_load()
+    print(f"{args.model} on {args.device}: loaded in {time.perf_counter() - start:.1f}s")
+
+    query_texts, hit_lists = _candidates(args.queries, args.candidates, args.top_k, random.Random(args.seed))
+    pairs = sum(len(hits) for hits in hit_lists)
+    print(f"{args.queries} queries x {args.candidates} candidates = {pairs} pairs per call\n")
+    reranker.rerank_many(query_texts, hit_lists, args.top_k, budget_ms=0)  # warm up
+
+    print(f"{'batch':>5} {'ms/call':>8} {'pairs/s':>8}")
+    best = None
+    for batch_size in args.batch_size:
+        reranker.RERANK_BATCH_SIZE = batch_size
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            reranked = reranker.rerank_many(query_texts, hit_lists, args.top_k, budget_ms=0)
+            times.append(time.perf_counter() - start)
+        ms = statistics.median(times) * 1e3
+        best = min(best or (ms, batch_size), (ms, batch_size))
+        print(f"{batch_size:>5} {ms:>8.1f} {pairs / ms * 1e3:>8.0f}")
+
+    found = statistics.mean(any(h["chunk_id"] == 0 for h in hits) for hits in reranked)
+    print(f"\nsource chunk in top {args.top_k}: {found:.0%} after reranking, 0% in first-stage order")
+
+    reranker.RERANK_BATCH_SIZE = best[1]
+    print(f"\nbudgets with batch size {best[1]}:")
+    for budget in args.budget_ms:
+        before = reranker.reranker_stats()["fallbacks"]
+        for _ in range(args.repeats):
+            reranker.rerank_many(query_texts, hit_lists, args.top_k, budget_ms=budget)
+        fallbacks = reranker.reranker_stats()["fallbacks"] - before
+        print(f"  {budget:>6.0f} ms: {fallbacks / args.repeats:.0%} fall back to search order")
+
+
+if __name__ == "__main__":
+    main()
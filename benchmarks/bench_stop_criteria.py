@@ -0,0 +1,90 @@
+# bench_stop_criteria.py
+"""
+Micro-benchmark for the reasoner's stop criteria.
+
+Compares the per-token overhead of the previous criteria (StopOnQuestion +
+StopOnCue, each decoding the full prompt + generation on every step) with
+StopOnSequences (one pass over a short decoded tail of new tokens).
+
+    python benchmarks/bench_stop_criteria.py --prompt-tokens 3000 --new-tokens 256
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import torch
+from transformers import AutoTokenizer
+from transformers.generation.stopping_criteria import StoppingCriteria, StoppingCriteriaList
+
+from src.config import DOCS_FOLDER, MODEL_NAME
+from src.agents.reasoner import STOP_CUES, StopOnSequences
+
+
+class LegacyStopOnQuestion(StoppingCriteria):
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+    def __call__(self, input_ids, scores, **kwargs):
+        text = self.tokenizer.decode(input_ids[0], skip_special_tokens=True)
+        return text.endswith("Question:")
+
+
+class LegacyStopOnCue(StoppingCriteria):
+    def __init__(self, tokenizer, cues):
+        self.tokenizer = tokenizer
+        self.cues = cues
+    def __call__(self, input_ids, scores, **kwargs):
+        text = self.tokenizer.decode(input_ids[0], skip_special_tokens=True)
+        return any(text.endswith(cue) for cue in self.cues)
+
+
+def _corpus_ids(tokenizer, needed: int) -> list:
+    """
+    Token ids from the bundled documents, enough for prompt + generation.
+    """
+    ids = []
+    for root, _, files in os.walk(DOCS_FOLDER):
+        for name in sorted(files):
+            if name.endswith(".txt"):
+                with open(os.path.join(root, name), encoding="utf-8") as f:
+                    ids.extend(tokenizer(f.read(), add_special_tokens=False)["input_ids"])
+                if len(ids) >= needed:
+                    return ids[:needed]
+    raise SystemExit(f"Corpus only has {len(ids)} tokens, need {needed}.")
+
+
+def _per_token_seconds(criteria, ids: torch.Tensor, prompt_length: int) -> float:
+    """
+    Call the criteria once per simulated generation step; return mean seconds.
+    """
+    steps = ids.shape[1] - prompt_length
+    start = time.perf_counter()
+    for end in range(prompt_length + 1, ids.shape[1] + 1):
+        criteria(ids[:, :end], None)
+    return (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokenizer", default=MODEL_NAME, help="tokenizer name or path")
+    parser.add_argument("--prompt-tokens", type=int, nargs="+", default=[500, 1500, 3000])
+    parser.add_argument("--new-tokens", type=int, default=256)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    all_ids = _corpus_ids(tokenizer, max(args.prompt_tokens) + args.new_tokens)
+
+    print(f"{'prompt':>8} {'legacy us/token':>16} {'incremental us/token':>21} {'speedup':>8}")
+    for prompt_length in args.prompt_tokens:
+        ids = torch.tensor([all_ids[:prompt_length + args.new_tokens]])
+        legacy = StoppingCriteriaList([LegacyStopOnQuestion(tokenizer), LegacyStopOnCue(tokenizer, STOP_CUES[1:])])
+        incremental = StoppingCriteriaList([StopOnSequences(tokenizer, STOP_CUES, prompt_length)])
+        t_legacy = _per_token_seconds(legacy, ids, prompt_length)
+        t_incremental = _per_token_seconds(incremental, ids, prompt_length)
+        print(f"{prompt_length:>8} {t_legacy * 1e6:>16.1f} {t_incremental * 1e6:>21.1f} {t_legacy / t_incremental:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,27 +33,66 @@ function App() {
 
    // TODO: change url
 
-    await fetch("http://127.0.0.1:8000/generate-response", 
-    {
-      method: "POST",
-      headers: {
-        "Content-Type": "application/json"
-      },
-      body: JSON.stringify({"query": chatMessages?.message}) // send data from frontend
-    }).then((data) => {
-      return data.json();
-    }).then((data) => {
-      console.log('final',data);   // TODO : you can see what data is coming from backend
-      setMessages([...messages,  {
-        message: data.question,
-        direction: 'outgoing',
-        sender: "user"
-      }, {
-        message: data?.response, 
-        sender: "Bot"
-      }]);
+    // Stream the answer over Server-Sent Events and render it as it arrives
+    const history = [...messages, {
+      message: chatMessages?.message,
+      direction: 'outgoing',
+      sender: "user"
+    }];
+    const showBotMessage = (text) => setMessages([...history, { message: text, sender: "Bot" }]);
+
+    try {
+      const response = await fetch("http://127.0.0.1:8000/generate-response/stream",
+      {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json"
+        },
+        body: JSON.stringify({"query": chatMessages?.message}) // send data from frontend
+      });
+      if (!response.ok) {
+        const data = await response.json();
+        showBotMessage(data?.detail || "Something went wrong, please try again.");
+        return;
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let answer = "";
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        // SSE frames are separated by a blank line
+        const frames = buffer.split("\n\n");
+        buffer = frames.pop();
+        for (const frame of frames) {
+          let event = "message";
+          let data = "";
+          for (const line of frame.split("\n")) {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+          }
+          if (!data) continue;
+          const payload = JSON.parse(data);
+          if (event === "done") {
+            console.log('final', payload);   // TODO : you can see what data is coming from backend
+            answer = payload.response;
+          } else if (event === "error") {
+            answer = payload.detail;
+          } else {
+            answer += payload.token;
+            setIsTyping(false);
+          }
+          showBotMessage(answer);
+        }
+      }
+    } catch (err) {
+      showBotMessage("Could not reach the server.");
+    } finally {
       setIsTyping(false);
-    });
+    }
   }
   console.log('output', messages)
 
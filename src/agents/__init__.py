@@ -1,15 +1,37 @@
 # src/agents/__init__.py
+"""
+Agents of the RAG pipeline.
 
-from .chunker import chunk_text
-from .embedder import embed_texts
-from .planner import plan
-from .reasoner import reason
-from .executor import execute
-
-__all__ = [
-    "chunk_text",
-    "embed_texts",
-    "plan",
-    "reason",
-    "execute",
-]
+Names are imported from their submodules on first access (PEP 562), so
+`import src.agents` (or any `src.agents.<module>`) stays cheap and free of
+torch/transformers until a model-backed function is actually used.
+"""
+
+from importlib import import_module
+
+# public name -> submodule that defines it
+_EXPORTS = {
+    "chunk_text": ".chunker",
+    "chunk_text_by_tokens": ".chunker",
+    "chunk_document": ".chunker",
+    "embed_texts": ".embedder",
+    "plan": ".planner",
+    "reason": ".reasoner",
+    "execute": ".executor",
+    "execute_stream": ".executor",
+    "warm_up": ".executor",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,135 @@
+# answer_cache.py
+"""
+Semantic cache of final answers, keyed on the query embedding.
+
+A query whose embedding has cosine similarity above a threshold with a
+recently answered one gets the stored answer back without planning,
+retrieval or generation. Entries expire after a TTL and are dropped
+whenever the document index is rebuilt: the indexer touches a shared
+generation file (see `mark_index_rebuilt`), which works across the
+indexer and API processes.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def mark_index_rebuilt(generation_file: str) -> None:
+    """
+    Record that the index changed so every AnswerCache watching
+    `generation_file` drops its entries on the next lookup.
+    """
+    with open(generation_file, "w", encoding="utf-8") as f:
+        f.write(f"{time.time()}\n")
+
+
+class AnswerCache:
+    """
+    Thread-safe, size-bounded store of (query vector, answer) pairs.
+
+    :param threshold: Minimum cosine similarity for a hit.
+    :param ttl: Seconds an answer stays valid.
+    :param max_entries: Oldest entries are dropped beyond this.
+    :param generation_file: File touched by the indexer on rebuilds.
+    """
+
+    def __init__(self, threshold: float, ttl: float, max_entries: int, generation_file: Optional[str] = None):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive.")
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation_file = generation_file
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None   # unit-normalized rows
+        self._answers: List[str] = []
+        self._created: List[float] = []
+        self._generation = self._read_generation()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "invalidations": 0}
+
+    def _read_generation(self) -> Optional[float]:
+        if not self.generation_file:
+            return None
+        try:
+            return os.stat(self.generation_file).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _clear(self) -> None:
+        self._vectors = None
+        self._answers, self._created = [], []
+
+    def _drop(self, keep: np.ndarray) -> None:
+        self._vectors = self._vectors[keep] if keep.any() else None
+        idx = np.flatnonzero(keep)
+        self._answers = [self._answers[i] for i in idx]
+        self._created = [self._created[i] for i in idx]
+
+    def _refresh(self) -> None:
+        # Index rebuilt (possibly by another process): everything is stale
+        generation = self._read_generation()
+        if generation != self._generation:
+            self._generation = generation
+            if self._answers:
+                self._stats["invalidations"] += 1
+            self._clear()
+            return
+        # Expire old answers
+        if self._answers:
+            now = time.time()
+            keep = np.array([now - t < self.ttl for t in self._created])
+            if not keep.all():
+                self._stats["expired"] += int((~keep).sum())
+                self._drop(keep)
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, vector) -> Optional[str]:
+        """
+        Return the cached answer for the most similar query above threshold.
+        """
+        with self._lock:
+            self._refresh()
+            if self._vectors is not None:
+                sims = self._vectors @ self._unit(vector)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._stats["hits"] += 1
+                    return self._answers[best]
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, vector, answer: str) -> None:
+        with self._lock:
+            self._refresh()
+            row = self._unit(vector)[None, :]
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._answers.append(answer)
+            self._created.append(time.time())
+            if len(self._answers) > self.max_entries:
+                keep = np.ones(len(self._answers), dtype=bool)
+                keep[: len(self._answers) - self.max_entries] = False
+                self._drop(keep)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            if self._answers:
+                self._stats["invalidations"] += 1
+            self._clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._answers),
+            }
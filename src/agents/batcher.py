@@ -0,0 +1,181 @@
+# batcher.py
+"""
+Cross-request dynamic batching for model calls.
+
+Callers on different threads submit single items; a background thread
+collects the items that arrive within a short window (or until the batch
+is full), runs them through one batched function call — e.g. one padded
+`generate` — and hands each caller its own result. Under concurrent load
+this turns N prefill passes of batch size 1 into a few larger ones.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config import GENERATION_MAX_BATCH, GENERATION_MAX_WAIT_MS
+from src.logger import logger
+
+# Latency samples kept for the percentiles in `stats()`
+_SAMPLES = 1000
+
+
+class _Request:
+    __slots__ = ("item", "done", "result", "error", "enqueued", "started")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.enqueued = time.perf_counter()
+        self.started = 0.0
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return round(sorted_values[index] * 1000, 1)
+
+
+class DynamicBatcher:
+    """
+    Group concurrent single-item calls into batched calls of `run_batch`.
+
+    :param name: Used in logs and stats.
+    :param run_batch: Takes a list of items, returns one result per item.
+    :param max_batch_size: Largest batch handed to `run_batch`.
+    :param max_wait: Seconds the first item of a batch waits for company.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int, max_wait: float):
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive.")
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._latencies: deque = deque(maxlen=_SAMPLES)
+        self._waits: deque = deque(maxlen=_SAMPLES)
+        self._stats = {"requests": 0, "batches": 0, "failed_batches": 0, "max_batch": 0}
+
+    def submit(self, item: Any) -> Any:
+        """
+        Run `item` as part of the next batch and return its result (blocking).
+        """
+        request = _Request(item)
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name=f"batcher-{self.name}", daemon=True)
+                self._worker.start()
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self) -> List[_Request]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for request in batch:
+                request.started = started
+            try:
+                results = self.run_batch([r.item for r in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: batch of {len(batch)} returned {len(results)} results")
+                for request, result in zip(batch, results):
+                    request.result = result
+                failed = False
+            except Exception as e:
+                logger.error(f"Batched {self.name} call of size {len(batch)} failed: {e}")
+                for request in batch:
+                    request.error = e
+                failed = True
+            finished = time.perf_counter()
+            with self._lock:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["failed_batches"] += failed
+                self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+                for request in batch:
+                    self._waits.append(request.started - request.enqueued)
+                    self._latencies.append(finished - request.enqueued)
+            for request in batch:
+                request.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters, mean batch size and latency percentiles (ms) of recent requests.
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            latencies = sorted(self._latencies)
+            waits = sorted(self._waits)
+        stats["mean_batch"] = round(stats["requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000
+        stats["latency_ms"] = {f"p{int(q * 100)}": _percentile(latencies, q) for q in (0.5, 0.95, 0.99)}
+        stats["queue_wait_ms"] = {f"p{int(q * 100)}": _percentile(waits, q) for q in (0.5, 0.95, 0.99)}
+        return stats
+
+
+def encode_left_padded(tokenizer, prompts: List[str], device, **kwargs) -> Dict[str, Any]:
+    """
+    Tokenize prompts into one `generate` batch, padded on the left so every
+    row's new tokens start at the same position.
+    """
+    import torch
+
+    rows = tokenizer(prompts, **kwargs)["input_ids"]
+    width = max(len(r) for r in rows)
+    pad = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    input_ids = torch.tensor([[pad] * (width - len(r)) + list(r) for r in rows])
+    attention_mask = torch.tensor([[0] * (width - len(r)) + [1] * len(r) for r in rows])
+    return {"input_ids": input_ids.to(device), "attention_mask": attention_mask.to(device)}
+
+
+# One batcher per model call, created on first use
+_batchers: Dict[str, DynamicBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(name: str, run_batch: Callable[[List[Any]], List[Any]]) -> Optional[DynamicBatcher]:
+    """
+    Return the shared batcher for `name`, or None when batching is disabled
+    (GENERATION_MAX_BATCH <= 1).
+    """
+    if GENERATION_MAX_BATCH <= 1:
+        return None
+    with _batchers_lock:
+        if name not in _batchers:
+            _batchers[name] = DynamicBatcher(name, run_batch, GENERATION_MAX_BATCH, GENERATION_MAX_WAIT_MS / 1000)
+        return _batchers[name]
+
+
+def batcher_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Stats of every batcher created so far, keyed by name.
+    """
+    with _batchers_lock:
+        batchers = dict(_batchers)
+    return {name: b.stats() for name, b in batchers.items()}
@@ -1,7 +1,14 @@
 # chunker.py
 
+import re
+from bisect import bisect_left
 from typing import List
-from src.config import CHUNK_SIZE, CHUNK_OVERLAP
+from src.config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_MODE, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# A new sentence starts after ., ! or ? (plus closing quotes/brackets) and
+# whitespace; a new paragraph after a blank line
+_BOUNDARY = re.compile(r"\n\s*\n|(?<=[.!?])[\"')\]]*\s+")
+
 
 def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
     """
@@ -30,6 +37,102 @@ def chunk_text(text: str, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP)
 
     return chunks
 
+
+def chunk_text_by_tokens(
+    text: str,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    tokenizer=None,
+) -> List[str]:
+    """
+    Splits text into chunks of at most `max_tokens` model tokens that end on
+    sentence or paragraph boundaries.
+
+    The text is tokenized once and sentence boundaries are found with one
+    regex pass; chunk extents are then computed on character offsets, and
+    each chunk is sliced from the text exactly once. Consecutive chunks share
+    whole sentences worth up to `overlap_tokens` tokens. A single sentence
+    longer than `max_tokens` is split at token boundaries.
+
+    :param tokenizer: A fast (offset-mapping) tokenizer; defaults to the
+        model's, which is a per-thread copy (so chunker workers can run next
+        to the embedder). An explicit tokenizer must not be shared with
+        threads that call it with other truncation/padding settings.
+    :return: List of text chunks.
+    """
+    if max_tokens <= 0:
+        raise ValueError("Chunk size must be positive.")
+    if overlap_tokens < 0 or overlap_tokens >= max_tokens:
+        raise ValueError("Overlap must be non-negative and less than chunk size.")
+    if tokenizer is None:
+        from src.agents.model_registry import get_tokenizer
+
+        tokenizer = get_tokenizer()
+    if not getattr(tokenizer, "is_fast", False):
+        raise ValueError("Token-aware chunking needs a fast tokenizer (offset mapping).")
+
+    offsets = tokenizer(
+        text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+    )["offset_mapping"]
+    if not offsets:
+        return []
+    token_starts = [start for start, _ in offsets]
+
+    # Sentence/paragraph segments as char offsets and first-token indices
+    seg_chars = [0] + [m.end() for m in _BOUNDARY.finditer(text) if 0 < m.end() < len(text)]
+    seg_tokens = [bisect_left(token_starts, c) for c in seg_chars] + [len(offsets)]
+    seg_chars.append(len(text))
+    segments = len(seg_chars) - 1
+
+    chunks: List[str] = []
+
+    def emit(start_char: int, end_char: int) -> None:
+        chunk = text[start_char:end_char].strip()
+        if chunk:
+            chunks.append(chunk)
+
+    i = 0
+    while i < segments:
+        # Grow the chunk sentence by sentence while it fits the budget
+        j = i + 1
+        while j < segments and seg_tokens[j + 1] - seg_tokens[i] <= max_tokens:
+            j += 1
+        if seg_tokens[j] - seg_tokens[i] > max_tokens:
+            # One sentence over budget: fall back to token windows inside it
+            first, last = seg_tokens[i], seg_tokens[j]
+            step = max_tokens - overlap_tokens
+            for a in range(first, last, step):
+                b = min(a + max_tokens, last)
+                emit(offsets[a][0], offsets[b - 1][1])
+                if b == last:
+                    break
+        else:
+            emit(seg_chars[i], seg_chars[j])
+        if j == segments:
+            break
+        # Start the next chunk with trailing sentences that fit the overlap,
+        # leaving room for at least the next new sentence
+        k = j
+        while (
+            k - 1 > i
+            and seg_tokens[j] - seg_tokens[k - 1] <= overlap_tokens
+            and seg_tokens[j + 1] - seg_tokens[k - 1] <= max_tokens
+        ):
+            k -= 1
+        i = k
+
+    return chunks
+
+
+def chunk_document(text: str) -> List[str]:
+    """
+    Chunk a document section with the configured CHUNK_MODE
+    ("chars": fixed character windows, "tokens": sentence-aligned token budget).
+    """
+    if CHUNK_MODE == "tokens":
+        return chunk_text_by_tokens(text)
+    return chunk_text(text)
+
 # if __name__ == "__main__":
 #     # Quick test
 #     sample = "Lorem ipsum dolor sit amet, consectetur adipiscing elit." * 10
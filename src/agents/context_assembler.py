@@ -0,0 +1,125 @@
+# context_assembler.py
+"""
+Turn the hits of several subqueries into a bounded list of context blocks.
+
+Subqueries often retrieve the same chunk, and neighbouring chunks of one
+section overlap by construction. The assembler drops duplicates, stitches
+adjacent chunks back together without repeating their overlap, ranks the
+blocks by retrieval score and keeps the best ones that fit a token budget,
+so the prompt (and the prefill time of `reason`) has a predictable size.
+"""
+
+from typing import Any, Dict, Iterable, List, Tuple
+
+from src.config import CONTEXT_MAX_TOKENS
+from src.logger import logger
+
+# Separator `reason` puts between context blocks
+SEPARATOR = "\n---\n"
+
+# Overlap searched for when stitching adjacent chunks (characters); shorter
+# matches are treated as coincidence
+_MIN_OVERLAP_CHARS = 16
+_MAX_OVERLAP_CHARS = 2000
+
+
+def _stitch(left: str, right: str) -> str:
+    """
+    Join two consecutive chunks, dropping the text they share.
+    """
+    for size in range(min(len(left), len(right), _MAX_OVERLAP_CHARS), _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + " " + right
+
+
+def _dedupe(hit_lists: Iterable[List[Dict[str, Any]]]) -> Dict[Tuple, Dict[str, Any]]:
+    """
+    One entry per (file_path, section, chunk_id), keeping the best score.
+    """
+    unique: Dict[Tuple, Dict[str, Any]] = {}
+    for hits in hit_lists:
+        for hit in hits:
+            key = (hit.get("file_path"), hit.get("section"), hit.get("chunk_id"))
+            if key == (None, None, None):
+                key = ("", "", hit["text"])
+            score = hit.get("score") or 0.0
+            if key not in unique or score > unique[key]["score"]:
+                unique[key] = {**hit, "score": score}
+    return unique
+
+
+def _merge_adjacent(unique: Dict[Tuple, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge runs of consecutive chunk_ids of the same section into one block
+    scored by its best chunk.
+    """
+    blocks: List[Dict[str, Any]] = []
+    last_key = None
+    for key in sorted(unique, key=lambda k: (str(k[0]), str(k[1]), k[2] if isinstance(k[2], int) else -1)):
+        hit = unique[key]
+        adjacent = (
+            last_key is not None
+            and isinstance(key[2], int)
+            and key[:2] == last_key[:2]
+            and key[2] == last_key[2] + 1
+        )
+        if adjacent:
+            block = blocks[-1]
+            block["text"] = _stitch(block["text"], hit["text"])
+            block["score"] = max(block["score"], hit["score"])
+            block["chunk_ids"].append(key[2])
+        else:
+            blocks.append({
+                "file_path": hit.get("file_path"),
+                "section": hit.get("section"),
+                "chunk_ids": [key[2]],
+                "text": hit["text"],
+                "score": hit["score"],
+            })
+        last_key = key
+    return blocks
+
+
+def assemble_context(
+    hit_lists: Iterable[List[Dict[str, Any]]],
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    tokenizer=None,
+) -> List[str]:
+    """
+    Deduplicate, merge, rank and pack retrieved hits into context blocks.
+
+    :param hit_lists: One list of hits per subquery (as from `retrieve_many`).
+    :param max_tokens: Token budget for all blocks plus their separators.
+    :param tokenizer: Used to count tokens; defaults to the model's.
+    :return: Context texts, best first, within `max_tokens`.
+    """
+    blocks = _merge_adjacent(_dedupe(hit_lists))
+    if not blocks:
+        return []
+    blocks.sort(key=lambda b: b["score"], reverse=True)
+
+    if tokenizer is None:
+        from src.agents.model_registry import get_tokenizer
+
+        tokenizer = get_tokenizer()
+    # Count every block (and the separator) in one batched tokenizer call
+    counted = tokenizer([SEPARATOR] + [b["text"] for b in blocks], add_special_tokens=False)["input_ids"]
+    separator_tokens = len(counted[0])
+
+    context: List[str] = []
+    used = 0
+    for block, ids in zip(blocks, counted[1:]):
+        cost = len(ids) + (separator_tokens if context else 0)
+        if used + cost <= max_tokens:
+            context.append(block["text"])
+            used += cost
+        elif not context:
+            # Even the best block is over budget: keep its beginning
+            context.append(tokenizer.decode(ids[:max_tokens], skip_special_tokens=True))
+            used = max_tokens
+    logger.info(
+        f"Assembled {len(context)} context blocks ({used} tokens) from "
+        f"{len(blocks)} merged blocks"
+    )
+    return context
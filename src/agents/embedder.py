@@ -1,49 +1,109 @@
-from typing import List
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+import numpy as np
 import torch
+from .embedding_backends import EmbeddingBackend, get_backend
+from .embedding_cache import EmbeddingCache
+from src.logger import logger
 
-# Lazy-loaded tokenizer and model references
+T = TypeVar("T")
+
+# Lazy-loaded backend, tokenizer and model references
+_backend: Optional[EmbeddingBackend] = None
 _tokenizer = None
 _model = None
 
+# Lazily created embedding cache (None when disabled)
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
 def _lazy_load():
     """
-    Load tokenizer & model only once, on first use.
+    Load the configured embedding backend (EMBEDDING_BACKEND) on first use.
     """
-    global _tokenizer, _model
+    global _backend, _tokenizer, _model
     if _tokenizer is None or _model is None:
-        from transformers import AutoTokenizer, AutoModel
-        from src.config import MODEL_NAME
+        backend = get_backend()
+        backend.load()
+        _backend, _tokenizer, _model = backend, backend.tokenizer, backend.model
 
-        # Determine GPU availability
-        gpu_count = torch.cuda.device_count()
-        device_map = "auto"
 
-        # Load tokenizer
-        _tokenizer = AutoTokenizer.from_pretrained(
-            MODEL_NAME,
-            trust_remote_code=True
-        )
+def warm_up():
+    """
+    Load the embedding backend and open the embedding cache ahead of the first query.
+    """
+    _lazy_load()
+    _get_cache()
 
-        # Load model with HF offloading
-        _model = AutoModel.from_pretrained(
-            MODEL_NAME,
-            device_map=device_map,
-            offload_folder="offload",
-            offload_state_dict=True,
-            low_cpu_mem_usage=True,
-            torch_dtype=torch.float16 if gpu_count > 0 else torch.float32,
-            trust_remote_code=True
+
+def embedding_dims() -> int:
+    """
+    Size of the vectors produced by the configured backend.
+    """
+    return get_backend().dims
+
+
+def _get_cache() -> Optional[EmbeddingCache]:
+    global _cache
+    if _cache is None:
+        from src.config import (
+            EMBEDDING_CACHE_SIZE,
+            EMBEDDING_CACHE_DIR,
+            EMBEDDING_CACHE_DISK_SIZE
         )
-        _model.eval()
+        if EMBEDDING_CACHE_SIZE <= 0:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                backend = get_backend()
+                _cache = EmbeddingCache(
+                    EMBEDDING_CACHE_SIZE,
+                    backend.model_id,
+                    backend.dims,
+                    disk_dir=EMBEDDING_CACHE_DIR or None,
+                    disk_entries=EMBEDDING_CACHE_DISK_SIZE
+                )
+    return _cache
+
+
+def embedding_cache_stats() -> Dict[str, float]:
+    """
+    Hit/miss counters of the embedding cache (empty when caching is disabled
+    or the cache has not been created yet; creating it may load a config).
+    """
+    cache = _cache
+    return cache.stats() if cache is not None else {}
 
 
 def embed_texts(texts: List[str]) -> List[List[float]]:
     """
-    Embed a list of texts using the loaded model with mean pooling.
+    Embed a list of texts with the configured embedding backend.
+
+    Vectors are served from the embedding cache where possible; only the
+    distinct texts that miss are run through the model, in one batch.
 
     :param texts: List of input strings.
     :return: List of embedding vectors.
     """
+    cache = _get_cache()
+    if cache is None:
+        return _embed_batch(texts)
+
+    vectors: List[Optional[List[float]]] = [cache.get(t) for t in texts]
+    missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+    if missing:
+        computed = dict(zip(missing, _embed_batch(missing)))
+        for text, vector in computed.items():
+            cache.put(text, vector)
+        vectors = [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+    return vectors
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    """
+    Run one batched forward pass (no caching).
+    """
     # Ensure model & tokenizer are initialized
     _lazy_load()
 
@@ -54,23 +114,137 @@ def embed_texts(texts: List[str]) -> List[List[float]]:
         truncation=True,
         return_tensors="pt"
     )
+    return _forward(enc.input_ids, enc.attention_mask).cpu().tolist()
 
+
+def _forward(input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """
+    Backend vectors for an already tokenized, padded batch.
+    """
     # Move inputs to model device
     first_device = next(_model.parameters()).device
-    input_ids = enc.input_ids.to(first_device)
-    attention_mask = enc.attention_mask.to(first_device)
-
-    # Forward pass
-    with torch.no_grad():
-        outputs = _model(input_ids=input_ids, attention_mask=attention_mask)
-        hidden_states = outputs.last_hidden_state
-
-    # Mean pooling
-    mask = attention_mask.unsqueeze(-1)
-    summed = (hidden_states * mask).sum(dim=1)
-    counts = mask.sum(dim=1)
-    embeddings = (summed / counts).cpu().tolist()
-    return embeddings
+    return _backend.embed(input_ids.to(first_device), attention_mask.to(first_device))
+
+
+def _max_batch_tokens(longest: int) -> int:
+    """
+    Padded tokens (batch size x longest sequence) one forward pass may use.
+
+    Uses EMBED_MAX_BATCH_TOKENS when set; otherwise sizes the batch so its
+    activations fit in half of the currently free device memory.
+    """
+    from src.config import EMBED_MAX_BATCH_TOKENS
+
+    if EMBED_MAX_BATCH_TOKENS > 0:
+        return EMBED_MAX_BATCH_TOKENS
+    param = next(_model.parameters())
+    config = _backend.config
+    # Rough peak activation bytes per token: hidden states and MLP
+    # intermediates, plus one attention row per head
+    per_token = (16 * config.hidden_size + config.num_attention_heads * longest) * param.element_size()
+    if param.device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(param.device)
+    else:
+        try:
+            import psutil
+        except ImportError:
+            return 8192
+        free = psutil.virtual_memory().available
+    return max(longest, int(free * 0.5 / per_token))
+
+
+def _is_oom(error: RuntimeError) -> bool:
+    return isinstance(error, torch.cuda.OutOfMemoryError) or "out of memory" in str(error).lower()
+
+
+def embed_corpus(
+    items: Iterable[T],
+    get_text: Callable[[T], str],
+    stats: Optional[Dict[str, float]] = None,
+) -> Iterator[Tuple[T, np.ndarray]]:
+    """
+    Embed a stream of items from the whole corpus with minimal padding.
+
+    Items are read in windows of EMBED_SORT_WINDOW, tokenized once, sorted
+    by token length and cut into batches of similar length, so a batch is
+    never padded to one unusually long chunk. Batch size adapts to free
+    memory (and halves after an out-of-memory error). Results are yielded
+    as (item, float32 NumPy vector) pairs, not in input order, so callers can
+    encode vectors without building Python float lists; items of a batch that fails
+    to embed are logged, counted and skipped. Corpus vectors bypass the
+    query embedding cache.
+
+    :param items: Any iterable, e.g. chunk records from every document.
+    :param get_text: Returns the text to embed for an item.
+    :param stats: Optional dict filled with throughput figures.
+    """
+    from src.config import EMBED_SORT_WINDOW, EMBED_MAX_BATCH_SIZE
+
+    _lazy_load()
+    stats = stats if stats is not None else {}
+    stats.update(texts=0, failed=0, batches=0, tokens=0, padded_tokens=0, seconds=0.0)
+    scale = 1.0
+
+    def batches(window):
+        ids = _tokenizer([get_text(it) for it in window], truncation=True)["input_ids"]
+        order = sorted(range(len(window)), key=lambda i: len(ids[i]))
+        start = 0
+        while start < len(order):
+            # Longest sequence so far in this batch is the last one (sorted)
+            end = start + 1
+            while end < len(order) and end - start < EMBED_MAX_BATCH_SIZE:
+                longest = len(ids[order[end]])
+                if (end - start + 1) * longest > _max_batch_tokens(longest) * scale:
+                    break
+                end += 1
+            yield [window[i] for i in order[start:end]], [ids[i] for i in order[start:end]]
+            start = end
+
+    def run(batch_items, batch_ids):
+        nonlocal scale
+        enc = _tokenizer.pad({"input_ids": batch_ids}, return_tensors="pt")
+        started = time.perf_counter()
+        try:
+            vectors = _forward(enc["input_ids"], enc["attention_mask"]).float().cpu().numpy()
+        except Exception as e:
+            if isinstance(e, RuntimeError) and _is_oom(e) and len(batch_items) > 1:
+                # Back off and retry as two halves
+                scale /= 2
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                half = len(batch_items) // 2
+                yield from run(batch_items[:half], batch_ids[:half])
+                yield from run(batch_items[half:], batch_ids[half:])
+                return
+            # One bad batch must not abort a corpus-wide run; its items are skipped
+            logger.error(f"Embedding failed for a batch of {len(batch_items)} texts: {e}")
+            stats["failed"] += len(batch_items)
+            return
+        stats["seconds"] += time.perf_counter() - started
+        stats["texts"] += len(batch_items)
+        stats["batches"] += 1
+        stats["tokens"] += sum(len(i) for i in batch_ids)
+        stats["padded_tokens"] += enc["input_ids"].numel()
+        yield from zip(batch_items, vectors)
+
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= EMBED_SORT_WINDOW:
+            for batch_items, batch_ids in batches(window):
+                yield from run(batch_items, batch_ids)
+            window = []
+    if window:
+        for batch_items, batch_ids in batches(window):
+            yield from run(batch_items, batch_ids)
+
+    if stats["seconds"]:
+        stats["tokens_per_sec"] = round(stats["tokens"] / stats["seconds"], 1)
+        stats["padding_efficiency"] = round(stats["tokens"] / stats["padded_tokens"], 3)
+        logger.info(
+            f"Embedded {stats['texts']} texts in {stats['batches']} batches: "
+            f"{stats['tokens_per_sec']} tokens/sec, {stats['padding_efficiency']:.1%} of padded tokens real"
+        )
 
 
 def embed_text(text: str) -> List[float]:
@@ -0,0 +1,191 @@
+# embedding_backends.py
+"""
+Interchangeable models behind `embedder.py`.
+
+A backend owns a tokenizer and a torch module and turns a tokenized, padded
+batch into one vector per row. The embedder keeps doing the batching,
+caching and corpus scheduling, so swapping the 8B generation model for a
+small sentence-embedding model only changes what runs in `embed()`, and the
+vector size the index and caches are built for.
+
+- "llm": mean-pooled last hidden state of the shared causal LM (MODEL_NAME).
+  No extra weights, but every query and chunk pays for a full forward pass
+  and vectors are hidden_size wide. Its model_id carries the quantization
+  mode (e.g. "<MODEL_NAME>+int8").
+- "sentence-transformers": a dedicated EMBEDDING_MODEL, e.g. a MiniLM with
+  384-dim vectors; loaded on its own, independent of the generation model.
+"""
+
+import threading
+from typing import Optional
+
+import torch
+
+from src.config import EMBEDDING_BACKEND, EMBEDDING_DIMS, EMBEDDING_MODEL, MODEL_NAME
+from src.logger import logger
+
+
+class EmbeddingBackend:
+    """
+    Interface of an embedding model.
+
+    :attr name: Backend name, as in EMBEDDING_BACKEND.
+    :attr model_id: Identifies the vectors (cache keys, index metadata).
+    :attr tokenizer: Hugging Face tokenizer; truncates to the model's limit.
+    :attr model: torch module, used for its device and dtype.
+    :attr config: Transformer config (hidden_size, num_attention_heads),
+        used to size batches.
+    """
+
+    name = ""
+
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+        self.tokenizer = None
+        self.model = None
+        self.config = None
+        # load() may be reached from warm-up, /health and requests at once
+        self._load_lock = threading.Lock()
+
+    @property
+    def dims(self) -> int:
+        """
+        Size of the vectors `embed` returns.
+        """
+        raise NotImplementedError
+
+    def load(self) -> None:
+        """
+        Load tokenizer and model (idempotent).
+        """
+        raise NotImplementedError
+
+    def embed(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """
+        (batch, dims) vectors for a padded batch already on the model's device.
+        """
+        raise NotImplementedError
+
+
+class LLMBackend(EmbeddingBackend):
+    """
+    Mean pooling over the base transformer of the shared causal LM.
+    """
+
+    name = "llm"
+
+    def __init__(self):
+        from .model_registry import quantization_mode
+
+        # int8 weights give (slightly) different vectors: keep them apart in
+        # the embedding cache and the index metadata
+        quantization = quantization_mode()
+        super().__init__(MODEL_NAME if quantization == "none" else f"{MODEL_NAME}+{quantization}")
+        self._dims: Optional[int] = None
+
+    @property
+    def dims(self) -> int:
+        if self._dims is None:
+            if self.config is None:
+                # Only the config: creating the index needs no weights
+                from transformers import AutoConfig
+
+                config = AutoConfig.from_pretrained(MODEL_NAME, trust_remote_code=True)
+            else:
+                config = self.config
+            self._dims = config.hidden_size
+            if EMBEDDING_DIMS and EMBEDDING_DIMS != self._dims:
+                raise ValueError(
+                    f"EMBEDDING_DIMS={EMBEDDING_DIMS} but the llm backend produces "
+                    f"{self._dims}-dim vectors (hidden size of {MODEL_NAME})."
+                )
+        return self._dims
+
+    def load(self) -> None:
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is None:
+                from .model_registry import get_tokenizer, get_encoder
+
+                # The encoder is the causal LM's base model, so no extra weights load
+                self.tokenizer = get_tokenizer()
+                encoder = get_encoder()
+                self.config = encoder.config
+                self.model = encoder
+
+    def embed(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            hidden_states = self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+        mask = attention_mask.unsqueeze(-1)
+        return (hidden_states * mask).sum(dim=1) / mask.sum(dim=1)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """
+    A sentence-transformers model, with its own pooling and normalization.
+
+    EMBEDDING_DIMS below the model's native size keeps the leading
+    dimensions, which is how Matryoshka-trained models are shortened.
+    """
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_id: Optional[str] = None, dims: Optional[int] = None):
+        super().__init__(model_id or EMBEDDING_MODEL)
+        self._requested_dims = EMBEDDING_DIMS if dims is None else dims
+        self._dims: Optional[int] = None
+
+    @property
+    def dims(self) -> int:
+        if self._dims is None:
+            self.load()
+            native = self.model.get_sentence_embedding_dimension()
+            if self._requested_dims > native:
+                raise ValueError(f"EMBEDDING_DIMS={self._requested_dims} exceeds the {native} dims of {self.model_id}.")
+            self._dims = self._requested_dims or native
+        return self._dims
+
+    def load(self) -> None:
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+
+                model = SentenceTransformer(self.model_id, device="cuda" if torch.cuda.is_available() else "cpu")
+                model.eval()
+                self.tokenizer = model.tokenizer
+                # Truncate where the model was trained to, not at the tokenizer's limit
+                self.tokenizer.model_max_length = min(self.tokenizer.model_max_length, model.max_seq_length)
+                self.config = model[0].auto_model.config
+                self.model = model
+                logger.info(f"Loaded embedding model {self.model_id} ({model.get_sentence_embedding_dimension()} dims)")
+
+    def embed(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            vectors = self.model({"input_ids": input_ids, "attention_mask": attention_mask})["sentence_embedding"]
+        return vectors[:, :self.dims]
+
+
+BACKENDS = {backend.name: backend for backend in (LLMBackend, SentenceTransformerBackend)}
+
+_backend: Optional[EmbeddingBackend] = None
+_lock = threading.Lock()
+
+
+def get_backend() -> EmbeddingBackend:
+    """
+    Return the configured backend (EMBEDDING_BACKEND), created on first use.
+    Models are loaded separately, by `load()`.
+    """
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if EMBEDDING_BACKEND not in BACKENDS:
+                    raise ValueError(
+                        f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; choose one of {sorted(BACKENDS)}."
+                    )
+                _backend = BACKENDS[EMBEDDING_BACKEND]()
+    return _backend
@@ -0,0 +1,183 @@
+# embedding_cache.py
+"""
+Keyed cache for embedding vectors.
+
+Entries are keyed on the normalized text plus the model name and vector
+size, so a model or dimension change never serves stale vectors. A bounded
+in-memory LRU tier answers repeat queries instantly; an optional on-disk
+tier (a memory-mapped float32 matrix) survives restarts and holds many
+more vectors than memory.
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def normalize_text(text: str) -> str:
+    """
+    Canonical form used for cache keys: NFC unicode, collapsed whitespace.
+
+    Case is preserved because the embedding model is case sensitive.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class _DiskTier:
+    """
+    Fixed-capacity ring buffer of vectors in memory-mapped files.
+
+    Each slot stores its key digest next to its vector and is checked on
+    read, so a crash between writes can only cause a miss, never a wrong
+    vector. The key index is rebuilt from the digests on start-up.
+    """
+
+    # Persist the ring position after this many writes (and at exit)
+    FLUSH_EVERY = 64
+
+    def __init__(self, folder: str, capacity: int, dims: int):
+        import numpy as np
+
+        os.makedirs(folder, exist_ok=True)
+        self.capacity = capacity
+        self.dims = dims
+        stem = os.path.join(folder, f"embeddings_{dims}d_{capacity}")
+        self._meta_path = stem + ".json"
+        mode = "r+" if os.path.exists(stem + ".f32") else "w+"
+        self._vectors = np.memmap(stem + ".f32", dtype=np.float32, mode=mode, shape=(capacity, dims))
+        # Raw 20-byte SHA-1 digests; an all-zero row marks an empty slot
+        self._digests = np.memmap(stem + ".keys", dtype=np.uint8, mode=mode, shape=(capacity, 20))
+
+        self._slots: Dict[str, int] = {
+            self._digests[slot].tobytes().hex(): int(slot)
+            for slot in np.flatnonzero(self._digests.any(axis=1))
+        }
+        self._next = 0
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                self._next = json.load(f).get("next", 0) % capacity
+        self._dirty = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        slot = self._slots.get(key)
+        if slot is None or self._digests[slot].tobytes() != bytes.fromhex(key):
+            return None
+        return self._vectors[slot].tolist()
+
+    def put(self, key: str, vector: List[float]) -> None:
+        if key in self._slots:
+            return
+        slot = self._next
+        self._next = (self._next + 1) % self.capacity
+        # Overwrite the oldest entry once the ring is full
+        self._slots.pop(self._digests[slot].tobytes().hex(), None)
+        self._digests[slot] = 0
+        self._vectors[slot] = vector
+        self._digests[slot] = list(bytes.fromhex(key))
+        self._slots[key] = slot
+        self._dirty += 1
+        if self._dirty >= self.FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._dirty:
+            return
+        self._vectors.flush()
+        self._digests.flush()
+        with open(self._meta_path, "w", encoding="utf-8") as f:
+            json.dump({"next": self._next}, f)
+        self._dirty = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of embeddings with an optional disk tier.
+
+    :param max_entries: Vectors kept in memory; least recently used are evicted.
+    :param model_name: Part of the key, so vectors from other models never match.
+    :param dims: Vector size; part of the key and of the disk file layout.
+    :param disk_dir: Folder for the on-disk tier, or None for memory only.
+    :param disk_entries: Capacity of the on-disk tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        model_name: str,
+        dims: int,
+        disk_dir: Optional[str] = None,
+        disk_entries: int = 100_000,
+    ):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive.")
+        self.max_entries = max_entries
+        self.model_name = model_name
+        self.dims = dims
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._disk = _DiskTier(disk_dir, disk_entries, dims) if disk_dir else None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if self._disk is not None:
+            atexit.register(self.flush)
+
+    def key(self, text: str) -> str:
+        raw = f"{self.model_name}\x1f{self.dims}\x1f{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self.key(text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                return vector
+            if self._disk is not None:
+                vector = self._disk.get(key)
+                if vector is not None:
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    self._remember(key, vector)
+                    return vector
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, text: str, vector: List[float]) -> None:
+        key = self.key(text)
+        with self._lock:
+            self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.put(key, vector)
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def flush(self) -> None:
+        """
+        Persist the disk tier's key index (no-op for memory-only caches).
+        """
+        if self._disk is not None:
+            with self._lock:
+                self._disk.flush()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk) if self._disk is not None else 0,
+            }
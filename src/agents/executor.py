@@ -1,27 +1,142 @@
 # executor.py
+import threading
+import time
+from typing import Dict, Iterator, Optional
+from . import embedder, planner, reasoner, reranker
 from .planner import plan
-from src.services.retriever import init_es_client, retrieve
-from .reasoner import reason
-from src.config import top_k
+from src.services.local_index import get_local_index
+from src.services.retriever import init_es_client, retrieve_many
+from .reasoner import reason, reason_stream
+from .context_assembler import assemble_context
+from .embedder import embed_text
+from .answer_cache import AnswerCache
+from src.config import (
+    top_k,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    INDEX_GENERATION_FILE,
+    RERANK_ENABLED,
+    RETRIEVAL_BACKEND
+)
 from src.logger import logger
 
+# Lazily created semantic answer cache (None when disabled)
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def _get_answer_cache() -> Optional[AnswerCache]:
+    global _answer_cache
+    if ANSWER_CACHE_SIZE <= 0:
+        return None
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(
+                ANSWER_CACHE_THRESHOLD,
+                ANSWER_CACHE_TTL,
+                ANSWER_CACHE_SIZE,
+                generation_file=INDEX_GENERATION_FILE
+            )
+    return _answer_cache
+
+
+def answer_cache_stats() -> Dict[str, float]:
+    """
+    Hit-rate counters of the semantic answer cache (empty when disabled).
+    """
+    cache = _get_answer_cache()
+    return cache.stats() if cache is not None else {}
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Load everything the first query would otherwise wait for: the shared
+    LLM with its prompt prefixes, the embedding backend and, when
+    configured, the reranker and the local index.
+
+    :return: Seconds spent per step.
+    """
+    steps = [
+        ("llm", lambda: (planner.warm_up(), reasoner.warm_up())),
+        ("embedder", embedder.warm_up),
+        ("answer_cache", _get_answer_cache),
+    ]
+    if RERANK_ENABLED:
+        steps.append(("reranker", reranker.warm_up))
+    if RETRIEVAL_BACKEND == "local":
+        steps.append(("local_index", lambda: get_local_index().stats()))
+    seconds = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        step()
+        seconds[name] = round(time.perf_counter() - start, 2)
+        logger.info(f"Warm-up: {name} ready in {seconds[name]:.2f}s")
+    return seconds
+
+
+def _gather_context(query: str) -> list[str]:
+    """
+    Plan the query, retrieve chunks for every subquery and assemble them
+    into deduplicated context blocks within the token budget.
+    """
+    es = init_es_client()
+
+    subqueries = plan(query)
+    logger.info(f"Retrieving for {len(subqueries)} subqueries: {subqueries}")
+    # One batched embedding pass and one msearch round trip for all subqueries
+    hit_lists = retrieve_many(subqueries, es, top_k)
+    return assemble_context(hit_lists)
+
 
 def execute(query: str) -> str:
     """
     Orchestrate the full Agentic RAG: plan → retrieve → reason.
+
+    Near-duplicates of recently answered queries are served from the
+    semantic answer cache without running the pipeline.
     """
     logger.info(f"Starting execution for query: {query}")
-    es = init_es_client()
+    cache = _get_answer_cache()
+    if cache is not None:
+        query_vector = embed_text(query)
+        cached = cache.lookup(query_vector)
+        if cached is not None:
+            logger.info("Answer cache hit")
+            return cached
 
-    subqueries = plan(query)
-    all_context = []
-    for sq in subqueries:
-        logger.info(f"Retrieving for subquery: {sq}")
-        hits = retrieve(sq, es, top_k)
-        chunks = [h["text"] for h in hits]
-        all_context.extend(chunks)
+    all_context = _gather_context(query)
 
     logger.info(f"Reasoning with {len(all_context)} context chunks")
     answer = reason(query, all_context)
+    if cache is not None:
+        cache.store(query_vector, answer)
     logger.info("Execution complete")
     return answer
+
+
+def execute_stream(query: str) -> Iterator[str]:
+    """
+    Same pipeline as `execute`, yielding answer text as it is generated.
+    """
+    logger.info(f"Starting streaming execution for query: {query}")
+    cache = _get_answer_cache()
+    if cache is not None:
+        query_vector = embed_text(query)
+        cached = cache.lookup(query_vector)
+        if cached is not None:
+            logger.info("Answer cache hit")
+            yield cached
+            return
+
+    all_context = _gather_context(query)
+
+    logger.info(f"Streaming answer from {len(all_context)} context chunks")
+    pieces = []
+    for piece in reason_stream(query, all_context):
+        pieces.append(piece)
+        yield piece
+    # Only complete answers are cached (not streams the client abandoned)
+    if cache is not None:
+        cache.store(query_vector, "".join(pieces))
+    logger.info("Streaming execution complete")
@@ -0,0 +1,209 @@
+# src/agents/model_registry.py
+"""
+Process-wide registry for the Hugging Face weights shared by the agents.
+
+The planner, reasoner and embedder all run on the same checkpoint, so the
+weights are loaded exactly once: the causal LM serves planning/reasoning and
+its base transformer (same tensors, no copy) serves embedding.
+
+The tokenizer is shared as a `ThreadLocalTokenizer`: the Rust tokenizer of
+a fast tokenizer holds its truncation/padding settings as mutable state and
+raises "Already borrowed" when two threads call it with different settings,
+so every thread gets its own copy.
+"""
+
+import copy
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import torch
+
+from src.config import MODEL_NAME, QUANTIZATION_MODE
+from src.logger import logger
+
+# Lazy-loaded, shared references
+_tokenizer = None
+_causal_lm = None
+
+# Guards the loads so concurrent first requests don't load twice
+_lock = threading.RLock()
+
+# Per-model load statistics, keyed by role
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _rss_bytes() -> Optional[int]:
+    """
+    Resident set size of this process, or None when psutil is unavailable.
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+def _footprint_bytes(model) -> int:
+    """
+    Bytes held by a model's parameters and buffers, including the packed
+    weights of quantized layers (which are not parameters).
+    """
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        packed = getattr(module, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            tensors.extend(t for t in packed._weight_bias() if t is not None)
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def quantize_int8(model):
+    """
+    Dynamically quantize every nn.Linear of `model` to int8 weights (CPU only).
+
+    Activations stay float32 and are quantized on the fly per batch, so no
+    calibration data is needed; embeddings and norms keep float32 weights.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _record(role: str, start: float, rss_before: Optional[int], **extra) -> None:
+    rss_after = _rss_bytes()
+    _stats[role] = {
+        "model_name": MODEL_NAME,
+        "load_seconds": round(time.perf_counter() - start, 3),
+        "rss_delta_bytes": (
+            rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        ),
+        **extra,
+    }
+    logger.info(f"Loaded {role} for {MODEL_NAME}: {_stats[role]}")
+
+
+class ThreadLocalTokenizer:
+    """
+    Read-only proxy to a Hugging Face tokenizer that gives each calling
+    thread its own deep copy (made on the thread's first use).
+    """
+
+    def __init__(self, tokenizer):
+        self._base = tokenizer
+        self._local = threading.local()
+
+    def _get(self):
+        tokenizer = getattr(self._local, "tokenizer", None)
+        if tokenizer is None:
+            tokenizer = self._local.tokenizer = copy.deepcopy(self._base)
+        return tokenizer
+
+    def __call__(self, *args, **kwargs):
+        return self._get()(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._base)
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+
+def get_tokenizer():
+    """
+    Return the shared tokenizer (one copy per thread), loading it on first use.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+
+                start, rss_before = time.perf_counter(), _rss_bytes()
+                tokenizer = AutoTokenizer.from_pretrained(
+                    MODEL_NAME,
+                    trust_remote_code=True
+                )
+                # Llama checkpoints ship without a pad token; batching needs one
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                _tokenizer = ThreadLocalTokenizer(tokenizer)
+                _record("tokenizer", start, rss_before)
+    return _tokenizer
+
+
+def quantization_mode() -> str:
+    """
+    QUANTIZATION_MODE as it applies on this machine: int8 is CPU-only.
+    """
+    if QUANTIZATION_MODE == "int8" and torch.cuda.is_available():
+        return "none"
+    return QUANTIZATION_MODE
+
+
+def get_causal_lm():
+    """
+    Return the shared causal LM used for planning and reasoning.
+    """
+    global _causal_lm
+    if _causal_lm is None:
+        with _lock:
+            if _causal_lm is None:
+                from transformers import AutoModelForCausalLM
+
+                start, rss_before = time.perf_counter(), _rss_bytes()
+                quantization = quantization_mode()
+                if quantization != QUANTIZATION_MODE:
+                    logger.warning("QUANTIZATION_MODE=int8 is CPU-only; loading float16 weights on the GPU")
+                if quantization == "int8":
+                    # Quantization needs every weight resident on the CPU,
+                    # so no device map or disk offloading here
+                    model = AutoModelForCausalLM.from_pretrained(
+                        MODEL_NAME,
+                        low_cpu_mem_usage=True,
+                        torch_dtype=torch.float32,
+                        trust_remote_code=True
+                    )
+                    model = quantize_int8(model)
+                else:
+                    model = AutoModelForCausalLM.from_pretrained(
+                        MODEL_NAME,
+                        device_map="auto",
+                        offload_folder="offload",
+                        offload_state_dict=True,
+                        low_cpu_mem_usage=True,
+                        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+                        trust_remote_code=True
+                    )
+                model.eval()
+                _causal_lm = model
+                _record(
+                    "causal_lm", start, rss_before,
+                    quantization=quantization, footprint_bytes=_footprint_bytes(model)
+                )
+    return _causal_lm
+
+
+def get_encoder():
+    """
+    Return the base transformer of the shared causal LM for embedding.
+
+    This is the same module the LM head sits on, so it shares every weight
+    with `get_causal_lm()` and costs no extra memory.
+    """
+    with _lock:
+        model = get_causal_lm()
+        if "encoder" not in _stats:
+            _stats["encoder"] = {
+                "model_name": MODEL_NAME,
+                "load_seconds": 0.0,
+                "rss_delta_bytes": 0,
+                "footprint_bytes": 0,
+                "shared_with": "causal_lm",
+            }
+        return model.base_model
+
+
+def model_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Snapshot of load time and memory footprint for every loaded model.
+    """
+    with _lock:
+        return {role: dict(stats) for role, stats in _stats.items()}
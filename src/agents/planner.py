@@ -7,35 +7,192 @@
 #     """
 #     return [query]
 
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List
 
-# Load once during module import (recommended for performance)
-from src.config import MODEL_NAME
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-model = AutoModelForCausalLM.from_pretrained(MODEL_NAME, torch_dtype=torch.float16, device_map="auto")
+from .batcher import get_batcher, encode_left_padded
+from .prefix_cache import get_prefix_cache
+from src.config import (
+    PREFIX_CACHE,
+    PLANNER_MODE,
+    PLANNER_SIMPLE_MAX_WORDS,
+    PLANNER_MAX_SUBQUERIES,
+    PLANNER_MAX_NEW_TOKENS,
+    PLAN_CACHE_SIZE
+)
+from src.logger import logger
 
-def plan(query: str) -> list[str]:
+# Lazy-loaded references (shared with the reasoner via the model registry)
+_tokenizer = None
+_model = None
+
+def _lazy_load():
     """
-    Decompose a complex query into sub-queries using DeepSeek-R1-Distill-Llama-8B.
+    Fetch tokenizer & LLM from the shared registry on first use.
     """
-    prompt = f"""Decompose the following question into clear, focused sub-questions. 
+    global _tokenizer, _model
+    if _tokenizer is None or _model is None:
+        from .model_registry import get_tokenizer, get_causal_lm
+
+        _tokenizer = get_tokenizer()
+        _model = get_causal_lm()
+
+
+def warm_up():
+    """
+    Load the model and prefill the plan prompt prefix ahead of the first query.
+    """
+    _lazy_load()
+    if PREFIX_CACHE:
+        get_prefix_cache("plan", _model, _tokenizer, PLAN_PREFIX)
+
+PLAN_PROMPT = """Decompose the following question into clear, focused sub-questions. 
 Return one sub-question per line. Only output the sub-questions.
 
 Question: {query}
 """
+# Static instruction text, prefilled once and reused (see prefix_cache); it
+# ends after the blank line because "Question: " + query does not tokenize
+# as "Question: " followed by the query with byte-level BPE
+PLAN_PREFIX = PLAN_PROMPT[:PLAN_PROMPT.index("Question:")]
+
+PLANNER_MODES = ("auto", "llm", "off")
+
+_WH_WORDS = re.compile(r"\b(what|why|how|which|when|where|who|whom|whose)\b")
+# Cues that a question asks about several things or relates them
+_COMPLEX_CUES = re.compile(
+    r"\b(compare|comparison|contrast|differences?|versus|vs\.?|relationship|as well as|respectively|"
+    r"pros and cons|advantages and disadvantages)\b|;"
+)
+_BULLET = re.compile(r"^\s*(?:[-*•]+|\d+[.):]|\(?[a-z]\)|sub-?questions?\s*\d*\s*:)\s*", re.IGNORECASE)
+
+# Plans per normalized query (LRU) and fast-path / LLM counters
+_plan_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+_stats = {"fast_path": 0, "llm": 0, "cache_hits": 0}
+_plan_lock = threading.Lock()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key of a query: NFC unicode, lower case, collapsed whitespace,
+    without trailing punctuation.
+    """
+    return " ".join(unicodedata.normalize("NFC", query).lower().split()).rstrip("?!. ")
+
+
+
+# Lines of the prompt a model may echo back
+_ECHOES = tuple(normalize_query(line) for line in PLAN_PREFIX.splitlines() if line.strip()) + ("question:", "sub-questions:")
+
+def is_complex(query: str) -> bool:
+    """
+    Cheap test for queries worth an LLM decomposition: several questions or
+    wh-words, a comparison, or more than PLANNER_SIMPLE_MAX_WORDS words.
+    Everything else is searched as-is.
+    """
+    text = normalize_query(query)
+    if len(text.split()) > PLANNER_SIMPLE_MAX_WORDS:
+        return True
+    if query.count("?") > 1 or len(_WH_WORDS.findall(text)) > 1:
+        return True
+    return bool(_COMPLEX_CUES.search(text))
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
-    outputs = model.generate(
+
+def parse_subqueries(generated: str, query: str) -> List[str]:
+    """
+    Sub-questions from the planner's generated text: bullets and numbering
+    stripped, reasoning and echoed prompt lines dropped, deduplicated (case-insensitive)
+    and capped at PLANNER_MAX_SUBQUERIES. Falls back to the query itself.
+    """
+    # Reasoning models think first; an unfinished thought holds no plan
+    if "</think>" in generated:
+        generated = generated.rsplit("</think>", 1)[1]
+    elif "<think>" in generated:
+        generated = generated.split("<think>", 1)[0]
+    subqueries, seen = [], set()
+    for line in generated.split("\n"):
+        line = _BULLET.sub("", line).strip(" -•.\t")
+        key = normalize_query(line)
+        if not key or key in seen or key.startswith(_ECHOES) or key == normalize_query(query):
+            continue
+        seen.add(key)
+        subqueries.append(line)
+        if len(subqueries) == PLANNER_MAX_SUBQUERIES:
+            break
+    return subqueries or [query]
+
+
+def _plan_batch(queries: list[str]) -> list[list[str]]:
+    """
+    Plan several queries with one padded `generate` call.
+    """
+    _lazy_load()
+
+    prompts = [PLAN_PROMPT.format(query=q) for q in queries]
+    if PREFIX_CACHE:
+        cache = get_prefix_cache("plan", _model, _tokenizer, PLAN_PREFIX)
+        inputs = cache.build_inputs([p[len(PLAN_PREFIX):] for p in prompts])
+    else:
+        inputs = encode_left_padded(_tokenizer, prompts, _model.device)
+    outputs = _model.generate(
         **inputs,
-        max_new_tokens=128,
+        max_new_tokens=PLANNER_MAX_NEW_TOKENS,
         do_sample=False,
-        pad_token_id=tokenizer.eos_token_id
+        pad_token_id=_tokenizer.eos_token_id
     )
 
-    response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    # Only the new tokens: the prompt would otherwise come back as sub-questions
+    generated = _tokenizer.batch_decode(
+        outputs[:, inputs["input_ids"].shape[-1]:], skip_special_tokens=True
+    )
+    return [parse_subqueries(text, query) for text, query in zip(generated, queries)]
+
+
+def plan(query: str) -> list[str]:
+    """
+    Decompose a complex query into sub-queries using DeepSeek-R1-Distill-Llama-8B.
+
+    PLANNER_MODE "auto" sends only queries that `is_complex` flags to the
+    LLM and searches the rest as-is; "llm" decomposes every query; "off"
+    never does. LLM plans are cached per normalized query, and concurrent
+    calls are batched into one generate pass.
+    """
+    if PLANNER_MODE not in PLANNER_MODES:
+        raise ValueError(f"Unknown PLANNER_MODE {PLANNER_MODE!r}; choose one of {list(PLANNER_MODES)}.")
+    if PLANNER_MODE == "off" or (PLANNER_MODE == "auto" and not is_complex(query)):
+        with _plan_lock:
+            _stats["fast_path"] += 1
+        return [query]
+
+    key = normalize_query(query)
+    with _plan_lock:
+        cached = _plan_cache.get(key)
+        if cached is not None:
+            _plan_cache.move_to_end(key)
+            _stats["cache_hits"] += 1
+            return list(cached)
+        _stats["llm"] += 1
 
-    # Extract only sub-questions from generated text
-    lines = response.split("\n")
-    subqueries = [line.strip("-•. ") for line in lines if line.strip()]
+    batcher = get_batcher("plan", _plan_batch)
+    subqueries = _plan_batch([query])[0] if batcher is None else batcher.submit(query)
+    logger.debug(f"Planned {query!r} into {subqueries}")
+
+    if PLAN_CACHE_SIZE > 0:
+        with _plan_lock:
+            _plan_cache[key] = list(subqueries)
+            _plan_cache.move_to_end(key)
+            while len(_plan_cache) > PLAN_CACHE_SIZE:
+                _plan_cache.popitem(last=False)
     return subqueries
+
+
+def planner_stats() -> Dict[str, object]:
+    """
+    Planner mode, how many queries took the fast path or the LLM, and plan
+    cache hits and size.
+    """
+    with _plan_lock:
+        return {"mode": PLANNER_MODE, **_stats, "cached_plans": len(_plan_cache)}
@@ -0,0 +1,136 @@
+# prefix_cache.py
+"""
+Reuse of the attention key/values of a fixed prompt prefix.
+
+The planner and reasoner prompts start with the same instruction text on
+every call. A PrefixCache runs that prefix through the model once and
+hands `generate` a copy of its key/values, so each request only prefills
+its own suffix (query, context). Rows of a batch are laid out as
+[prefix][padding][suffix]: the padding is masked out and the model derives
+positions from the attention mask, so every row continues the shared
+prefix exactly as if it had been prefilled on its own.
+
+That only holds if the prompt tokenizes as prefix tokens + suffix tokens.
+With byte-level BPE a prefix ending in a space does not (" How" is one
+token, "Ġ" + "How" is not what the model was trained on), so prefixes
+should end at a stable boundary such as a newline; every batch is checked
+and prefilled in full when its split differs from the real tokenization.
+"""
+
+import copy
+import threading
+from typing import Any, Dict, List, Optional
+
+import torch
+
+from src.config import PREFIX_CACHE_MAX_SUFFIX_TOKENS
+from src.logger import logger
+
+
+class PrefixCache:
+    """
+    Precomputed past key/values for `prefix`.
+
+    :param model: Causal LM the cache is computed with (and used for).
+    :param tokenizer: Its tokenizer.
+    :param prefix: Static text every prompt starts with.
+    :param max_suffix_tokens: Prefill batches with a longer suffix in full
+        instead (None = always use the cache). Continuing from a cache
+        needs an explicit attention mask, which rules out the fused causal
+        attention kernel; for long suffixes that costs more than the
+        prefix saves.
+    """
+
+    def __init__(self, model, tokenizer, prefix: str, max_suffix_tokens: Optional[int] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.max_suffix_tokens = max_suffix_tokens
+        self._stats = {"cached": 0, "full": 0, "split_mismatch": 0}
+        self.prefix_ids: List[int] = list(tokenizer(prefix)["input_ids"])
+        probe = list(tokenizer(prefix + "Example")["input_ids"])
+        if probe[:len(self.prefix_ids)] != self.prefix_ids:
+            logger.warning(f"Prompt prefix {prefix[-20:]!r} does not end at a token boundary; prompts will be prefilled in full")
+        with torch.no_grad():
+            out = model(input_ids=torch.tensor([self.prefix_ids], device=model.device), use_cache=True)
+        self._past = out.past_key_values
+        logger.info(f"Cached key/values for a {len(self.prefix_ids)}-token prompt prefix")
+
+    def build_inputs(self, suffixes: List[str], truncation: bool = False) -> Dict[str, Any]:
+        """
+        `generate` keyword arguments (input_ids, attention_mask,
+        past_key_values) for prompts `prefix + suffix`, one row per suffix.
+        """
+        max_length = None
+        if truncation:
+            max_length = self.tokenizer.model_max_length - len(self.prefix_ids)
+        rows = self.tokenizer(
+            suffixes, add_special_tokens=False, truncation=truncation, max_length=max_length
+        )["input_ids"]
+        # How the whole prompts really tokenize
+        full = [list(f) for f in self.tokenizer(
+            [self.prefix + s for s in suffixes],
+            truncation=truncation,
+            max_length=self.tokenizer.model_max_length if truncation else None,
+        )["input_ids"]]
+        width = max(len(r) for r in rows)
+        pad = self.tokenizer.pad_token_id
+        if pad is None:
+            pad = self.tokenizer.eos_token_id
+        split_ok = all(f == self.prefix_ids + list(r) for f, r in zip(full, rows))
+        if not split_ok or (self.max_suffix_tokens is not None and width > self.max_suffix_tokens):
+            # Plain left-padded prompts, prefilled from scratch
+            self._stats["full"] += 1
+            self._stats["split_mismatch"] += not split_ok
+            full_width = max(len(f) for f in full)
+            input_ids = torch.tensor([[pad] * (full_width - len(f)) + f for f in full])
+            attention_mask = torch.tensor([[0] * (full_width - len(f)) + [1] * len(f) for f in full])
+            return {
+                "input_ids": input_ids.to(self.model.device),
+                "attention_mask": attention_mask.to(self.model.device),
+            }
+        self._stats["cached"] += 1
+        prefix_len = len(self.prefix_ids)
+        input_ids = torch.tensor([self.prefix_ids + [pad] * (width - len(r)) + list(r) for r in rows])
+        attention_mask = torch.tensor([[1] * prefix_len + [0] * (width - len(r)) + [1] * len(r) for r in rows])
+        # generate() extends the cache in place, so every call gets its own copy
+        past = copy.deepcopy(self._past)
+        if len(rows) > 1:
+            past.batch_repeat_interleave(len(rows))
+        return {
+            "input_ids": input_ids.to(self.model.device),
+            "attention_mask": attention_mask.to(self.model.device),
+            "past_key_values": past,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Prefix length and how many batches used the cache or a full prefill.
+        """
+        return {"prefix_tokens": len(self.prefix_ids), **self._stats}
+
+
+# One cache per prompt template, created on first use
+_caches: Dict[str, PrefixCache] = {}
+_lock = threading.Lock()
+
+
+def get_prefix_cache(name: str, model, tokenizer, prefix: str) -> PrefixCache:
+    """
+    Return the shared PrefixCache for `name`, computing it on first use.
+    """
+    with _lock:
+        cache = _caches.get(name)
+        if cache is None or cache.model is not model or cache.prefix != prefix:
+            cache = _caches[name] = PrefixCache(
+                model, tokenizer, prefix, max_suffix_tokens=PREFIX_CACHE_MAX_SUFFIX_TOKENS or None
+            )
+        return cache
+
+
+def prefix_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Stats of every prefix cache computed so far, keyed by name.
+    """
+    with _lock:
+        return {name: cache.stats() for name, cache in _caches.items()}
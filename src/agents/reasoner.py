@@ -1,6 +1,13 @@
 # src/agents/reasoner.py
+import queue
+import threading
+from typing import Iterator
 import torch
 from transformers.generation.stopping_criteria import StoppingCriteria, StoppingCriteriaList
+from .batcher import get_batcher, encode_left_padded
+from .prefix_cache import get_prefix_cache
+from src.config import PREFIX_CACHE, STREAM_TOKEN_TIMEOUT
+from src.logger import logger
 
 # Lazy‑loaded references
 _tokenizer_llm = None
@@ -8,52 +15,53 @@ _llm = None
 
 def _lazy_load_llm():
     """
-    Load LLM & tokenizer only once, on first use.
+    Fetch LLM & tokenizer from the shared registry on first use.
     """
     global _tokenizer_llm, _llm
     if _tokenizer_llm is None or _llm is None:
-        from transformers import AutoModelForCausalLM, AutoTokenizer
-        from src.config import MODEL_NAME
+        from .model_registry import get_tokenizer, get_causal_lm
 
-        # Instantiate tokenizer & model
-        _tokenizer_llm = AutoTokenizer.from_pretrained(
-            MODEL_NAME,
-            trust_remote_code=True
-        )
-        _llm = AutoModelForCausalLM.from_pretrained(
-            MODEL_NAME,
-            device_map="auto",
-            low_cpu_mem_usage=True,
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            trust_remote_code=True
-        )
-        _llm.eval()
+        _tokenizer_llm = get_tokenizer()
+        _llm = get_causal_lm()
 
-# Custom stopping criterion: stop when the model begins to emit "Question:"
-class StopOnQuestion(StoppingCriteria):
-    def __call__(self, input_ids, scores, **kwargs):
-        text = _tokenizer_llm.decode(input_ids[0], skip_special_tokens=True)
-        return text.endswith("Question:")
 
-# Custom stopping criterion: stop when chain-of-thought cues appear
-class StopOnCue(StoppingCriteria):
-    def __init__(self, cues):
-        self.cues = cues
+# Custom stopping criterion: stop when a new question or chain-of-thought cue appears
+class StopOnSequences(StoppingCriteria):
+    """
+    Stop a row once its generated text ends with any of `stop_strings`.
+
+    Only newly generated tokens are inspected: each step decodes a short
+    rolling tail (one token per character of the longest stop string, plus
+    one) rather than the whole prompt + answer, and every stop string is
+    checked in a single `endswith` call, so the per-token cost no longer
+    grows with the prompt length.
+    """
+    def __init__(self, tokenizer, stop_strings, prompt_length: int):
+        self.tokenizer = tokenizer
+        self.stop_strings = tuple(stop_strings)
+        self.prompt_length = prompt_length
+        # Every token decodes to at least one character
+        self.window = max(len(s) for s in self.stop_strings) + 1
+
     def __call__(self, input_ids, scores, **kwargs):
-        text = _tokenizer_llm.decode(input_ids[0], skip_special_tokens=True)
-        return any(text.endswith(cue) for cue in self.cues)
+        start = max(self.prompt_length, input_ids.shape[1] - self.window)
+        tails = self.tokenizer.batch_decode(input_ids[:, start:], skip_special_tokens=True)
+        return torch.tensor(
+            [tail.endswith(self.stop_strings) for tail in tails],
+            dtype=torch.bool,
+            device=input_ids.device
+        )
 
 
-def reason(query: str, context: list[str]) -> str:
-    """
-    Generate an answer given the user query and retrieved context.
-    """
-    # Ensure model & tokenizer loaded
-    _lazy_load_llm()
+# Generation is cut off when the model starts a new question or a
+# chain-of-thought cue
+STOP_CUES = [
+    "Question:",
+    " I think", "Let's", "Therefore", "Thus", "Because", "So,",
+    "Alright", "Remember", "I remember", "---"
+]
 
-    # Assemble prompt
-    prompt = (
-        """
+PROMPT_TEMPLATE = """
 Use the following context to answer the question directly.
 Do not ask follow-up questions.
 If the answer cannot be found in the context, respond "I don’t know."
@@ -63,41 +71,221 @@ If the answer cannot be found in the context, respond "I don’t know."
 Question: {query}
 Answer:
 """
-        .format(
-            context_blocks="\n---\n".join(context),
-            query=query
-        )
+
+
+# Instruction text before the first placeholder is identical on every call;
+# its key/values are computed once (see prefix_cache)
+PROMPT_PREFIX = PROMPT_TEMPLATE[:PROMPT_TEMPLATE.index("{context_blocks}")]
+
+
+def warm_up():
+    """
+    Load the model and prefill the answer prompt prefix ahead of the first query.
+    """
+    _lazy_load_llm()
+    if PREFIX_CACHE:
+        get_prefix_cache("reason", _llm, _tokenizer_llm, PROMPT_PREFIX)
+
+
+def _build_prompt(query: str, context: list[str]) -> str:
+    return PROMPT_TEMPLATE.format(
+        context_blocks="\n---\n".join(context),
+        query=query
     )
 
-    # Tokenize and move to model device
-    inputs = _tokenizer_llm(
-        prompt,
-        return_tensors="pt",
-        truncation=True,
-        padding=True
-    ).to(_llm.device)
-
-    # Setup stopping criteria
-    cues = [
-        " I think", "Let's", "Therefore", "Thus", "Because", "So,",
-        "Alright", "Remember", "I remember", "---"
-    ]
-    stopping_criteria = StoppingCriteriaList([StopOnQuestion(), StopOnCue(cues)])
-
-    # Generate
-    outputs = _llm.generate(
+
+def _encode_prompts(requests: list[tuple[str, list[str]]]) -> dict:
+    """
+    Model inputs for a batch of (query, context) pairs, reusing the cached
+    prompt prefix when PREFIX_CACHE is on.
+    """
+    prompts = [_build_prompt(q, c) for q, c in requests]
+    if PREFIX_CACHE:
+        cache = get_prefix_cache("reason", _llm, _tokenizer_llm, PROMPT_PREFIX)
+        return cache.build_inputs([p[len(PROMPT_PREFIX):] for p in prompts], truncation=True)
+    return encode_left_padded(_tokenizer_llm, prompts, _llm.device, truncation=True)
+
+
+def _generation_kwargs(inputs: dict) -> dict:
+    return dict(
         **inputs,
         max_new_tokens=512,
         pad_token_id=_tokenizer_llm.eos_token_id,
         no_repeat_ngram_size=3,
         early_stopping=True,
-        stopping_criteria=stopping_criteria
+        stopping_criteria=StoppingCriteriaList([
+            StopOnSequences(_tokenizer_llm, STOP_CUES, inputs["input_ids"].shape[-1])
+        ])
     )
 
-    # Decode and extract answer
-    full = _tokenizer_llm.decode(outputs[0], skip_special_tokens=True)
-    answer = full.split("Answer:", 1)[1].strip()
+
+def _prepare_generation(query: str, context: list[str]) -> dict:
+    """
+    Build the prompt and return the keyword arguments for `_llm.generate`.
+    """
+    # Ensure model & tokenizer loaded
+    _lazy_load_llm()
+    return _generation_kwargs(_encode_prompts([(query, context)]))
+
+
+def _clean_answer(generated: str) -> str:
+    """
+    Cut the generated text down to the answer itself.
+    """
+    # The model sometimes repeats the cue it was prompted with
+    answer = generated.split("Answer:", 1)[-1].strip()
     answer = answer.split("---", 1)[0].rstrip()
     if not answer.startswith("I don't"):
         answer = answer.split("I don't know", 1)[0].rstrip()
     return answer
+
+
+def _reason_batch(requests: list[tuple[str, list[str]]]) -> list[str]:
+    """
+    Answer several (query, context) pairs with one padded `generate` call.
+
+    Rows stop individually on the stop cues; only the new tokens of each
+    row are decoded.
+    """
+    _lazy_load_llm()
+    inputs = _encode_prompts(requests)
+    outputs = _llm.generate(**_generation_kwargs(inputs))
+    generated = _tokenizer_llm.batch_decode(
+        outputs[:, inputs["input_ids"].shape[-1]:], skip_special_tokens=True
+    )
+    return [_clean_answer(text) for text in generated]
+
+
+def reason(query: str, context: list[str]) -> str:
+    """
+    Generate an answer given the user query and retrieved context.
+
+    Concurrent calls are batched into one generate pass (see
+    GENERATION_MAX_BATCH / GENERATION_MAX_WAIT_MS).
+    """
+    _lazy_load_llm()
+    batcher = get_batcher("reason", _reason_batch)
+    if batcher is None:
+        return _reason_batch([(query, context)])[0]
+    return batcher.submit((query, context))
+
+
+class AnswerTrimmer:
+    """
+    Incremental version of the answer clean-up done by `reason` and the API.
+
+    Feed it generated text piece by piece; it returns the part that is safe
+    to show, holding back just enough characters to recognise a stop marker
+    ("---", "Question:", or a trailing "I don't know") split across pieces.
+    """
+
+    IDK = "I don't"
+
+    def __init__(self):
+        self.done = False
+        self._buffer = ""
+        self._started = False
+        self._markers = None
+
+    def feed(self, piece: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += piece
+        if not self._started:
+            self._buffer = self._buffer.lstrip()
+            # The model sometimes repeats the cue it was prompted with
+            if self._buffer.startswith("Answer:"):
+                self._buffer = self._buffer[len("Answer:"):].lstrip()
+            elif "Answer:".startswith(self._buffer):
+                return ""
+            # "I don't know" only ends the answer if it isn't the answer itself
+            if len(self._buffer) < len(self.IDK) and self.IDK.startswith(self._buffer):
+                return ""
+            self._markers = ["---", "Question:"]
+            if not self._buffer.startswith(self.IDK):
+                self._markers.append("I don't know")
+            self._started = True
+
+        cut = min((i for i in (self._buffer.find(m) for m in self._markers) if i != -1), default=-1)
+        if cut != -1:
+            self.done = True
+            out, self._buffer = self._buffer[:cut].rstrip(), ""
+            return out
+
+        holdback = max(len(m) for m in self._markers) - 1
+        safe = max(len(self._buffer) - holdback, 0)
+        out, self._buffer = self._buffer[:safe], self._buffer[safe:]
+        return out
+
+    def flush(self) -> str:
+        """
+        Return whatever is still held back once generation has finished.
+        """
+        if self.done:
+            return ""
+        self.done = True
+        out, self._buffer = self._buffer.rstrip(), ""
+        return out
+
+
+class StopOnEvent(StoppingCriteria):
+    """
+    Stop generation once `event` is set (e.g. the reader went away).
+    """
+    def __init__(self, event):
+        self.event = event
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.event.is_set()
+
+
+def reason_stream(query: str, context: list[str]) -> Iterator[str]:
+    """
+    Like `reason`, but yield the answer text as tokens are generated.
+    """
+    from transformers import TextIteratorStreamer
+
+    kwargs = _prepare_generation(query, context)
+    # A stalled generate raises queue.Empty here instead of blocking forever
+    streamer = TextIteratorStreamer(
+        _tokenizer_llm, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT
+    )
+    stop = threading.Event()
+    kwargs["streamer"] = streamer
+    kwargs["stopping_criteria"].append(StopOnEvent(stop))
+
+    errors = []
+    def generate():
+        try:
+            _llm.generate(**kwargs)
+        except BaseException as e:
+            # End the stream so the reader wakes up, then re-raise there
+            errors.append(e)
+            streamer.end()
+
+    worker = threading.Thread(target=generate, daemon=True)
+    worker.start()
+    trimmer = AnswerTrimmer()
+    stalled = False
+    try:
+        for piece in streamer:
+            text = trimmer.feed(piece)
+            if text:
+                yield text
+            if trimmer.done:
+                break
+        if errors:
+            raise errors[0]
+        tail = trimmer.flush()
+        if tail:
+            yield tail
+    except queue.Empty:
+        stalled = True
+        raise
+    finally:
+        # Also reached when the consumer stops early (client disconnect). A
+        # running generate stops at its next step; a stalled one may never
+        # get there, so the reader does not wait for it.
+        stop.set()
+        worker.join(timeout=0 if stalled else STREAM_TOKEN_TIMEOUT)
+        if worker.is_alive():
+            logger.warning("Streaming generate did not stop; leaving its thread to finish in the background")
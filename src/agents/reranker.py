@@ -0,0 +1,151 @@
+# reranker.py
+"""
+Second-stage reranking of retrieved chunks with a cross-encoder.
+
+The retriever over-fetches RERANK_CANDIDATES hits per query; a small
+cross-encoder (RERANK_MODEL, e.g. an MS MARCO MiniLM) then reads each
+(query, chunk) pair jointly and the best top_k by its score go to the
+reasoner. Pairs are scored in batches of RERANK_BATCH_SIZE on
+RERANK_DEVICE (CPU by default, so the GPU stays with the generation model).
+
+RERANK_BUDGET_MS bounds the time spent: before each batch the remaining
+batches are projected from the ones already scored, and once the budget
+would be exceeded the whole call falls back to the search engine's order.
+Scores within one call therefore always come from the same stage.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import torch
+
+from src.config import (
+    RERANK_MODEL,
+    RERANK_DEVICE,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_BUDGET_MS
+)
+from src.logger import logger
+
+# Lazy-loaded tokenizer and model references
+_tokenizer = None
+_model = None
+_load_lock = threading.Lock()
+
+_stats = {"calls": 0, "pairs": 0, "fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _lazy_load():
+    """
+    Load the cross-encoder on first use.
+    """
+    global _tokenizer, _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+                _tokenizer = AutoTokenizer.from_pretrained(RERANK_MODEL)
+                model = AutoModelForSequenceClassification.from_pretrained(RERANK_MODEL)
+                _model = model.to(RERANK_DEVICE).eval()
+                logger.info(f"Loaded reranker {RERANK_MODEL} on {RERANK_DEVICE}")
+
+
+def warm_up():
+    """
+    Load the cross-encoder ahead of the first query.
+    """
+    _lazy_load()
+
+
+def score_pairs(pairs: Sequence[Tuple[str, str]]) -> List[float]:
+    """
+    Cross-encoder relevance of each (query, text) pair (higher is better),
+    as a single batch.
+    """
+    _lazy_load()
+    inputs = _tokenizer(
+        [query for query, _ in pairs],
+        [text for _, text in pairs],
+        padding=True,
+        truncation="only_second",
+        max_length=RERANK_MAX_LENGTH,
+        return_tensors="pt",
+    ).to(RERANK_DEVICE)
+    with torch.no_grad():
+        logits = _model(**inputs).logits
+    # One relevance logit, or the "relevant" class of a two-way classifier
+    return logits[:, -1].float().tolist()
+
+
+def rerank_many(
+    queries: Sequence[str],
+    hit_lists: Sequence[List[Dict[str, Any]]],
+    top_k: int,
+    budget_ms: Optional[float] = None,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Reorder each query's hits by cross-encoder score and keep top_k.
+
+    :param queries: Query strings.
+    :param hit_lists: Candidate hits per query, in search engine order.
+    :param top_k: Hits kept per query.
+    :param budget_ms: Time allowed for scoring (default RERANK_BUDGET_MS;
+        0 = unbounded). When it would be exceeded, the first top_k hits of
+        every list are returned unchanged.
+    :return: One list of at most top_k hits per query; reranked hits carry
+        the cross-encoder score in "score".
+    """
+    budget_ms = RERANK_BUDGET_MS if budget_ms is None else budget_ms
+    pairs = [(i, j) for i, hits in enumerate(hit_lists) for j in range(len(hits))]
+    if not pairs:
+        return [list(hits[:top_k]) for hits in hit_lists]
+    # Similar lengths in a batch keep padding down
+    pairs.sort(key=lambda p: len(hit_lists[p[0]][p[1]].get("text") or ""))
+    _lazy_load()
+
+    scores: List[float] = []
+    start = time.perf_counter()
+    for batch_start in range(0, len(pairs), RERANK_BATCH_SIZE):
+        elapsed_ms = (time.perf_counter() - start) * 1e3
+        if budget_ms and batch_start:
+            per_pair_ms = elapsed_ms / batch_start
+            if elapsed_ms + per_pair_ms * (len(pairs) - batch_start) > budget_ms:
+                _record(len(scores), elapsed_ms, fallback=True)
+                logger.warning(
+                    f"Reranking over budget ({elapsed_ms:.0f} ms for {batch_start}/{len(pairs)} pairs, "
+                    f"budget {budget_ms:.0f} ms); keeping search order"
+                )
+                return [list(hits[:top_k]) for hits in hit_lists]
+        batch = pairs[batch_start:batch_start + RERANK_BATCH_SIZE]
+        scores.extend(score_pairs([(queries[i], hit_lists[i][j].get("text") or "") for i, j in batch]))
+    _record(len(scores), (time.perf_counter() - start) * 1e3, fallback=False)
+
+    results: List[List[Dict[str, Any]]] = [[] for _ in hit_lists]
+    for (i, j), score in zip(pairs, scores):
+        results[i].append({**hit_lists[i][j], "score": score})
+    return [sorted(hits, key=lambda h: h["score"], reverse=True)[:top_k] for hits in results]
+
+
+def _record(pairs: int, ms: float, fallback: bool) -> None:
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["pairs"] += pairs
+        _stats["fallbacks"] += fallback
+        _stats["total_ms"] += ms
+        _stats["max_ms"] = max(_stats["max_ms"], ms)
+
+
+def reranker_stats() -> Dict[str, float]:
+    """
+    Calls, scored pairs, budget fallbacks and mean/max time per call.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total_ms = stats.pop("total_ms")
+    stats["mean_ms"] = round(total_ms / stats["calls"], 1) if stats["calls"] else 0.0
+    stats["max_ms"] = round(stats["max_ms"], 1)
+    return stats
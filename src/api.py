@@ -1,10 +1,94 @@
 # api.py
+import asyncio
+import importlib
+import json
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from src.agents.executor import execute
+from src.agents.batcher import batcher_stats
+from src.config import (
+    INFERENCE_WORKERS,
+    INFERENCE_QUEUE_SIZE,
+    REQUEST_TIMEOUT,
+    RETRIEVAL_BACKEND,
+    WARMUP_ON_STARTUP
+)
+from src.inference_pool import InferencePool, QueueFullError
+from src.logger import logger
+from src.services.es_client import (
+    client_stats,
+    close_es_client,
+    close_async_es_client,
+    get_async_es_client
+)
+from src.services.local_index import local_index_stats
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Agentic RAG API")
+# Heavy plan/retrieve/reason work runs here so the event loop stays responsive
+inference_pool = InferencePool(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
+
+# Startup warm-up: pending -> running -> ready | failed ("skipped" when disabled)
+_warmup: Dict[str, Any] = {"state": "pending", "seconds": {}, "error": None}
+
+
+def _pipeline():
+    """
+    The agent pipeline (`src.agents.executor`). Imported on first use rather
+    than with the app, since it pulls in torch and transformers; normally the
+    startup warm-up imports it.
+    """
+    return importlib.import_module("src.agents.executor")
+
+
+def _stats_if_loaded(module: str, name: str) -> Dict[str, Any]:
+    """
+    `module.name()` if the module is already imported, else {} (so /health
+    never triggers the heavy imports itself).
+    """
+    loaded = sys.modules.get(module)
+    return getattr(loaded, name)() if loaded is not None else {}
+
+
+def _warm_up() -> None:
+    """
+    Import the pipeline and load its models (runs on a background thread).
+    """
+    try:
+        start = time.perf_counter()
+        pipeline = _pipeline()
+        seconds = {"import": round(time.perf_counter() - start, 2)}
+        seconds.update(pipeline.warm_up())
+        _warmup.update(state="ready", seconds=seconds)
+        logger.info(f"Warm-up complete in {sum(seconds.values()):.1f}s: {seconds}")
+    except Exception as e:
+        logger.exception("Warm-up failed; models will load on the first request")
+        _warmup.update(state="failed", error=str(e))
+
+
+def is_ready() -> bool:
+    return _warmup["state"] in ("ready", "skipped")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve right away; /ready reports when the models are loaded
+    if WARMUP_ON_STARTUP:
+        _warmup["state"] = "running"
+        threading.Thread(target=_warm_up, name="warmup", daemon=True).start()
+    else:
+        _warmup["state"] = "skipped"
+    yield
+    inference_pool.shutdown()
+    close_es_client()
+    await close_async_es_client()
+
+
+app = FastAPI(title="Agentic RAG API", lifespan=lifespan)
 
 # very permissive—lock down origins in production
 app.add_middleware(
@@ -33,39 +117,162 @@ def clean_text(text: str) -> str:
 class RAGModel:
     def generate_response(self, query: str):
         # The executor returns the final answer string
-        answer = execute(query)
+        answer = _pipeline().execute(query)
         # Return tuple (response, original question)
         return answer, query
 
+    def stream_response(self, query: str):
+        # Yields answer text pieces as the reasoner generates them
+        return _pipeline().execute_stream(query)
+
 
 rag_model = RAGModel()
+
+GREETINGS = ("hi", "hello", "hey", "hey there", "good morning", "good afternoon", "good evening")
+GREETING_RESPONSE = "Hello! How can I assist you today?"
+
+
+def extract_answer(raw: str) -> str:
+    """
+    Keep only the answer part of the model output and normalise whitespace.
+    """
+    # find the last “Answer:” in the returned text, and keep only what follows
+    if "Answer:" in raw:
+        answer = raw.split("Answer:", 1)[1]
+    else:
+        answer = raw
+    # Remove any trailing 'Question:' fragments
+    answer = answer.split("Question:", 1)[0]
+    # clean whitespace
+    clean = clean_text(answer)
+    clean += '.'
+    return clean
+
+
+def _sse(data: dict, event: str = None) -> str:
+    """
+    Format one Server-Sent Event frame.
+    """
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
 @app.post("/generate-response/")
 async def generate_response(query_model: QueryModel):
     # Handle simple greetings without invoking RAG
     greeting = query_model.query.strip().lower()
-    if greeting in ("hi", "hello", "hey", "hey there", "good morning", "good afternoon", "good evening"):
+    if greeting in GREETINGS:
         # return a friendly greeting
-        return {"response": "Hello! How can I assist you today?", "question": query_model.query}
+        return {"response": GREETING_RESPONSE, "question": query_model.query}
     
     try:
-        
-        raw, question = rag_model.generate_response(query_model.query)
-        # find the last “Answer:” in the returned text, and keep only what follows
-        if "Answer:" in raw:
-            answer = raw.split("Answer:", 1)[1]
-            
-        else:
-            answer = raw
-        # Remove any trailing 'Question:' fragments
-        answer = answer.split("Question:", 1)[0]
-        # clean whitespace
-        clean = answer.replace("\n", " ").replace("\t"," ")
-        clean = " ".join(clean.split())    
-        clean += '.'
-        return {"response": clean, "question": question}
+        raw, question = await inference_pool.run(
+            rag_model.generate_response, query_model.query, timeout=REQUEST_TIMEOUT
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Request timed out after {REQUEST_TIMEOUT}s")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {"response": extract_answer(raw), "question": question}
+
+
+@app.post("/generate-response/stream")
+async def generate_response_stream(query_model: QueryModel):
+    """
+    Stream the answer as Server-Sent Events.
+
+    Each generated piece is sent as `data: {"token": ...}`; the stream ends
+    with an `event: done` frame carrying the cleaned full response, or an
+    `event: error` frame if generation fails or times out.
+    """
+    query = query_model.query
+
+    if query.strip().lower() in GREETINGS:
+        async def greeting_events():
+            yield _sse({"token": GREETING_RESPONSE})
+            yield _sse({"response": GREETING_RESPONSE, "question": query}, event="done")
+        return StreamingResponse(greeting_events(), media_type="text/event-stream")
+
+    # Admission control happens before the response starts, so 429 still works
+    try:
+        tokens = inference_pool.stream(rag_model.stream_response, query, timeout=REQUEST_TIMEOUT)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    async def events():
+        pieces = []
+        try:
+            async for token in tokens:
+                pieces.append(token)
+                yield _sse({"token": token})
+        except asyncio.TimeoutError:
+            yield _sse({"detail": f"Request timed out after {REQUEST_TIMEOUT}s"}, event="error")
+            return
+        except Exception as e:
+            yield _sse({"detail": str(e)}, event="error")
+            return
+        yield _sse({"response": extract_answer("".join(pieces)), "question": query}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _elasticsearch_reachable() -> Optional[bool]:
+    # None when retrieval does not use the cluster; otherwise one quick try,
+    # without the client's retries and ES_REQUEST_TIMEOUT, so /health stays fast
+    if RETRIEVAL_BACKEND == "local":
+        return None
+    try:
+        client = get_async_es_client().options(request_timeout=1, max_retries=0, retry_on_timeout=False)
+        return bool(await client.ping())
+    except Exception:
+        return False
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe: 200 once the startup warm-up has loaded the models,
+    503 while it runs or if it failed.
+    """
+    body = {"ready": is_ready(), **_warmup}
+    if not body["ready"]:
+        return JSONResponse(body, status_code=503)
+    return body
+
+
+@app.get("/health")
+async def health():
+    # Served straight from the event loop, never queued behind inference
+    return {
+        "status": "ok",
+        "ready": is_ready(),
+        "warmup": dict(_warmup),
+        "inference": inference_pool.stats(),
+        "batching": batcher_stats(),
+        "planner": _stats_if_loaded("src.agents.planner", "planner_stats"),
+        "retrieval": {
+            "backend": RETRIEVAL_BACKEND,
+            **_stats_if_loaded("src.services.retriever", "retrieval_stats"),
+            **(local_index_stats() if RETRIEVAL_BACKEND == "local" else {}),
+        },
+        "elasticsearch": {
+            "reachable": await _elasticsearch_reachable(),
+            **client_stats(),
+        },
+        "caches": {
+            "embedding": _stats_if_loaded("src.agents.embedder", "embedding_cache_stats"),
+            "answer": _stats_if_loaded("src.agents.executor", "answer_cache_stats"),
+            "prompt_prefix": _stats_if_loaded("src.agents.prefix_cache", "prefix_cache_stats"),
+        },
+    }
+
 
 # # Entry point for local testing
 # if __name__ == "__main__":
@@ -9,32 +9,136 @@ load_dotenv(find_dotenv())
 ELASTIC_CONNECTION_URL = os.getenv("ELASTIC_CONNECTION_URL")  # e.g. "https://localhost:9200"
 ELASTIC_USERNAME = os.getenv("ELASTIC_USERNAME")
 ELASTIC_PASSWORD = os.getenv("ELASTIC_PASSWORD")
+ES_MAX_CONNECTIONS = int(os.getenv("ES_MAX_CONNECTIONS", 10))   # pooled keep-alive connections per node
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", 30))  # seconds per request
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", 3))
+ES_RETRY_ON_TIMEOUT = os.getenv("ES_RETRY_ON_TIMEOUT", "true").lower() in ("1", "true", "yes")
 
 # Documents directory
 # DOCS_FOLDER = os.getenv("DOCS_FOLDER", "./documents")  # Folder where txt files are stored
 # Get the absolute path to the project root (one level above `src`)
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 DOCS_FOLDER =  str(PROJECT_ROOT / "documents")
+# Comma-separated globs of files to load, e.g. "*.txt,papers/**/*.md"
+DOCS_PATTERNS = [p.strip() for p in os.getenv("DOCS_PATTERNS", "*.txt").split(",") if p.strip()]
+DOCS_MMAP_THRESHOLD = int(os.getenv("DOCS_MMAP_THRESHOLD", 8 * 1024 * 1024))  # bytes; larger files are memory-mapped, 0 = never
 
 
 # Elasticsearch index name
 INDEX_NAME = os.getenv("INDEX_NAME", "rag_docs")
+# Records which files/chunks are indexed, for incremental re-indexing
+INDEX_MANIFEST_PATH = os.getenv("INDEX_MANIFEST_PATH", str(PROJECT_ROOT / "index_manifest.json"))
+# Indexing pipeline (reader → chunker → embedder → writer)
+INDEX_QUEUE_SIZE = int(os.getenv("INDEX_QUEUE_SIZE", 512))        # items buffered between two stages
+INDEX_CHUNK_WORKERS = int(os.getenv("INDEX_CHUNK_WORKERS", 2))    # chunker threads
+INDEX_WRITE_THREADS = int(os.getenv("INDEX_WRITE_THREADS", 2))    # concurrent bulk requests (1 = streaming_bulk)
+INDEX_LOG_INTERVAL = float(os.getenv("INDEX_LOG_INTERVAL", 10))   # seconds between progress lines; 0 = summary only
+INDEX_MANIFEST_FLUSH_FILES = int(os.getenv("INDEX_MANIFEST_FLUSH_FILES", 200))          # finished files per manifest write
+INDEX_MANIFEST_FLUSH_SECONDS = float(os.getenv("INDEX_MANIFEST_FLUSH_SECONDS", 30))     # or at most this many seconds apart
 
 # Embedding configuration
 # Model to use for embedding locally (no external API key required)
 
 MODEL_NAME    = os.getenv("MODEL_NAME", "deepseek-ai/DeepSeek-R1-Distill-Llama-8B")
-EMBEDDING_DIMS = int(os.getenv("EMBEDDING_DIMS", 4096))  # Must match your model’s hidden size
+# "llm" = mean-pooled hidden states of MODEL_NAME (no extra weights, hidden_size
+# dims); "sentence-transformers" = the much smaller EMBEDDING_MODEL. Switching
+# backends needs a fresh index (python -m src.services.delete_index)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "llm").lower()
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_DIMS = int(os.getenv("EMBEDDING_DIMS", 0))  # 0 = the backend's native size; smaller truncates (sentence-transformers)
+# Vector storage in Elasticsearch: "float", "int8_hnsw" (int8-quantized HNSW
+# graph) or "byte" (int8 vectors, 4x smaller documents and bulk requests).
+# Changing it needs a fresh index
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float").lower()
+# Send byte vectors as hex strings (Elasticsearch 8.14+)
+VECTOR_HEX_ENCODING = os.getenv("VECTOR_HEX_ENCODING", "false").lower() in ("1", "true", "yes")
+# "none" or "int8" (dynamic int8 quantization of all linear layers; CPU-only
+# nodes). Applies to the shared weights, i.e. planner, reasoner and embedder
+QUANTIZATION_MODE = os.getenv("QUANTIZATION_MODE", "none").lower()
 # …
 
+# Corpus embedding (indexer): chunks are length-sorted within a window and
+# batched by padded-token budget; 0 tokens = size batches from free memory
+EMBED_SORT_WINDOW = int(os.getenv("EMBED_SORT_WINDOW", 1024))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", 64))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", 0))
+
+# Embedding cache (in-memory LRU, plus an optional memory-mapped disk tier)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))         # vectors in memory; 0 disables caching
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "")                   # empty = memory only
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", 100000))  # vectors on disk
+
 
 # Text chunking parameters
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 500))        # characters per chunk
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 100))  # overlap between chunks
+# "chars" = fixed character windows above; "tokens" = sentence-aligned chunks
+# of at most CHUNK_TOKENS model tokens (changing the mode re-embeds everything)
+CHUNK_MODE = os.getenv("CHUNK_MODE", "chars").lower()
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 128))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 24))
 
 # LLM (OpenAI) configuration (if used for reasoning)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 
+# Semantic answer cache in front of the executor
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 512))                 # answers kept; 0 disables
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.97))    # min cosine similarity for a hit
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))                # seconds
+# Touched by the indexer on every rebuild so cached answers are dropped
+INDEX_GENERATION_FILE = os.getenv("INDEX_GENERATION_FILE", str(PROJECT_ROOT / ".index_generation"))
+
+# Query planner: "auto" decomposes only queries that look complex (several
+# questions, comparisons, long), "llm" every query, "off" none
+PLANNER_MODE = os.getenv("PLANNER_MODE", "auto").lower()
+PLANNER_SIMPLE_MAX_WORDS = int(os.getenv("PLANNER_SIMPLE_MAX_WORDS", 20))  # longer queries count as complex
+PLANNER_MAX_SUBQUERIES = int(os.getenv("PLANNER_MAX_SUBQUERIES", 4))
+PLANNER_MAX_NEW_TOKENS = int(os.getenv("PLANNER_MAX_NEW_TOKENS", 128))
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", 1024))                 # plans kept; 0 disables
+
 # Retrieval parameters
 top_k = int(os.getenv("TOP_K", 5))  # number of chunks to retrieve per query
+# How the lexical (BM25) and vector legs are combined: "script_score" = one
+# bool query of match + knn with a min_score; "rrf" = separate searches (one
+# msearch) fused client-side by reciprocal rank
+HYBRID_MODE = os.getenv("HYBRID_MODE", "script_score").lower()
+RRF_K = int(os.getenv("RRF_K", 60))                            # rank constant
+RRF_WINDOW = int(os.getenv("RRF_WINDOW", 50))                  # candidates fetched per leg
+RRF_NUM_CANDIDATES = int(os.getenv("RRF_NUM_CANDIDATES", 100))  # kNN candidates per shard (>= RRF_WINDOW)
+# Optional cross-encoder rerank of over-fetched hits (see src/agents/reranker.py)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_DEVICE = os.getenv("RERANK_DEVICE", "cpu")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 20))    # hits fetched per query before reranking
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 16))    # (query, chunk) pairs per forward pass
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 256))   # tokens per pair
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 300))   # search order is kept beyond this; 0 = no limit
+# "elasticsearch" or "local" (in-process vector + BM25 index in LOCAL_INDEX_DIR,
+# written by the indexer; no Elasticsearch needed)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "elasticsearch").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", str(PROJECT_ROOT / "local_index"))
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_INDEX_DTYPE", "float16")                # float16 | float32 vector storage
+LOCAL_INDEX_ANN_MIN_DOCS = int(os.getenv("LOCAL_INDEX_ANN_MIN_DOCS", 20000))  # smaller indexes are searched exactly
+LOCAL_INDEX_NLIST = int(os.getenv("LOCAL_INDEX_NLIST", 0))                    # IVF lists; 0 = 2 * sqrt(chunks)
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", 16))                 # lists scanned per query
+# Token budget for the deduplicated, merged context passed to the reasoner
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 3000))
+
+# Dynamic batching of concurrent plan/reason generate calls
+GENERATION_MAX_BATCH = int(os.getenv("GENERATION_MAX_BATCH", 4))          # 1 disables batching
+GENERATION_MAX_WAIT_MS = float(os.getenv("GENERATION_MAX_WAIT_MS", 15))  # how long a request waits for others
+
+# Reuse the key/values of the fixed planner/reasoner prompt prefixes
+PREFIX_CACHE = os.getenv("PREFIX_CACHE", "true").lower() in ("1", "true", "yes")
+# Batches whose per-request suffix is longer are prefilled in full (0 = no limit)
+PREFIX_CACHE_MAX_SUFFIX_TOKENS = int(os.getenv("PREFIX_CACHE_MAX_SUFFIX_TOKENS", 1024))
+
+# Load models in the background when the API starts (GET /ready reports progress)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# API inference pool
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 4))         # concurrent requests; >= GENERATION_MAX_BATCH so batches can fill
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 8))   # extra requests allowed to wait (429 beyond)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 300))        # seconds before a request returns 504
+STREAM_TOKEN_TIMEOUT = float(os.getenv("STREAM_TOKEN_TIMEOUT", 120))  # max seconds between streamed tokens
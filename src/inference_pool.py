@@ -0,0 +1,168 @@
+# inference_pool.py
+"""
+Bounded worker pool that keeps blocking model inference off the event loop.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Optional
+
+# Marks the end of a streamed result
+_END = object()
+
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when the pool already holds as many requests as it will accept.
+    """
+
+
+class InferencePool:
+    """
+    Run blocking callables on a fixed set of worker threads.
+
+    At most `max_workers` calls run at once and at most `max_queue` more wait
+    for a worker; anything beyond that is rejected with QueueFullError so the
+    API can answer 429 instead of piling up work. Threads (not processes) are
+    used so all workers share the single copy of the model weights.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        if max_workers <= 0:
+            raise ValueError("max_workers must be positive.")
+        if max_queue < 0:
+            raise ValueError("max_queue must be non-negative.")
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                raise QueueFullError(
+                    f"Inference queue is full ({self._in_flight} requests in flight)."
+                )
+            self._in_flight += 1
+            self._stats["submitted"] += 1
+
+    def _release(self, future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._stats["failed"] += 1
+            else:
+                self._stats["completed"] += 1
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run `fn(*args)` on a worker and await its result.
+
+        :raises QueueFullError: if the pool is saturated.
+        :raises asyncio.TimeoutError: if the call takes longer than `timeout`.
+        """
+        self._acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        # The slot is freed when the work really finishes, not when the caller
+        # gives up, so timed-out generations still count against capacity.
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timed_out"] += 1
+            raise
+
+    def stream(
+        self, fn: Callable[..., Iterable[Any]], *args, timeout: Optional[float] = None
+    ) -> AsyncIterator[Any]:
+        """
+        Iterate `fn(*args)` on a worker and return an async iterator of its items.
+
+        Admission happens here, before the first item, so QueueFullError can
+        still become a 429. `timeout` bounds the whole stream; if the consumer
+        stops early, the worker closes the underlying iterator at the next item.
+        """
+        self._acquire()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # Event loop already closed; nobody is listening any more
+                cancelled.set()
+
+        def produce():
+            error, items = None, None
+            try:
+                items = fn(*args)
+                for item in items:
+                    if cancelled.is_set():
+                        break
+                    put(item)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                close = getattr(items, "close", None)
+                if close is not None:
+                    close()
+                put(_END, error)
+
+        try:
+            future = self._executor.submit(produce)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        async def consume():
+            deadline = None if timeout is None else loop.time() + timeout
+            try:
+                while True:
+                    remaining = None if deadline is None else deadline - loop.time()
+                    try:
+                        item, error = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        with self._lock:
+                            self._stats["timed_out"] += 1
+                        raise
+                    if item is _END:
+                        if error is not None:
+                            raise error
+                        return
+                    yield item
+            finally:
+                cancelled.set()
+
+        return consume()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Current queue depth plus lifetime counters.
+        """
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                **self._stats,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,18 +1,40 @@
 # src/services/__init__.py
+"""
+Document ingestion, indexing and retrieval services.
 
-# document ingestion & partitioning
-from .docs_loader  import load_documents
-from .sectioner    import split_into_sections
+Names are imported from their submodules on first access (PEP 562), so
+e.g. `delete_index` does not import the embedding model's dependencies.
+"""
 
-# external‑system wrappers
-from .indexer      import index_documents
-from .retriever    import retrieve
+from importlib import import_module
+
+# public name -> submodule that defines it
+_EXPORTS = {
+    # document ingestion & partitioning
+    "load_documents": ".docs_loader",
+    "iter_documents": ".docs_loader",
+    "split_into_sections": ".sectioner",
+    # external‑system wrappers
+    "index_documents": ".indexer",
+    "retrieve": ".retriever",
+    "retrieve_many": ".retriever",
+}
+
+# Imported eagerly: the submodule has the same name, so importing it would
+# otherwise leave the module, not the function, as `src.services.delete_index`.
+# It needs neither torch nor transformers.
 from .delete_index import delete_index
 
-__all__ = [
-    "load_documents",
-    "split_into_sections",
-    "index_documents",
-    "retrieve",
-    "delete_index",
-]
+__all__ = list(_EXPORTS) + ["delete_index"]
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -6,25 +6,31 @@ if __name__ == "__main__" and __package__ is None:
 # Add project root (parent of src/) to sys.path so 'src' is recognized
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-from elasticsearch import Elasticsearch
-from src.config import (
-    ELASTIC_CONNECTION_URL,
-    ELASTIC_USERNAME,
-    ELASTIC_PASSWORD,
-    INDEX_NAME
-)
+from src.config import INDEX_NAME, INDEX_GENERATION_FILE, INDEX_MANIFEST_PATH, RETRIEVAL_BACKEND
+from src.services.es_client import get_es_client
+from src.services.local_index import get_local_index
+from src.services.index_manifest import reset_manifest
+from src.agents.answer_cache import mark_index_rebuilt
 
 def delete_index():
+    if RETRIEVAL_BACKEND == "local":
+        local_index = get_local_index()
+        if local_index.drop():
+            reset_manifest(INDEX_MANIFEST_PATH)
+            mark_index_rebuilt(INDEX_GENERATION_FILE)
+            print(f"Deleted local index '{local_index.folder}'.")
+        else:
+            print(f"Local index '{local_index.folder}' does not exist.")
+        return
+
     # Connect to Elasticsearch
-    es = Elasticsearch(
-        [ELASTIC_CONNECTION_URL],
-        http_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
-        verify_certs=False
-    )
+    es = get_es_client()
 
     # Delete the index if it exists
     if es.indices.exists(index=INDEX_NAME):
         es.indices.delete(index=INDEX_NAME)
+        reset_manifest(INDEX_MANIFEST_PATH)
+        mark_index_rebuilt(INDEX_GENERATION_FILE)
         print(f"Deleted index '{INDEX_NAME}'.")
     else:
         print(f"Index '{INDEX_NAME}' does not exist.")
@@ -1,42 +1,99 @@
 # docs_loader.py
 
-import os
+import codecs
+import hashlib
+import mmap
 from pathlib import Path
-from typing import List, Dict
-from src.config import DOCS_FOLDER
+from typing import Dict, Iterator, List, Optional, Sequence
+from src.config import DOCS_FOLDER, DOCS_PATTERNS, DOCS_MMAP_THRESHOLD
 from .sectioner import split_into_sections
 
 
-def load_documents(folder: str = DOCS_FOLDER) -> List[Dict[str, str]]:
+def in_shard(rel_path: str, shard: int, num_shards: int) -> bool:
     """
-    Recursively read all .txt files under `folder`, split into sections,
-    and return a list of dicts:
+    Stable assignment of a file to one of `num_shards` workers, by path hash.
+    """
+    if num_shards <= 1:
+        return True
+    digest = hashlib.sha1(rel_path.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards == shard
+
+
+def _read_text(path: Path) -> str:
+    """
+    Read a UTF-8 file; files above DOCS_MMAP_THRESHOLD bytes are decoded
+    straight from a memory map instead of first being copied into a bytes object.
+    """
+    size = path.stat().st_size
+    if not DOCS_MMAP_THRESHOLD or size < DOCS_MMAP_THRESHOLD:
+        return path.read_text(encoding="utf-8")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text, _ = codecs.utf_8_decode(mm, "strict", True)
+    return text
+
+
+def _iter_files(base: Path, patterns: Sequence[str]) -> Iterator[Path]:
+    seen = set()
+    for pattern in patterns:
+        # Bare patterns ("*.txt") match at any depth; patterns with a
+        # directory part ("papers/**/*.txt") are relative to `base`
+        matches = base.glob(pattern) if "/" in pattern else base.rglob(pattern)
+        for path in sorted(matches):
+            if path not in seen and path.is_file():
+                seen.add(path)
+                yield path
+
+
+def iter_documents(
+    folder: str = DOCS_FOLDER,
+    patterns: Optional[Sequence[str]] = None,
+    shard: int = 0,
+    num_shards: int = 1,
+) -> Iterator[Dict[str, str]]:
+    """
+    Lazily yield the sections of every matching file under `folder`, one file
+    at a time, as dicts:
       {
         'file_path': relative path from `folder`,
         'section': section name (e.g., 'INTRODUCTION', 'METHODS', 'FULL_TEXT'),
         'text': section text
       }
+
+    :param patterns: File globs to include (default DOCS_PATTERNS, i.e. "*.txt").
+    :param shard: Index of this worker when the corpus is split across workers.
+    :param num_shards: Number of workers; each file belongs to exactly one shard.
     """
-    documents: List[Dict[str, str]] = []
+    if not 0 <= shard < max(num_shards, 1):
+        raise ValueError("shard must be in range(num_shards).")
     base = Path(folder)
 
-    for txt_file in base.rglob("*.txt"):
+    for txt_file in _iter_files(base, patterns or DOCS_PATTERNS):
+        rel_path = str(txt_file.relative_to(base))
+        if not in_shard(rel_path, shard, num_shards):
+            continue
         try:
-            raw_text = txt_file.read_text(encoding="utf-8")
-            rel_path = txt_file.relative_to(base)
+            raw_text = _read_text(txt_file)
             # Split into sections (fallback to FULL_TEXT if no headings)
             sections = split_into_sections(raw_text)
-            for section_name, section_text in sections:
-                if section_text:
-                    documents.append({
-                        "file_path": str(rel_path),
-                        "section": section_name,
-                        "text": section_text
-                    })
         except Exception as e:
             print(f"⚠️ Could not process {txt_file}: {e}")
+            continue
+        for section_name, section_text in sections:
+            if section_text:
+                yield {
+                    "file_path": rel_path,
+                    "section": section_name,
+                    "text": section_text
+                }
 
-    return documents
+
+def load_documents(folder: str = DOCS_FOLDER, **kwargs) -> List[Dict[str, str]]:
+    """
+    Recursively read all .txt files under `folder`, split into sections,
+    and return them as a list (see `iter_documents`, which takes the same
+    filter and sharding arguments and does not hold the corpus in memory).
+    """
+    return list(iter_documents(folder, **kwargs))
 
 
 # if __name__ == "__main__":
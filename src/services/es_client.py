@@ -0,0 +1,116 @@
+# es_client.py
+"""
+Process-wide Elasticsearch clients shared by the retriever, indexer and API.
+
+The clients are created once and reused: their urllib3/aiohttp pools keep
+HTTP/1.1 connections alive between requests, so queries stop paying for a
+new client, connection pool and TLS handshake each time.
+"""
+
+import threading
+from typing import Any, Dict
+
+from elasticsearch import Elasticsearch
+from .vector_codec import VectorJsonSerializer
+from src.config import (
+    ELASTIC_CONNECTION_URL,
+    ELASTIC_USERNAME,
+    ELASTIC_PASSWORD,
+    ES_MAX_CONNECTIONS,
+    ES_REQUEST_TIMEOUT,
+    ES_MAX_RETRIES,
+    ES_RETRY_ON_TIMEOUT
+)
+
+_client = None
+_async_client = None
+_lock = threading.Lock()
+_stats = {"created": 0, "reused": 0, "async_created": 0, "async_reused": 0}
+
+
+def _client_kwargs() -> Dict[str, Any]:
+    return dict(
+        basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
+        verify_certs=False,
+        connections_per_node=ES_MAX_CONNECTIONS,
+        request_timeout=ES_REQUEST_TIMEOUT,
+        max_retries=ES_MAX_RETRIES,
+        retry_on_timeout=ES_RETRY_ON_TIMEOUT,
+        # Writes NumPy chunk vectors compactly into bulk bodies
+        serializers={"application/json": VectorJsonSerializer()}
+    )
+
+
+def get_es_client() -> Elasticsearch:
+    """
+    Return the shared, thread-safe Elasticsearch client, creating it on first use.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = Elasticsearch([ELASTIC_CONNECTION_URL], **_client_kwargs())
+            _stats["created"] += 1
+        else:
+            _stats["reused"] += 1
+        return _client
+
+
+def get_async_es_client():
+    """
+    Return the shared AsyncElasticsearch client for use on the API event loop.
+
+    Requires the optional `aiohttp` dependency.
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            from elasticsearch import AsyncElasticsearch
+
+            _async_client = AsyncElasticsearch([ELASTIC_CONNECTION_URL], **_client_kwargs())
+            _stats["async_created"] += 1
+        else:
+            _stats["async_reused"] += 1
+        return _async_client
+
+
+def client_stats() -> Dict[str, Any]:
+    """
+    Client reuse counters plus, per node, how many HTTP requests were served
+    over how many TCP connections (requests > connections means keep-alive reuse).
+    """
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+        client = _client
+    nodes = []
+    if client is not None:
+        for node in client.transport.node_pool.all():
+            pool = getattr(node, "pool", None)
+            nodes.append({
+                "node": str(node.base_url),
+                "connections_opened": getattr(pool, "num_connections", None),
+                "requests": getattr(pool, "num_requests", None),
+            })
+    stats["nodes"] = nodes
+    return stats
+
+
+def close_es_client() -> None:
+    """
+    Close the shared sync client (e.g. on API shutdown).
+    """
+    global _client
+    with _lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+async def close_async_es_client() -> None:
+    """
+    Close the shared async client (e.g. on API shutdown).
+    """
+    global _async_client
+    with _lock:
+        client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
@@ -0,0 +1,31 @@
+# fusion.py
+"""
+Reciprocal rank fusion (RRF) of ranked result lists.
+
+Each list contributes 1 / (k + rank) to every document it contains, so the
+lexical and vector legs of a hybrid search are combined by rank alone and
+their incomparable score scales (unbounded BM25 vs. bounded similarity)
+never meet. Documents found by both legs rise to the top.
+"""
+
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+from src.config import RRF_K
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Hashable]],
+    k: int = RRF_K,
+) -> List[Tuple[Hashable, float]]:
+    """
+    Fuse ranked lists of document keys, best first.
+
+    :param rankings: One list of keys per leg, each ordered best first.
+    :param k: Rank constant; larger values flatten the head of each list.
+    :return: (key, fused score) pairs sorted by score (ties keep first-seen order).
+    """
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,81 @@
+# index_manifest.py
+"""
+Deterministic chunk IDs and the manifest of what has been indexed.
+
+The manifest maps each indexed file to the hash of its content and the IDs
+of its chunks in Elasticsearch, so the indexer can skip unchanged files,
+embed only new or changed chunks, and delete chunks that disappeared.
+"""
+
+import glob
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable
+
+
+def chunk_doc_id(file_path: str, section: str, chunk_id: int, text: str) -> str:
+    """
+    Stable Elasticsearch `_id` for a chunk: re-indexing identical content
+    overwrites the same document instead of adding a duplicate.
+    """
+    content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    key = f"{file_path}\x1f{section}\x1f{chunk_id}\x1f{content_hash}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def sections_hash(sections: Iterable[Dict[str, str]]) -> str:
+    """
+    Hash of a file's sections (names and text), as produced by the loader.
+    """
+    digest = hashlib.sha1()
+    for doc in sections:
+        digest.update(doc["section"].encode("utf-8") + b"\x1f")
+        digest.update(doc["text"].encode("utf-8") + b"\x1e")
+    return digest.hexdigest()
+
+
+def shard_manifest_path(path: str, shard: int, num_shards: int) -> str:
+    """
+    Manifest file of one shard when indexing is split across workers, so
+    concurrent indexers never overwrite each other's manifest.
+    """
+    if num_shards <= 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{shard}-of-{num_shards}{ext}"
+
+
+def load_manifest(path: str, index_name: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Return the per-file manifest for `index_name`, or an empty one if the
+    file is missing or describes a different index.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("index") != index_name:
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(path: str, index_name: str, files: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Atomically write the manifest (a crash never leaves a truncated file).
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"index": index_name, "files": files}, f)
+    os.replace(tmp_path, path)
+
+
+def reset_manifest(path: str) -> None:
+    """
+    Forget everything indexed so far (call when the index is created or
+    deleted), including the manifests of sharded runs.
+    """
+    root, ext = os.path.splitext(path)
+    for manifest in [path, *glob.glob(f"{glob.escape(root)}.shard*-of-*{ext}")]:
+        if os.path.exists(manifest):
+            os.remove(manifest)
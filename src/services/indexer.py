@@ -8,23 +8,41 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..",
 
 import os
 import logging
+import argparse
+import threading
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk, BulkIndexError
-from tqdm import tqdm
+from elasticsearch.helpers import bulk, parallel_bulk, streaming_bulk
 from src.config import (
-    ELASTIC_CONNECTION_URL,
-    ELASTIC_USERNAME,
-    ELASTIC_PASSWORD,
     INDEX_NAME,
-    EMBEDDING_DIMS,
-    DOCS_FOLDER
+    DOCS_FOLDER,
+    INDEX_GENERATION_FILE,
+    INDEX_MANIFEST_PATH,
+    INDEX_QUEUE_SIZE,
+    INDEX_CHUNK_WORKERS,
+    INDEX_WRITE_THREADS,
+    INDEX_LOG_INTERVAL,
+    INDEX_MANIFEST_FLUSH_FILES,
+    INDEX_MANIFEST_FLUSH_SECONDS,
+    RETRIEVAL_BACKEND
 )
-from .docs_loader import load_documents
-from src.agents.chunker import chunk_text
-from src.agents.embedder import embed_texts
+from .docs_loader import iter_documents
+from .es_client import get_es_client
+from .local_index import LocalIndex, get_local_index
+from .pipeline import Pipeline
+from .vector_codec import VECTOR_STORAGE, to_stored, vector_mapping
+from .index_manifest import (
+    chunk_doc_id, sections_hash, load_manifest, save_manifest, reset_manifest, shard_manifest_path
+)
+from src.agents.chunker import chunk_document
+from src.agents.embedder import embed_corpus, embedding_dims
+from src.agents.embedding_backends import get_backend
+from src.agents.answer_cache import mark_index_rebuilt
 
-# Batch size to avoid OOM: embed this many chunks at a time
-BATCH_SIZE = 16
+# Chunks per bulk request (embedding batch sizes adapt separately, see embed_corpus)
+BULK_SIZE = 256
 
 # Configure logging
 logging.basicConfig(
@@ -33,103 +51,361 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def create_index(es: Elasticsearch):
+def create_index(es: Union[Elasticsearch, LocalIndex]):
     """
     Create the Elasticsearch index with mapping for dense vectors and metadata.
+
+    The vector size and the embedding model come from the configured
+    embedding backend; an existing index built for another model is
+    refused, since its vectors cannot be compared with new queries.
+    `es` may also be the local index (RETRIEVAL_BACKEND=local).
     """
+    backend = get_backend()
+    dims = embedding_dims()
+    meta = {
+        "embedding_backend": backend.name,
+        "embedding_model": backend.model_id,
+        "embedding_dims": dims,
+        "vector_storage": VECTOR_STORAGE,
+    }
+    if isinstance(es, LocalIndex):
+        if es.create(meta):
+            reset_manifest(INDEX_MANIFEST_PATH)
+            logger.info(f"Created local index in '{es.folder}'.")
+        else:
+            logger.info(f"Local index in '{es.folder}' already exists.")
+        return
     mapping = {
         "mappings": {
+            "_meta": meta,
             "properties": {
                 "file_path": {"type": "keyword"},
                 "section":   {"type": "keyword"},
                 "chunk_id":  {"type": "integer"},
                 "text":      {"type": "text"},
-                "vector":    {"type": "dense_vector", "dims": EMBEDDING_DIMS}
+                "vector":    vector_mapping(dims)
             }
         }
     }
     if es.indices.exists(index=INDEX_NAME):
+        existing = es.indices.get_mapping(index=INDEX_NAME)[INDEX_NAME]["mappings"]
+        existing_dims = existing.get("properties", {}).get("vector", {}).get("dims")
+        # Indexes created before the backend was recorded have no _meta
+        existing_model = existing.get("_meta", {}).get("embedding_model", backend.model_id)
+        existing_storage = existing.get("_meta", {}).get("vector_storage", "float")
+        if existing_dims != dims or existing_model != backend.model_id or existing_storage != VECTOR_STORAGE:
+            raise ValueError(
+                f"Index '{INDEX_NAME}' holds {existing_dims}-dim {existing_storage} vectors of "
+                f"{existing_model}, but the {backend.name} backend produces {dims}-dim vectors of "
+                f"{backend.model_id} stored as {VECTOR_STORAGE}. "
+                f"Delete the index (python -m src.services.delete_index) and re-index."
+            )
         logger.info(f"Index '{INDEX_NAME}' already exists.")
     else:
         es.indices.create(index=INDEX_NAME, body=mapping)
+        # A fresh index holds nothing, whatever an old manifest says
+        reset_manifest(INDEX_MANIFEST_PATH)
         logger.info(f"Created index '{INDEX_NAME}'.")
 
 
-def index_documents(es: Elasticsearch):
+def _write_stream(es: Elasticsearch, actions: Iterable[Dict[str, Any]]) -> Iterator[Tuple[bool, Dict[str, Any]]]:
     """
-    Load documents, chunk and embed them in small batches, then index with robust error handling.
+    Send `actions` in bulk requests of BULK_SIZE, yielding (ok, item) per action.
+
+    Uses `parallel_bulk` with INDEX_WRITE_THREADS concurrent requests, or
+    `streaming_bulk` for a single writer. Failures are yielded, not raised.
+    The local index applies the actions in process.
     """
-    docs = load_documents(DOCS_FOLDER)
-    total_docs = len(docs)
-    print(total_docs)
-    logger.info(f"Starting indexing of {total_docs} document sections...")
-
-    for idx, doc in enumerate(tqdm(docs, desc="Indexing documents"), start=1):
-        file_path = doc["file_path"]
-        section = doc["section"]
-        text = doc["text"]
-        chunks = chunk_text(text)
-        logger.info(f"[{idx}/{total_docs}] '{file_path}' - section '{section}' with {len(chunks)} chunks")
-
-        # Prepare actions per document
-        actions = []
-        for start in range(0, len(chunks), BATCH_SIZE):
-            end = min(start + BATCH_SIZE, len(chunks))
-            batch_chunks = chunks[start:end]
-            logger.info(f"  Embedding batch {start}:{end} on device")
-            try:
-                vectors = embed_texts(batch_chunks)
-            except Exception as e:
-                logger.error(f"Embedding failed for {file_path} section {section} batch {start}-{end}: {e}")
-                continue
+    if isinstance(es, LocalIndex):
+        return es.bulk(actions)
+    if INDEX_WRITE_THREADS > 1:
+        return parallel_bulk(
+            es, actions, thread_count=INDEX_WRITE_THREADS, chunk_size=BULK_SIZE,
+            queue_size=INDEX_WRITE_THREADS, raise_on_error=False, raise_on_exception=False
+        )
+    return streaming_bulk(es, actions, chunk_size=BULK_SIZE, raise_on_error=False, raise_on_exception=False)
+
 
-            for offset, (chunk_text_item, vector) in enumerate(zip(batch_chunks, vectors), start=start):
-                actions.append({
-                    "_index": INDEX_NAME,
-                    "_source": {
-                        "file_path": file_path,
-                        "section": section,
-                        "chunk_id": offset,
-                        "text": chunk_text_item,
-                        "vector": vector
-                    }
-                })
-
-        if not actions:
-            logger.warning(f"No chunks to index for {file_path} section {section}")
-            continue
-
-        # Try bulk indexing
+def _index_one(es: Elasticsearch, action: Dict[str, Any]) -> bool:
+    """
+    Fallback for an action the bulk request rejected: index it on its own.
+    """
+    try:
+        if isinstance(es, LocalIndex):
+            ok, item = next(es.bulk([action]))
+            if not ok:
+                raise ValueError(item["index"]["error"])
+            return True
+        es.index(index=action["_index"], id=action["_id"], document=action["_source"])
+        return True
+    except Exception as e:
+        src = action["_source"]
+        logger.error(
+            f"Failed to index chunk {src['chunk_id']} of '{src['file_path']}' section '{src['section']}': {e}"
+        )
+        return False
+
+
+def _delete_chunks(es: Elasticsearch, ids: Iterable[str]) -> int:
+    """
+    Delete chunks by ID; IDs that are already gone are ignored.
+    """
+    if isinstance(es, LocalIndex):
+        return es.delete(ids)
+    actions = [{"_op_type": "delete", "_index": INDEX_NAME, "_id": doc_id} for doc_id in ids]
+    if not actions:
+        return 0
+    success, _ = bulk(es, actions, stats_only=True, raise_on_error=False)
+    return success
+
+
+def index_documents(
+    es: Elasticsearch,
+    incremental: bool = True,
+    patterns: Optional[Sequence[str]] = None,
+    shard: int = 0,
+    num_shards: int = 1,
+):
+    """
+    Load, chunk, embed and index documents as a pipeline of concurrent stages.
+
+    Chunks get deterministic IDs (file path + section + chunk_id + content
+    hash), so re-running never duplicates documents. With `incremental`,
+    files whose content matches the manifest are skipped and only new or
+    changed chunks are embedded; otherwise every chunk is re-embedded and
+    overwritten. In both modes chunks of changed or removed files that no
+    longer exist are deleted.
+
+    Stages (reader → chunker → embedder → writer) run on their own threads,
+    connected by queues of INDEX_QUEUE_SIZE, so Elasticsearch writes overlap
+    with embedding. The embedder batches similar-length chunks across
+    documents (see `embed_corpus`); the writer streams bulk requests.
+
+    Documents are streamed from disk (see `iter_documents`); `patterns`
+    restricts which files are read and `shard`/`num_shards` let several
+    indexer processes split the corpus, each with its own manifest.
+
+    `es` may instead be the local index (RETRIEVAL_BACKEND=local), which
+    collects the chunks in process and is saved to disk at the end.
+    """
+    local = isinstance(es, LocalIndex)
+    if local and num_shards > 1:
+        # One process rebuilds and saves the whole local index
+        raise ValueError("The local index cannot be built by several sharded indexers.")
+    manifest_path = shard_manifest_path(INDEX_MANIFEST_PATH, shard, num_shards)
+    manifest = load_manifest(manifest_path, INDEX_NAME)
+    if local:
+        # A run that died before saving the local index left the manifest
+        # ahead of it; re-index whatever the saved index is missing
+        for entry in manifest.values():
+            present = [i for i in entry["chunks"] if es.contains(i)]
+            if len(present) != len(entry["chunks"]):
+                entry["chunks"], entry["complete"] = present, False
+    logger.info(
+        f"Starting {'incremental' if incremental else 'full'} indexing of '{DOCS_FOLDER}'"
+        + (f" (shard {shard} of {num_shards})" if num_shards > 1 else "") + "..."
+    )
+    counts = {"files": 0, "skipped_files": 0, "embedded": 0, "kept": 0, "deleted": 0}
+    seen: Set[str] = set()
+
+    # Per-file bookkeeping until every pending chunk of the file is written;
+    # shared by the chunker and writer threads
+    progress: Dict[str, Dict[str, Any]] = {}
+    lock = threading.Lock()
+    # Finished files are recorded in memory; their stale chunks are deleted
+    # and the manifest written in batches by `flush`, outside `lock`
+    stale: List[str] = []
+    unflushed = {"files": 0, "since": time.monotonic()}
+    flush_lock = threading.Lock()
+
+    def finish_file(file_path: str) -> None:
+        # Called with `lock` held
+        state = progress.pop(file_path)
+        stale.extend(state["previous"] - set(state["current"]))
+        # Record what is really in the index; incomplete files are retried next run
+        done = [
+            i for i in state["current"]
+            if i in state["indexed"] or (i in state["previous"] and i not in state["pending"])
+        ]
+        manifest[file_path] = {
+            "sha1": state["sha1"],
+            "chunks": done,
+            "complete": len(done) == len(state["current"]),
+        }
+        unflushed["files"] += 1
+
+    def flush(force: bool = False) -> None:
+        # Stale chunks go before the manifest that no longer lists them, so
+        # an interrupted run never forgets chunks still in the index. A stage
+        # never waits for another one's flush.
+        if not flush_lock.acquire(blocking=force):
+            return
         try:
-            logger.info(f"  Bulk indexing {len(actions)} chunks for this section")
-            success, failed = bulk(es, actions, stats_only=True)
-            logger.info(f"  Bulk indexed {success} docs, {failed} failures")
-            if failed > 0:
-                raise BulkIndexError(f"{failed} docs failed to index", [])
-        except BulkIndexError as bulk_err:
-            logger.error(f"BulkIndexError in '{file_path}' section '{section}': {bulk_err}")
-            # Fallback: index one by one
+            with lock:
+                due = unflushed["files"] >= INDEX_MANIFEST_FLUSH_FILES or (
+                    unflushed["files"] and time.monotonic() - unflushed["since"] >= INDEX_MANIFEST_FLUSH_SECONDS
+                )
+                if not (due or force):
+                    return
+                ids, snapshot = stale[:], dict(manifest)
+                stale.clear()
+                unflushed.update(files=0, since=time.monotonic())
+            deleted = _delete_chunks(es, ids)
+            with lock:
+                counts["deleted"] += deleted
+            save_manifest(manifest_path, INDEX_NAME, snapshot)
+        finally:
+            flush_lock.release()
+
+    def read_files():
+        # Sections of a file arrive together from the loader
+        documents = iter_documents(DOCS_FOLDER, patterns=patterns, shard=shard, num_shards=num_shards)
+        for file_path, sections in groupby(documents, key=itemgetter("file_path")):
+            yield file_path, list(sections)
+
+    def chunk_files(files):
+        for file_path, sections in files:
+            content_hash = sections_hash(sections)
+            with lock:
+                seen.add(file_path)
+                counts["files"] += 1
+                entry = manifest.get(file_path)
+                if incremental and entry and entry["sha1"] == content_hash and entry["complete"]:
+                    counts["skipped_files"] += 1
+                    continue
+                previous = set(entry["chunks"]) if entry else set()
+                state = progress[file_path] = {
+                    "sha1": content_hash, "previous": previous, "current": [],
+                    "pending": set(), "indexed": set(), "outstanding": 0, "planned": False,
+                }
+            chunks = []
+            for doc in sections:
+                for chunk_id, chunk in enumerate(chunk_document(doc["text"])):
+                    doc_id = chunk_doc_id(file_path, doc["section"], chunk_id, chunk)
+                    state["current"].append(doc_id)
+                    if incremental and doc_id in previous:
+                        continue
+                    chunks.append({
+                        "id": doc_id, "file_path": file_path, "section": doc["section"],
+                        "chunk_id": chunk_id, "text": chunk
+                    })
+            with lock:
+                counts["kept"] += len(state["current"]) - len(chunks)
+                state["pending"].update(c["id"] for c in chunks)
+                state["outstanding"] += len(chunks)
+                state["planned"] = True
+                if not state["current"]:
+                    logger.warning(f"No chunks to index for {file_path}")
+            yield from chunks
+            with lock:
+                if state["outstanding"] == 0 and file_path in progress:
+                    finish_file(file_path)
+            flush()
+
+    embed_stats: Dict[str, float] = {}
+
+    def embed_chunks(chunks):
+        for chunk, vector in embed_corpus(chunks, lambda c: c["text"], stats=embed_stats):
+            yield {
+                "_op_type": "index",
+                "_index": INDEX_NAME,
+                "_id": chunk["id"],
+                "_source": {
+                    "file_path": chunk["file_path"],
+                    "section": chunk["section"],
+                    "chunk_id": chunk["chunk_id"],
+                    "text": chunk["text"],
+                    "vector": to_stored(vector)
+                }
+            }
+
+    def write_actions(actions):
+        inflight: Dict[str, Dict[str, Any]] = {}
+
+        def tracked():
             for action in actions:
-                try:
-                    es.index(index=action["_index"], document=action["_source"])
-                except Exception as e2:
-                    src = action["_source"]
-                    logger.error(
-                        f"Failed to index chunk {src['chunk_id']} of '{src['file_path']}' section '{src['section']}': {e2}"
-                    )
+                inflight[action["_id"]] = action
+                yield action
+
+        for ok, item in _write_stream(es, tracked()):
+            action = inflight.pop(next(iter(item.values())).get("_id"), None)
+            if action is None:
+                continue
+            ok = ok or _index_one(es, action)
+            file_path = action["_source"]["file_path"]
+            with lock:
+                state = progress[file_path]
+                state["outstanding"] -= 1
+                if ok:
+                    counts["embedded"] += 1
+                    state["indexed"].add(action["_id"])
+                if state["planned"] and state["outstanding"] == 0:
+                    finish_file(file_path)
+            flush()
+            yield action["_id"]
+
+    (
+        Pipeline(queue_size=INDEX_QUEUE_SIZE, log_interval=INDEX_LOG_INTERVAL)
+        .add("reader", read_files)
+        .add("chunker", chunk_files, workers=INDEX_CHUNK_WORKERS)
+        .add("embedder", embed_chunks)
+        .add("writer", write_actions)
+        .run()
+    )
 
-    logger.info("Indexing process complete.")
+    # Files with chunks that failed to embed are recorded as incomplete
+    for file_path in list(progress):
+        finish_file(file_path)
+    flush(force=True)
+    # Files that were removed from the corpus (files merely excluded by
+    # `patterns` keep their chunks)
+    removed = [f for f in set(manifest) - seen if not os.path.exists(os.path.join(DOCS_FOLDER, f))]
+    for file_path in sorted(removed):
+        counts["deleted"] += _delete_chunks(es, manifest.pop(file_path)["chunks"])
+        logger.info(f"Removed chunks of deleted file '{file_path}'")
+    if local:
+        es.save()
+    save_manifest(manifest_path, INDEX_NAME, manifest)
+
+    # Cached answers may cite chunks that changed; tell the API to drop them
+    # (an unchanged corpus keeps the answer cache warm)
+    if counts["embedded"] or counts["deleted"]:
+        mark_index_rebuilt(INDEX_GENERATION_FILE)
+    logger.info(
+        f"Indexing process complete: {counts['files']} files, {counts['embedded']} chunks embedded, "
+        f"{counts['kept']} unchanged, {counts['deleted']} deleted, {counts['skipped_files']} files skipped, "
+        f"{embed_stats.get('failed', 0)} failed to embed; "
+        f"embedding throughput {embed_stats.get('tokens_per_sec', 0)} tokens/sec."
+    )
 
 
 def main():
-    es = Elasticsearch(
-        [ELASTIC_CONNECTION_URL],
-        basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
-        verify_certs=False
+    parser = argparse.ArgumentParser(description="Index the documents folder into Elasticsearch (or the local index).")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="re-embed every chunk instead of only new or changed ones"
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="GLOB",
+        help="only index files matching this glob (repeatable; default DOCS_PATTERNS)"
     )
+    parser.add_argument("--shard", type=int, default=0, help="index of this indexer when splitting the corpus")
+    parser.add_argument("--num-shards", type=int, default=1, help="number of indexers splitting the corpus")
+    args = parser.parse_args()
+
+    es = get_local_index() if RETRIEVAL_BACKEND == "local" else get_es_client()
 
     create_index(es)
-    index_documents(es)
+    index_documents(
+        es,
+        incremental=not args.full,
+        patterns=args.include,
+        shard=args.shard,
+        num_shards=args.num_shards
+    )
 
 
 if __name__ == "__main__":
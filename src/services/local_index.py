@@ -0,0 +1,546 @@
+# local_index.py
+"""
+In-process alternative to Elasticsearch for retrieval (RETRIEVAL_BACKEND=local).
+
+The indexer writes chunks here instead of to Elasticsearch; `save()` then
+persists everything to LOCAL_INDEX_DIR:
+
+- vectors.npy: L2-normalized chunk vectors (float16 or float32), memory-mapped
+  when loaded, so the matrix is paged in on demand and shared between
+  processes. Rows are ordered by IVF list, so probing a list reads one
+  contiguous slice.
+- ivf.npz: centroids and list offsets of an inverted-file index (spherical
+  k-means). Above LOCAL_INDEX_ANN_MIN_DOCS chunks a query only scores the
+  rows of its LOCAL_INDEX_NPROBE nearest lists; smaller indexes are
+  searched exhaustively.
+- bm25.npz / vocab.json: a BM25 inverted index (term -> doc ids and term
+  frequencies) for the lexical half of the hybrid query.
+- docs.jsonl / meta.json: chunk metadata in row order and the index
+  description (embedding model, dims).
+
+Searches score chunks the way `build_advanced_hybrid_query` asks
+Elasticsearch to: BM25 plus a boosted kNN score of (1 + cosine) / 2 for the
+nearest candidates, with the same minimum score.
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import (
+    LOCAL_INDEX_DIR,
+    LOCAL_INDEX_DTYPE,
+    LOCAL_INDEX_ANN_MIN_DOCS,
+    LOCAL_INDEX_NLIST,
+    LOCAL_INDEX_NPROBE,
+    RRF_WINDOW
+)
+from src.logger import logger
+from .fusion import reciprocal_rank_fusion
+
+_TOKEN = re.compile(r"\w+")
+
+# Rows scored per matrix product when assigning vectors to lists
+_BLOCK = 65536
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens, roughly what Elasticsearch's standard analyzer
+    produces for the `text` field.
+    """
+    return _TOKEN.findall(text.lower())
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest scores, best first.
+    """
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+class BM25:
+    """
+    BM25 over an inverted index stored as CSR arrays: the postings of term t
+    are doc_ids[offsets[t]:offsets[t + 1]] with frequencies tfs[...].
+    """
+
+    def __init__(self, vocab: Dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_len: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        count = len(doc_len)
+        self.avgdl = float(doc_len.mean()) if count else 0.0
+        df = np.diff(offsets)
+        # Lucene's idf, always positive
+        self.idf = np.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    @classmethod
+    def build(cls, texts: Sequence[str]) -> "BM25":
+        vocab: Dict[str, int] = {}
+        term_ids, docs, freqs = [], [], []
+        doc_len = np.zeros(len(texts), dtype=np.int32)
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                docs.append(doc)
+                freqs.append(tf)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+        return cls(
+            vocab, offsets,
+            np.asarray(docs, dtype=np.int32)[order],
+            np.asarray(freqs, dtype=np.float32)[order],
+            doc_len
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        BM25 score of every document for `query` (0 where no term matches),
+        as Lucene 8+ computes it: without the constant (k1 + 1) factor.
+        """
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-9))
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            scores[docs] += self.idf[t] * tf / (tf + norm[docs])
+        return scores
+
+    def save(self, folder: str) -> None:
+        np.savez(os.path.join(folder, "bm25.npz"), offsets=self.offsets, doc_ids=self.doc_ids,
+                 tfs=self.tfs, doc_len=self.doc_len)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(os.path.join(folder, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f)
+
+    @classmethod
+    def load(cls, folder: str) -> "BM25":
+        with open(os.path.join(folder, "vocab.json"), encoding="utf-8") as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        data = np.load(os.path.join(folder, "bm25.npz"))
+        return cls(vocab, data["offsets"], data["doc_ids"], data["tfs"], data["doc_len"])
+
+
+def train_ivf(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means centroids (nlist, dims) of normalized `vectors`.
+    """
+    rng = np.random.default_rng(seed)
+    # A few dozen points per list are enough to place the centroids
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), nlist * 64), replace=False))]
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_lists(sample, centroids)
+        # Per-list sums via one sort and reduceat (np.add.at is far slower)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        filled = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        sums[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = ~filled
+        # Re-seed empty lists with random points
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Nearest centroid (highest cosine) of every vector.
+    """
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _BLOCK):
+        block = np.asarray(vectors[start:start + _BLOCK], dtype=np.float32)
+        assign[start:start + _BLOCK] = (block @ centroids.T).argmax(axis=1)
+    return assign
+
+
+class _Snapshot(NamedTuple):
+    """
+    One saved state of the index. Replaced as a whole on reload, so a search
+    that holds it never mixes rows of two versions.
+    """
+
+    meta: Dict[str, Any]
+    docs: List[Dict[str, Any]]
+    vectors: np.ndarray
+    centroids: Optional[np.ndarray]
+    list_offsets: Optional[np.ndarray]
+    bm25: BM25
+    rows: Dict[str, int]
+
+
+_EMPTY = _Snapshot({}, [], np.zeros((0, 0), dtype=np.float32), None, None, BM25.build([]), {})
+
+
+class LocalIndex:
+    """
+    Chunks, vectors and the two search structures of one local index.
+
+    Writes (`bulk`, `delete`) are buffered until `save()`, which rebuilds
+    and persists the whole index; searches always see the last saved state,
+    reloaded automatically when another process (the indexer) saves.
+    """
+
+    def __init__(self, folder: str = LOCAL_INDEX_DIR, dtype: str = LOCAL_INDEX_DTYPE):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"LOCAL_INDEX_DTYPE must be float16 or float32, not {dtype!r}")
+        self.folder = folder
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._upserts: Dict[str, Tuple[Dict[str, Any], np.ndarray]] = {}
+        self._deleted: set = set()
+        self._loaded_mtime: Optional[float] = None
+        self._snapshot = _EMPTY
+        self._reload_if_changed()
+
+    # Read-only views of the current snapshot
+    meta = property(lambda self: self._snapshot.meta)
+    docs = property(lambda self: self._snapshot.docs)
+    vectors = property(lambda self: self._snapshot.vectors)
+    centroids = property(lambda self: self._snapshot.centroids)
+    list_offsets = property(lambda self: self._snapshot.list_offsets)
+    bm25 = property(lambda self: self._snapshot.bm25)
+
+    def _current(self) -> _Snapshot:
+        """
+        The last saved state, reloaded first if another process saved since.
+        """
+        self._reload_if_changed()
+        return self._snapshot
+
+    # -- persistence -------------------------------------------------------
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.folder, "meta.json")
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self._meta_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime == self._loaded_mtime:
+                return
+            try:
+                with open(self._meta_path(), encoding="utf-8") as f:
+                    meta = json.load(f)
+                with open(os.path.join(self.folder, "docs.jsonl"), encoding="utf-8") as f:
+                    docs = [json.loads(line) for line in f]
+                vectors = np.load(os.path.join(self.folder, "vectors.npy"), mmap_mode="r")
+                centroids = list_offsets = None
+                if meta.get("nlist"):
+                    ivf = np.load(os.path.join(self.folder, "ivf.npz"))
+                    centroids, list_offsets = ivf["centroids"], ivf["offsets"]
+                bm25 = BM25.load(self.folder)
+                swapped = os.stat(self._meta_path()).st_mtime_ns != mtime
+            except FileNotFoundError:
+                swapped = True
+            if swapped:
+                # A save() replaced the folder while it was read: keep serving
+                # the previous snapshot and load the new one on the next call
+                logger.debug(f"Local index '{self.folder}' changed while loading; retrying later")
+                return
+            rows = {doc["_id"]: row for row, doc in enumerate(docs)}
+            self._snapshot = _Snapshot(meta, docs, vectors, centroids, list_offsets, bm25, rows)
+            self._loaded_mtime = mtime
+            logger.info(f"Loaded local index '{self.folder}': {len(docs)} chunks")
+
+    def create(self, meta: Dict[str, Any]) -> bool:
+        """
+        Record which embedding model the index holds; an existing index built
+        for other vectors is refused, like `indexer.create_index` does.
+        Returns whether the index is new.
+        """
+        with self._lock:
+            if self.meta:
+                mismatch = {k: (self.meta.get(k), v) for k, v in meta.items() if self.meta.get(k) != v}
+                if mismatch:
+                    raise ValueError(
+                        f"Local index '{self.folder}' was built for different embeddings {mismatch}. "
+                        f"Delete it (python -m src.services.delete_index) and re-index."
+                    )
+                return False
+            self._snapshot = self._snapshot._replace(meta=dict(meta))
+            return True
+
+    def save(self) -> None:
+        """
+        Apply buffered writes, rebuild the IVF and BM25 structures and write
+        the index to a fresh folder that atomically replaces the old one.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            current = self._snapshot
+            keep = [
+                row for row, doc in enumerate(current.docs)
+                if doc["_id"] not in self._deleted and doc["_id"] not in self._upserts
+            ]
+            docs = [current.docs[row] for row in keep] + [doc for doc, _ in self._upserts.values()]
+            dims = current.meta.get("embedding_dims") or (current.vectors.shape[1] if len(current.docs) else 0)
+            if not dims and self._upserts:
+                dims = len(next(iter(self._upserts.values()))[1])
+            parts = [np.asarray(current.vectors[keep], dtype=np.float32)] if keep else []
+            if self._upserts:
+                parts.append(_normalize(np.stack([vector for _, vector in self._upserts.values()])))
+            vectors = np.concatenate(parts) if parts else np.zeros((0, dims), dtype=np.float32)
+
+            # Order rows by IVF list so each list is one contiguous slice
+            nlist = 0
+            centroids = offsets = None
+            if len(docs) >= max(LOCAL_INDEX_ANN_MIN_DOCS, 1):
+                nlist = LOCAL_INDEX_NLIST or max(1, int(2 * math.sqrt(len(docs))))
+                nlist = min(nlist, len(docs))
+                centroids = train_ivf(vectors, nlist)
+                assign = assign_lists(vectors, centroids)
+                order = np.argsort(assign, kind="stable")
+                vectors, docs = vectors[order], [docs[i] for i in order]
+                offsets = np.zeros(nlist + 1, dtype=np.int64)
+                np.cumsum(np.bincount(assign, minlength=nlist), out=offsets[1:])
+
+            tmp = self.folder.rstrip(os.sep) + ".tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            np.save(os.path.join(tmp, "vectors.npy"), vectors.astype(self.dtype))
+            with open(os.path.join(tmp, "docs.jsonl"), "w", encoding="utf-8") as f:
+                for doc in docs:
+                    f.write(json.dumps(doc) + "\n")
+            if nlist:
+                np.savez(os.path.join(tmp, "ivf.npz"), centroids=centroids, offsets=offsets)
+            BM25.build([doc["text"] for doc in docs]).save(tmp)
+            meta = {**current.meta, "count": len(docs), "dims": int(dims), "dtype": self.dtype, "nlist": nlist}
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            old = self.folder.rstrip(os.sep) + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(self.folder):
+                os.replace(self.folder, old)
+            os.replace(tmp, self.folder)
+            shutil.rmtree(old, ignore_errors=True)
+
+            self._upserts.clear()
+            self._deleted.clear()
+            self._loaded_mtime = None
+            self._reload_if_changed()
+            logger.info(
+                f"Saved local index '{self.folder}': {len(docs)} chunks, {nlist} IVF lists, "
+                f"{len(self.bm25.vocab)} terms in {time.perf_counter() - started:.1f}s"
+            )
+
+    def drop(self) -> bool:
+        """
+        Delete the index from disk; returns whether it existed.
+        """
+        with self._lock:
+            existed = os.path.exists(self.folder)
+            shutil.rmtree(self.folder, ignore_errors=True)
+            self._upserts.clear()
+            self._deleted.clear()
+            self._loaded_mtime = None
+            self._snapshot = _EMPTY
+            return existed
+
+    # -- writes ------------------------------------------------------------
+
+    def bulk(self, actions: Iterable[Dict[str, Any]]) -> Iterator[Tuple[bool, Dict[str, Any]]]:
+        """
+        Apply indexer actions (`_op_type` index or delete), yielding
+        (ok, item) per action like Elasticsearch's bulk helpers.
+        """
+        for action in actions:
+            op = action.get("_op_type", "index")
+            doc_id = action["_id"]
+            try:
+                if op == "delete":
+                    self.delete([doc_id])
+                else:
+                    source = dict(action["_source"])
+                    vector = np.asarray(source.pop("vector"), dtype=np.float32)
+                    dims = self.meta.get("embedding_dims")
+                    if dims and len(vector) != dims:
+                        raise ValueError(f"vector has {len(vector)} dims, index expects {dims}")
+                    with self._lock:
+                        self._deleted.discard(doc_id)
+                        self._upserts[doc_id] = ({"_id": doc_id, **source}, vector)
+            except Exception as e:
+                yield False, {op: {"_id": doc_id, "error": str(e)}}
+                continue
+            yield True, {op: {"_id": doc_id}}
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """
+        Delete chunks by ID; returns how many existed.
+        """
+        deleted = 0
+        with self._lock:
+            for doc_id in ids:
+                existed = self._upserts.pop(doc_id, None) is not None or (
+                    doc_id in self._snapshot.rows and doc_id not in self._deleted
+                )
+                if doc_id in self._snapshot.rows:
+                    self._deleted.add(doc_id)
+                deleted += existed
+        return deleted
+
+    def contains(self, doc_id: str) -> bool:
+        """
+        Whether the chunk is in the saved index (or buffered for the next save).
+        """
+        with self._lock:
+            return doc_id in self._upserts or (doc_id in self._snapshot.rows and doc_id not in self._deleted)
+
+    # -- search ------------------------------------------------------------
+
+    def knn(self, query_vectors: np.ndarray, k: int, nprobe: int = LOCAL_INDEX_NPROBE) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (rows, cosine similarities) of the k nearest chunks of each query,
+        approximate when the index has IVF lists, exact otherwise.
+        """
+        return self._knn(self._current(), query_vectors, k, nprobe)
+
+    @staticmethod
+    def _knn(snapshot: _Snapshot, query_vectors: np.ndarray, k: int,
+             nprobe: int = LOCAL_INDEX_NPROBE) -> List[Tuple[np.ndarray, np.ndarray]]:
+        vectors, centroids, offsets = snapshot.vectors, snapshot.centroids, snapshot.list_offsets
+        queries = _normalize(np.atleast_2d(query_vectors))
+        results = []
+        if not len(vectors):
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        if centroids is None:
+            # Exact: every row, converted from the memory map block by block
+            scores = np.empty((len(vectors), len(queries)), dtype=np.float32)
+            for start in range(0, len(vectors), _BLOCK):
+                scores[start:start + _BLOCK] = np.asarray(vectors[start:start + _BLOCK], dtype=np.float32) @ queries.T
+            for column in scores.T:
+                rows = _top(column, k)
+                results.append((rows, column[rows]))
+            return results
+        probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :nprobe]
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([np.arange(offsets[l], offsets[l + 1]) for l in lists])
+            scores = np.concatenate([
+                np.asarray(vectors[offsets[l]:offsets[l + 1]], dtype=np.float32) @ query for l in lists
+            ])
+            best = _top(scores, k)
+            results.append((rows[best], scores[best]))
+        return results
+
+    def search_many(
+        self,
+        query_texts: Sequence[str],
+        query_vectors: Sequence[Sequence[float]],
+        top_k: int,
+        min_score: float = 1.2,
+        bm25_boost: float = 1.0,
+        knn_boost: float = 2.0,
+        knn_candidates_factor: int = 20,
+        fusion: str = "script_score",
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Hybrid BM25 + kNN search, one list of hits per query, in the format
+        of `retriever._parse_hits`. Arguments mirror
+        `build_advanced_hybrid_query`; with fusion="rrf" the best RRF_WINDOW
+        rows of each leg are fused by reciprocal rank instead (no min_score).
+        """
+        if not query_texts:
+            return []
+        # Rows of the kNN leg index this snapshot's docs, whatever a save does meanwhile
+        snapshot = self._current()
+        docs, bm25 = snapshot.docs, snapshot.bm25
+        rrf = fusion == "rrf"
+        window = RRF_WINDOW if rrf else top_k * knn_candidates_factor
+        neighbours = self._knn(snapshot, np.asarray(query_vectors, dtype=np.float32), window)
+        results = []
+        for query_text, (rows, cosines) in zip(query_texts, neighbours):
+            scores = bm25_boost * bm25.scores(query_text)
+            if rrf:
+                lexical = [row for row in _top(scores, window).tolist() if scores[row] > 0]
+                ranked = reciprocal_rank_fusion([lexical, rows.tolist()])[:top_k]
+            else:
+                scores[rows] += knn_boost * (1 + cosines) / 2
+                ranked = [(row, float(scores[row])) for row in _top(scores, top_k) if scores[row] >= min_score]
+            hits = []
+            for row, score in ranked:
+                doc = docs[row]
+                hits.append({
+                    "file_path": doc.get("file_path"),
+                    "section": doc.get("section"),
+                    "chunk_id": doc.get("chunk_id"),
+                    "text": doc.get("text"),
+                    "score": score
+                })
+            results.append(hits)
+        return results
+
+    def stats(self, reload: bool = True) -> Dict[str, Any]:
+        """
+        Size of the index; with reload=False, of the snapshot already in
+        memory (no disk reads).
+        """
+        snapshot = self._current() if reload else self._snapshot
+        return {
+            "folder": self.folder,
+            "chunks": len(snapshot.docs),
+            "dtype": snapshot.meta.get("dtype", self.dtype),
+            "ivf_lists": snapshot.meta.get("nlist", 0),
+            "terms": len(snapshot.bm25.vocab),
+        }
+
+
+_index: Optional[LocalIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_local_index() -> LocalIndex:
+    """
+    Return the process-wide LocalIndex, loading it from LOCAL_INDEX_DIR on first use.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LocalIndex()
+        return _index
+
+
+def local_index_stats() -> Dict[str, Any]:
+    """
+    Stats of the process-wide index if it is already loaded, else {}; never
+    reads the index from disk (safe to call from the API event loop).
+    """
+    index = _index
+    return index.stats(reload=False) if index is not None else {}
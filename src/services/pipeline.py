@@ -0,0 +1,154 @@
+# pipeline.py
+"""
+Minimal threaded pipeline: stages connected by bounded queues.
+
+Each stage is a function that takes an iterator of inputs (nothing for the
+first stage) and yields outputs for the next one. Stages run concurrently
+on their own threads, so e.g. chunking, embedding and Elasticsearch writes
+overlap instead of taking turns; the bounded queues keep a fast stage from
+running ahead of a slow one and holding the corpus in memory.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+from src.logger import logger
+
+# Marks the end of a stage's output
+_END = object()
+
+
+class _Stopped(Exception):
+    """
+    Raised inside a stage when another stage failed.
+    """
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable[..., Iterable[Any]], workers: int):
+        if workers <= 0:
+            raise ValueError(f"Stage '{name}' needs at least one worker.")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.inbox: Optional[queue.Queue] = None
+        self.items = 0
+        self.running = workers
+        self.lock = threading.Lock()
+
+
+class Pipeline:
+    """
+    Run stages concurrently and log per-stage throughput and queue depth.
+
+    :param queue_size: Capacity of each queue between two stages.
+    :param log_interval: Seconds between progress lines (0 = summary only).
+    """
+
+    def __init__(self, queue_size: int = 64, log_interval: float = 10.0):
+        if queue_size <= 0:
+            raise ValueError("queue_size must be positive.")
+        self.queue_size = queue_size
+        self.log_interval = log_interval
+        self._stages: List[_Stage] = []
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def add(self, name: str, fn: Callable[..., Iterable[Any]], workers: int = 1) -> "Pipeline":
+        """
+        Append a stage. The first stage is called as `fn()`, later ones as
+        `fn(inputs)`; with several workers each gets its share of the inputs.
+        """
+        stage = _Stage(name, fn, workers)
+        if self._stages:
+            stage.inbox = queue.Queue(maxsize=self.queue_size)
+        self._stages.append(stage)
+        return self
+
+    def _put(self, q: queue.Queue, item: Any) -> None:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _inputs(self, q: queue.Queue) -> Iterator[Any]:
+        while True:
+            if self._stop.is_set():
+                raise _Stopped()
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _work(self, index: int) -> None:
+        stage = self._stages[index]
+        following = self._stages[index + 1] if index + 1 < len(self._stages) else None
+        try:
+            outputs = stage.fn(self._inputs(stage.inbox)) if stage.inbox is not None else stage.fn()
+            for item in outputs or ():
+                with stage.lock:
+                    stage.items += 1
+                if following is not None:
+                    self._put(following.inbox, item)
+            with stage.lock:
+                stage.running -= 1
+                last = stage.running == 0
+            # The last worker to finish tells every downstream worker
+            if last and following is not None:
+                for _ in range(following.workers):
+                    self._put(following.inbox, _END)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            logger.error(f"Pipeline stage '{stage.name}' failed: {e}")
+            self._stop.set()
+
+    def _report(self, started: float, final: bool = False) -> None:
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        parts = []
+        for stage in self._stages:
+            part = f"{stage.name}: {stage.items} ({stage.items / elapsed:.1f}/s)"
+            if stage.inbox is not None and not final:
+                part += f" queue {stage.inbox.qsize()}/{self.queue_size}"
+            parts.append(part)
+        logger.info(f"Pipeline {'finished in %.1fs' % elapsed if final else 'progress'}: " + " | ".join(parts))
+
+    def run(self) -> None:
+        """
+        Run every stage to completion, re-raising the first stage failure.
+        """
+        if not self._stages:
+            return
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._work, args=(i,), name=f"{stage.name}-{w}", daemon=True)
+            for i, stage in enumerate(self._stages)
+            for w in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(self.log_interval or None)
+                if self.log_interval and thread.is_alive() and not self._stop.is_set():
+                    self._report(started)
+        if self._error is not None:
+            raise self._error
+        self._report(started, final=True)
+
+    def stats(self) -> dict:
+        """
+        Items produced so far by each stage.
+        """
+        return {stage.name: stage.items for stage in self._stages}
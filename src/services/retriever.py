@@ -1,30 +1,101 @@
 # retriever.py
 """
 Module for vector + hybrid retrieval from Elasticsearch for Agentic RAG.
+
+With RETRIEVAL_BACKEND=local the same queries run against the in-process
+index of `local_index.py` instead, and no Elasticsearch client is used.
+
+HYBRID_MODE chooses how BM25 and kNN are combined: "script_score" scores
+one bool query of both, "rrf" runs them as separate searches in the same
+msearch and fuses their rankings client-side (see `fusion.py`).
+With RERANK_ENABLED a cross-encoder reorders an over-fetched candidate
+list before it is cut to top_k (see `src/agents/reranker.py`).
 """
 
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, Optional
 from elasticsearch import Elasticsearch
 from src.config import (
-    ELASTIC_CONNECTION_URL,
-    ELASTIC_USERNAME,
-    ELASTIC_PASSWORD,
     INDEX_NAME,
+    RETRIEVAL_BACKEND,
+    HYBRID_MODE,
+    RRF_WINDOW,
+    RRF_NUM_CANDIDATES,
+    RERANK_ENABLED,
+    RERANK_CANDIDATES,
     top_k
 )
-from src.agents.embedder import embed_text
+from .es_client import get_es_client
+from .fusion import reciprocal_rank_fusion
+from .local_index import get_local_index
+from .vector_codec import query_vector as stored_query_vector
+from src.agents.embedder import embed_text, embed_texts
+from src.agents.reranker import rerank_many, reranker_stats
+from src.logger import logger
+
+
+_SOURCE_FIELDS = ["file_path", "section", "chunk_id", "text"]
+
+# Per-leg search counters: hits returned and Elasticsearch `took` times
+_leg_stats: Dict[str, Dict[str, float]] = {}
+# Wall time of the embed / search / rerank stages of retrieve_many
+_stage_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _record_leg(leg: str, resp: Dict[str, Any]) -> None:
+    with _stats_lock:
+        stats = _leg_stats.setdefault(leg, {"searches": 0, "errors": 0, "candidates": 0, "took_ms": 0, "max_took_ms": 0})
+        stats["searches"] += 1
+        if "error" in resp:
+            stats["errors"] += 1
+            return
+        took = resp.get("took", 0)
+        stats["candidates"] += len(resp.get("hits", {}).get("hits", []))
+        stats["took_ms"] += took
+        stats["max_took_ms"] = max(stats["max_took_ms"], took)
+
 
+def _record_stage(stage: str, start: float) -> None:
+    ms = (time.perf_counter() - start) * 1e3
+    with _stats_lock:
+        stats = _stage_stats.setdefault(stage, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats["total_ms"] += ms
+        stats["max_ms"] = max(stats["max_ms"], ms)
 
-def init_es_client() -> Elasticsearch:
+
+def retrieval_stats() -> Dict[str, Any]:
     """
-    Initialize and return an Elasticsearch client with basic authentication.
+    Hybrid mode; per search leg, the mean number of candidates returned and
+    the mean/max server-side search time; per `retrieve_many` stage (embed,
+    search, rerank), the mean/max wall time; and the reranker's counters.
     """
-    es = Elasticsearch(
-        [ELASTIC_CONNECTION_URL],
-        basic_auth=(ELASTIC_USERNAME, ELASTIC_PASSWORD),
-        verify_certs=False
-    )
-    return es
+    with _stats_lock:
+        legs = {leg: dict(stats) for leg, stats in _leg_stats.items()}
+        stages = {stage: dict(stats) for stage, stats in _stage_stats.items()}
+    for stats in legs.values():
+        ok = stats["searches"] - stats["errors"]
+        stats["mean_candidates"] = round(stats.pop("candidates") / ok, 1) if ok else 0.0
+        stats["mean_took_ms"] = round(stats.pop("took_ms") / ok, 1) if ok else 0.0
+    for stats in stages.values():
+        stats["mean_ms"] = round(stats.pop("total_ms") / stats["calls"], 1)
+        stats["max_ms"] = round(stats["max_ms"], 1)
+    result = {"hybrid_mode": HYBRID_MODE, "legs": legs, "stages": stages}
+    if RERANK_ENABLED:
+        result["rerank"] = reranker_stats()
+    return result
+
+
+def init_es_client() -> Optional[Elasticsearch]:
+    """
+    Return the shared, pooled Elasticsearch client (created once per process),
+    or None when retrieval runs on the local index.
+    """
+    if RETRIEVAL_BACKEND == "local":
+        return None
+    return get_es_client()
 
 def build_advanced_hybrid_query(
     query_text: str,
@@ -49,7 +120,7 @@ def build_advanced_hybrid_query(
                 {
                     "knn": {
                         "field": "vector",
-                        "query_vector": query_vector,
+                        "query_vector": stored_query_vector(query_vector),
                         "num_candidates": top_k * knn_candidates_factor,
                         "boost": knn_boost
                     }
@@ -75,7 +146,36 @@ def build_advanced_hybrid_query(
         # drop anything whose hybrid score < min_score
         "min_score": min_score,
         # only return the fields you need
-        "_source": ["file_path", "section", "chunk_id", "text"]
+        "_source": _SOURCE_FIELDS
+    }
+
+
+def build_lexical_query(query_text: str, size: int = RRF_WINDOW) -> Dict[str, Any]:
+    """
+    BM25 leg of an RRF hybrid search: the best `size` matches of the text.
+    """
+    return {
+        "size": size,
+        "query": {"match": {"text": {"query": query_text}}},
+        "_source": _SOURCE_FIELDS
+    }
+
+
+def build_knn_query(query_vector: List[float], size: int = RRF_WINDOW,
+                    num_candidates: int = RRF_NUM_CANDIDATES) -> Dict[str, Any]:
+    """
+    Vector leg of an RRF hybrid search: approximate kNN as a top-level
+    `knn` section, without any scoring script.
+    """
+    return {
+        "size": size,
+        "knn": {
+            "field": "vector",
+            "query_vector": stored_query_vector(query_vector),
+            "k": size,
+            "num_candidates": max(num_candidates, size)
+        },
+        "_source": _SOURCE_FIELDS
     }
 
 # def build_hybrid_query(query_text: str, query_vector: List[float],
@@ -121,33 +221,147 @@ def retrieve(query_text: str, es: Elasticsearch, top_k: int) -> List[Dict[str, A
     Retrieve top_k document chunks for a query using hybrid search.
 
     :param query_text: The user query string.
-    :param es: Initialized Elasticsearch client.
+    :param es: Initialized Elasticsearch client (unused for the local backend).
     :param top_k: Number of results to return.
     :return: List of hits with metadata and text.
     """
+    if HYBRID_MODE == "rrf" or RERANK_ENABLED:
+        # Both legs go through one msearch; reranking is batched there too
+        return retrieve_many([query_text], es, top_k)[0]
+
     # 1) Embed the query
     query_vector = embed_text(query_text)
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index().search_many([query_text], [query_vector], top_k)[0]
 
     # 2) Build the hybrid query body
     body = build_advanced_hybrid_query(query_text, query_vector, top_k)
 
     # 3) Execute search
     resp = es.search(index=INDEX_NAME, body=body)
+    _record_leg("hybrid", resp)
 
     # 4) Parse hits
+    return _parse_hits(resp)
+
+
+def retrieve_many(query_texts: List[str], es: Elasticsearch, top_k: int) -> List[List[Dict[str, Any]]]:
+    """
+    Retrieve top_k chunks for several queries at once.
+
+    All queries are embedded in one batched forward pass and searched in one
+    `msearch` round trip, instead of one of each per query.
+
+    :param query_texts: The query strings (e.g. the planner's subqueries).
+    :param es: Initialized Elasticsearch client (unused for the local backend).
+    :param top_k: Number of results to return per query.
+    :return: One list of hits per query, in the same order.
+
+    With RERANK_ENABLED, RERANK_CANDIDATES hits are fetched per query and
+    the cross-encoder of `reranker.py` picks the top_k of them.
+    """
+    if not query_texts:
+        return []
+    size = max(top_k, RERANK_CANDIDATES) if RERANK_ENABLED else top_k
+
+    # 1) Embed all queries in one batch
+    start = time.perf_counter()
+    query_vectors = embed_texts(query_texts)
+    _record_stage("embed", start)
+
+    start = time.perf_counter()
+    results = _search_many(query_texts, query_vectors, es, size)
+    _record_stage("search", start)
+
+    if RERANK_ENABLED:
+        start = time.perf_counter()
+        results = rerank_many(query_texts, results, top_k)
+        _record_stage("rerank", start)
+    return results
+
+
+def _search_many(
+    query_texts: List[str],
+    query_vectors: List[List[float]],
+    es: Optional[Elasticsearch],
+    top_k: int,
+) -> List[List[Dict[str, Any]]]:
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index().search_many(query_texts, query_vectors, top_k, fusion=HYBRID_MODE)
+    if HYBRID_MODE == "rrf":
+        return _retrieve_many_rrf(query_texts, query_vectors, es, top_k)
+
+    # 2) One header/body pair per query
+    searches = []
+    for query_text, query_vector in zip(query_texts, query_vectors):
+        searches.append({"index": INDEX_NAME})
+        searches.append(build_advanced_hybrid_query(query_text, query_vector, top_k))
+
+    # 3) Execute all searches in a single round trip
+    resp = es.msearch(searches=searches)
+
+    # 4) Parse hits per query; a failed search yields no hits rather than failing the rest
     results = []
-    for hit in resp.get("hits", {}).get("hits", []):
-        src = hit.get("_source", {})
-        results.append({
-            "file_path": src.get("file_path"),
-            "section": src.get("section"),
-            "chunk_id": src.get("chunk_id"),
-            "text": src.get("text"),
-            "score": hit.get("_score")
-        })
+    for query_text, item in zip(query_texts, resp.get("responses", [])):
+        _record_leg("hybrid", item)
+        if "error" in item:
+            logger.warning(f"Search failed for query '{query_text}': {item['error']}")
+            results.append([])
+        else:
+            results.append(_parse_hits(item))
     return results
 
 
+def _retrieve_many_rrf(
+    query_texts: List[str],
+    query_vectors: List[List[float]],
+    es: Elasticsearch,
+    top_k: int,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Lexical and kNN leg of every query in one msearch, fused per query by
+    reciprocal rank. A failed leg leaves the other leg's ranking.
+    """
+    searches = []
+    for query_text, query_vector in zip(query_texts, query_vectors):
+        searches += [{"index": INDEX_NAME}, build_lexical_query(query_text)]
+        searches += [{"index": INDEX_NAME}, build_knn_query(query_vector)]
+    responses = es.msearch(searches=searches).get("responses", [])
+
+    results = []
+    for i, query_text in enumerate(query_texts):
+        rankings, docs = [], {}
+        for leg, item in zip(("lexical", "vector"), responses[2 * i:2 * i + 2]):
+            _record_leg(leg, item)
+            if "error" in item:
+                logger.warning(f"{leg.capitalize()} search failed for query '{query_text}': {item['error']}")
+                continue
+            hits = item.get("hits", {}).get("hits", [])
+            rankings.append([hit["_id"] for hit in hits])
+            for hit in hits:
+                docs.setdefault(hit["_id"], hit)
+        results.append([
+            {**_parse_hit(docs[doc_id]), "score": score}
+            for doc_id, score in reciprocal_rank_fusion(rankings)[:top_k]
+        ])
+    return results
+
+
+def _parse_hit(hit: Dict[str, Any]) -> Dict[str, Any]:
+    src = hit.get("_source", {})
+    return {
+        "file_path": src.get("file_path"),
+        "section": src.get("section"),
+        "chunk_id": src.get("chunk_id"),
+        "text": src.get("text"),
+        "score": hit.get("_score")
+    }
+
+
+def _parse_hits(resp: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [_parse_hit(hit) for hit in resp.get("hits", {}).get("hits", [])]
+
+
 # def main():
 #     """
 #     Simple CLI for testing retrieval.
@@ -0,0 +1,96 @@
+# vector_codec.py
+"""
+How chunk vectors are stored in Elasticsearch and encoded in bulk requests.
+
+VECTOR_STORAGE picks the dense_vector mapping:
+
+- "float": float32 vectors (the default).
+- "int8_hnsw": float32 vectors, but the HNSW graph keeps int8-quantized
+  copies; about 4x less memory for search, requests unchanged.
+- "byte": element_type byte. Vectors are scaled so their largest component
+  is +-127 and rounded (cosine similarity ignores the scale), so documents,
+  requests and the index are 4x smaller than float32.
+
+The indexer keeps vectors as NumPy arrays and `VectorJsonSerializer` writes
+them straight into the bulk body: floats with their shortest float32
+representation (half the bytes of Python's float64 repr, no precision
+lost), bytes as integers or, with VECTOR_HEX_ENCODING (Elasticsearch 8.14+),
+as one hex string.
+"""
+
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+from elasticsearch.serializer import JsonSerializer
+
+from src.config import VECTOR_STORAGE, VECTOR_HEX_ENCODING
+
+STORAGES = ("float", "int8_hnsw", "byte")
+
+
+def vector_mapping(dims: int) -> Dict[str, Any]:
+    """
+    dense_vector mapping of the `vector` field for VECTOR_STORAGE.
+    """
+    if VECTOR_STORAGE not in STORAGES:
+        raise ValueError(f"Unknown VECTOR_STORAGE {VECTOR_STORAGE!r}; choose one of {list(STORAGES)}.")
+    field: Dict[str, Any] = {"type": "dense_vector", "dims": dims}
+    if VECTOR_STORAGE == "byte":
+        field.update(element_type="byte", index=True, similarity="cosine")
+    elif VECTOR_STORAGE == "int8_hnsw":
+        field.update(index=True, similarity="cosine", index_options={"type": "int8_hnsw"})
+    return field
+
+
+def to_bytes_vector(vector: np.ndarray) -> np.ndarray:
+    """
+    int8 copy of `vector` with its largest component at +-127.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    peak = float(np.abs(vector).max()) or 1.0
+    return np.rint(vector * (127.0 / peak)).astype(np.int8)
+
+
+def to_stored(vector: np.ndarray) -> np.ndarray:
+    """
+    A vector in the form the index stores (float32, or int8 for "byte").
+    """
+    if VECTOR_STORAGE == "byte":
+        return to_bytes_vector(vector)
+    return np.asarray(vector, dtype=np.float32)
+
+
+def query_vector(vector: Sequence[float]) -> List[Any]:
+    """
+    A query vector in the element type of the index (kNN queries against
+    byte vectors must be integers too).
+    """
+    if VECTOR_STORAGE == "byte":
+        return to_bytes_vector(np.asarray(vector)).tolist()
+    return list(vector)
+
+
+def encode_vector(vector: np.ndarray) -> bytes:
+    """
+    JSON text of one vector, without a detour through Python float lists.
+    """
+    if vector.dtype == np.int8:
+        if VECTOR_HEX_ENCODING:
+            return b'"' + vector.tobytes().hex().encode("ascii") + b'"'
+        return b"[" + ",".join(map(str, vector.tolist())).encode("ascii") + b"]"
+    # str() of a float32 scalar is its shortest round-trip representation
+    return b"[" + ",".join(map(str, vector.astype(np.float32, copy=False))).encode("ascii") + b"]"
+
+
+class VectorJsonSerializer(JsonSerializer):
+    """
+    JSON serializer for the Elasticsearch client that encodes a NumPy
+    `vector` field of a document with `encode_vector`.
+    """
+
+    def dumps(self, data: Any) -> bytes:
+        if isinstance(data, dict) and isinstance(data.get("vector"), np.ndarray):
+            rest = {k: v for k, v in data.items() if k != "vector"}
+            head = super().dumps(rest)
+            return head[:-1] + (b"," if rest else b"") + b'"vector":' + encode_vector(data["vector"]) + b"}"
+        return super().dumps(data)
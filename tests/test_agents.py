@@ -10,6 +10,8 @@ from src.agents.planner import plan
 import src.agents.executor as executor_mod
 # Reasoner
 import src.agents.reasoner as reasoner_mod
+# Model registry
+import src.agents.model_registry as registry_mod
 
 
 
@@ -20,6 +22,31 @@ def test_chunk_text_respects_size_and_overlap():
     # final chunk may be shorter than size
     assert chunks == ["abcd", "cdef", "ef"]
 
+def test_chunk_text_by_tokens_snaps_to_sentences_within_budget():
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+    from src.agents.chunker import chunk_text_by_tokens
+    # one token per whitespace-separated word
+    words = Tokenizer(models.WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+    words.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=words)
+
+    text = "One two three. Four five six. Seven eight.\n\nNine ten eleven twelve thirteen fourteen fifteen."
+    chunks = chunk_text_by_tokens(text, max_tokens=6, overlap_tokens=2, tokenizer=tokenizer)
+    assert chunks == [
+        "One two three. Four five six.",
+        "Seven eight.",
+        # a sentence over budget is split into overlapping token windows
+        "Nine ten eleven twelve thirteen fourteen",
+        "thirteen fourteen fifteen.",
+    ]
+    # sentence overlap between consecutive chunks
+    assert chunk_text_by_tokens("A b. C d. E f. G h.", max_tokens=4, overlap_tokens=2, tokenizer=tokenizer) == [
+        "A b. C d.", "C d. E f.", "E f. G h."
+    ]
+    assert chunk_text_by_tokens("   ", tokenizer=tokenizer) == []
+
+
 @pytest.mark.parametrize("docs,expected", [
     (["a", "b"], [[1, 2], [3, 4]]),
     ([], [])
@@ -43,6 +70,287 @@ def test_embed_text_consistency_with_embed_texts(monkeypatch, docs, expected):
 
 
 
+def test_embed_texts_serves_repeats_from_cache(monkeypatch):
+    from src.agents.embedding_cache import EmbeddingCache
+    batches = []
+    def fake_batch(texts):
+        batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+    monkeypatch.setattr(embedder_mod, '_embed_batch', fake_batch)
+    monkeypatch.setattr(embedder_mod, '_cache', EmbeddingCache(8, "m", 1))
+
+    assert embedder_mod.embed_texts(["ab", "abc", "ab"]) == [[2.0], [3.0], [2.0]]
+    # whitespace-normalized repeat is a hit; only the new text is embedded
+    assert embedder_mod.embed_texts(["  ab ", "abcd"]) == [[2.0], [4.0]]
+    assert batches == [["ab", "abc"], ["abcd"]]
+    stats = embedder_mod.embedding_cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 4
+
+    # stats never create the cache (that would load the backend's config)
+    monkeypatch.setattr(embedder_mod, '_cache', None)
+    monkeypatch.setattr(embedder_mod, 'get_backend', lambda: pytest.fail("backend touched"))
+    assert embedder_mod.embedding_cache_stats() == {}
+
+
+def test_embed_corpus_batches_by_length_and_backs_off_on_oom(monkeypatch):
+    import torch
+    class DummyTokenizer:
+        def __call__(self, texts, truncation):
+            return {"input_ids": [[1] * len(t) for t in texts]}
+        def pad(self, enc, return_tensors):
+            width = max(len(i) for i in enc["input_ids"])
+            ids = torch.tensor([i + [0] * (width - len(i)) for i in enc["input_ids"]])
+            return {"input_ids": ids, "attention_mask": (ids > 0).long()}
+    batches = []
+    def fake_forward(input_ids, attention_mask):
+        if len(batches) == 0 and input_ids.shape[0] > 1:
+            batches.append("oom")
+            raise RuntimeError("CUDA out of memory")
+        batches.append(attention_mask.sum(dim=1).tolist())
+        return attention_mask.sum(dim=1, keepdim=True).float()
+    monkeypatch.setattr(embedder_mod, '_lazy_load', lambda: None)
+    monkeypatch.setattr(embedder_mod, '_tokenizer', DummyTokenizer())
+    monkeypatch.setattr(embedder_mod, '_forward', fake_forward)
+    monkeypatch.setattr(embedder_mod, '_max_batch_tokens', lambda longest: 8)
+    monkeypatch.setattr('src.config.EMBED_SORT_WINDOW', 16)
+
+    stats = {}
+    texts = ["a" * 4, "b", "c" * 4, "dd"]
+    out = {t: v.tolist() for t, v in embedder_mod.embed_corpus(texts, lambda t: t, stats=stats)}
+    # every text is embedded exactly once, matched to its own vector
+    assert out == {t: [float(len(t))] for t in texts}
+    # short texts are batched together, away from the long ones; the first
+    # batch ran out of memory, was retried as halves, and later batches shrank
+    assert batches == ["oom", [1], [2], [4], [4]]
+    assert stats["texts"] == 4 and stats["tokens"] == 11 and stats["padded_tokens"] == 11
+
+
+def test_sentence_transformer_backend_truncates_to_configured_dims(monkeypatch):
+    import sys
+    import types
+    import torch
+    import src.agents.embedding_backends as backends_mod
+    class DummySentenceTransformer:
+        max_seq_length = 256
+        def __init__(self, name, device):
+            self.tokenizer = type("Tok", (), {"model_max_length": 512})()
+            self.config = type("Cfg", (), {"hidden_size": 8, "num_attention_heads": 2})()
+        def eval(self):
+            return self
+        def __getitem__(self, i):
+            return type("Module", (), {"auto_model": self})()
+        def get_sentence_embedding_dimension(self):
+            return 8
+        def __call__(self, features):
+            return {"sentence_embedding": features["attention_mask"].float().repeat(1, 4)[:, :8]}
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(SentenceTransformer=DummySentenceTransformer))
+    monkeypatch.setattr(backends_mod, "EMBEDDING_BACKEND", "sentence-transformers")
+    monkeypatch.setattr(backends_mod, "EMBEDDING_DIMS", 4)
+    monkeypatch.setattr(backends_mod, "_backend", None)
+
+    backend = backends_mod.get_backend()
+    assert isinstance(backend, backends_mod.SentenceTransformerBackend)
+    assert backend.dims == 4
+    assert backend.tokenizer.model_max_length == 256
+    vectors = backend.embed(torch.ones(3, 2, dtype=torch.long), torch.ones(3, 2, dtype=torch.long))
+    assert vectors.shape == (3, 4)
+    # larger than the model can produce
+    with pytest.raises(ValueError):
+        backends_mod.SentenceTransformerBackend("mini", dims=16).dims
+
+
+def test_llm_backend_model_id_includes_quantization(monkeypatch):
+    import torch
+    import src.agents.embedding_backends as backends_mod
+    from src.agents.embedding_cache import EmbeddingCache
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(registry_mod, "QUANTIZATION_MODE", "none")
+    plain = backends_mod.LLMBackend().model_id
+    monkeypatch.setattr(registry_mod, "QUANTIZATION_MODE", "int8")
+    quantized = backends_mod.LLMBackend().model_id
+    assert quantized == plain + "+int8"
+    # cached float vectors are not served to the int8 model
+    assert EmbeddingCache(2, plain, 3).key("a") != EmbeddingCache(2, quantized, 3).key("a")
+    # int8 does not apply on a GPU
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: True)
+    assert backends_mod.LLMBackend().model_id == plain
+
+
+def test_embedding_cache_evicts_lru_and_persists_to_disk(tmp_path):
+    from src.agents.embedding_cache import EmbeddingCache
+    cache = EmbeddingCache(2, "m", 3, disk_dir=str(tmp_path), disk_entries=2)
+    cache.put("a", [1.0, 0.0, 0.0])
+    cache.put("b", [0.0, 1.0, 0.0])
+    cache.get("a")
+    cache.put("c", [0.0, 0.0, 1.0])
+    # "b" was least recently used in memory, but the disk tier still has it
+    assert cache.stats()["evictions"] == 1
+    assert cache.get("b") == [0.0, 1.0, 0.0]
+    assert cache.stats()["disk_hits"] == 1
+    cache.flush()
+
+    # A new process sees the disk tier; "a" fell out of the 2-slot ring
+    reopened = EmbeddingCache(2, "m", 3, disk_dir=str(tmp_path), disk_entries=2)
+    assert reopened.get("c") == [0.0, 0.0, 1.0]
+    assert reopened.get("b") == [0.0, 1.0, 0.0]
+    assert reopened.get("a") is None
+    # A different model never matches
+    assert EmbeddingCache(2, "other", 3, disk_dir=str(tmp_path), disk_entries=2).get("c") is None
+
+
+def test_model_registry_loads_weights_once_and_shares_encoder(monkeypatch):
+    import torch
+    import transformers
+
+    class DummyLM(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = torch.nn.Linear(2, 2)
+        @property
+        def base_model(self):
+            return self.model
+
+    calls = {"lm": 0}
+    def fake_from_pretrained(name, **kwargs):
+        calls["lm"] += 1
+        return DummyLM()
+
+    monkeypatch.setattr(transformers.AutoModelForCausalLM, "from_pretrained", fake_from_pretrained)
+    monkeypatch.setattr(registry_mod, "_causal_lm", None)
+    monkeypatch.setattr(registry_mod, "_stats", {})
+
+    lm = registry_mod.get_causal_lm()
+    encoder = registry_mod.get_encoder()
+
+    # One load, and the encoder is the LM's own base transformer
+    assert calls["lm"] == 1
+    assert registry_mod.get_causal_lm() is lm
+    assert encoder is lm.model
+    stats = registry_mod.model_stats()
+    assert stats["causal_lm"]["footprint_bytes"] == 6 * 4
+    assert stats["encoder"]["shared_with"] == "causal_lm"
+
+
+def _byte_level_tokenizer():
+    """
+    Small fast BPE tokenizer with a byte-level pre-tokenizer, as Llama 3 uses.
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+    tok = Tokenizer(models.BPE())
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    corpus = [
+        "Decompose the following question into clear, focused sub-questions.",
+        "Question: How do antibiotics affect biofilms? Answer: Biofilms protect bacteria.",
+    ] * 20
+    trainer = trainers.BpeTrainer(vocab_size=1000, special_tokens=["<eos>"], initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tok.train_from_iterator(corpus, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>", pad_token="<eos>")
+
+
+def test_model_registry_tokenizer_is_safe_across_threads(monkeypatch):
+    import threading
+    import transformers
+    base = _byte_level_tokenizer()
+    monkeypatch.setattr(transformers.AutoTokenizer, "from_pretrained", lambda name, **kwargs: base)
+    monkeypatch.setattr(registry_mod, "_tokenizer", None)
+    monkeypatch.setattr(registry_mod, "_stats", {})
+    tokenizer = registry_mod.get_tokenizer()
+    text = "Question: How do antibiotics affect biofilms? " * 50
+
+    # Chunker-, embedder- and prefix-cache-style calls with different truncation settings
+    calls = [
+        lambda: tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False),
+        lambda: tokenizer([text[:80], text], padding=True, truncation=True, max_length=32),
+        lambda: tokenizer([text], add_special_tokens=False, truncation=True, max_length=48),
+    ]
+    errors, copies = [], set()
+    def worker(call):
+        try:
+            for _ in range(200):
+                call()
+            copies.add(id(tokenizer._get()))
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=worker, args=(call,)) for call in calls * 2]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert len(copies) == len(threads)
+    assert tokenizer("Question:")["input_ids"] == base("Question:")["input_ids"]
+    assert tokenizer.pad_token_id == base.pad_token_id
+
+
+def test_token_chunker_workers_run_alongside_embedder_tokenization(monkeypatch):
+    import transformers
+    from src.agents.chunker import chunk_text_by_tokens
+    from src.services.pipeline import Pipeline
+    base = _byte_level_tokenizer()
+    monkeypatch.setattr(transformers.AutoTokenizer, "from_pretrained", lambda name, **kwargs: base)
+    monkeypatch.setattr(registry_mod, "_tokenizer", None)
+    monkeypatch.setattr(registry_mod, "_stats", {})
+    tokenizer = registry_mod.get_tokenizer()
+    docs = [f"Question {i}. How do antibiotics affect biofilms? Biofilms protect bacteria. " * 20 for i in range(40)]
+
+    def chunker(texts):
+        for text in texts:
+            yield from chunk_text_by_tokens(text, max_tokens=24, overlap_tokens=4)
+    def embedder(chunks):
+        # embed_corpus-style batched call with truncation, on its own thread
+        for chunk in chunks:
+            tokenizer([chunk, chunk[:10]], padding=True, truncation=True, max_length=16)
+            yield chunk
+    written = []
+    (
+        Pipeline(queue_size=4, log_interval=0)
+        .add("reader", lambda: iter(docs))
+        .add("chunker", chunker, workers=2)
+        .add("embedder", embedder)
+        .add("writer", lambda chunks: (written.append(c) or c for c in chunks))
+        .run()
+    )
+    expected = [c for d in docs for c in chunk_text_by_tokens(d, max_tokens=24, overlap_tokens=4, tokenizer=base)]
+    assert sorted(written) == sorted(expected)
+
+
+def test_model_registry_int8_mode_quantizes_shared_weights(monkeypatch):
+    import copy
+    import torch
+    import transformers
+    from transformers import LlamaConfig, LlamaForCausalLM
+    torch.manual_seed(0)
+    reference = LlamaForCausalLM(LlamaConfig(
+        vocab_size=64, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2
+    )).eval()
+    monkeypatch.setattr(transformers.AutoModelForCausalLM, "from_pretrained",
+                        lambda name, **kwargs: copy.deepcopy(reference))
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    monkeypatch.setattr(registry_mod, "QUANTIZATION_MODE", "int8")
+    monkeypatch.setattr(registry_mod, "_causal_lm", None)
+    monkeypatch.setattr(registry_mod, "_stats", {})
+
+    encoder = registry_mod.get_encoder()
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicQuantizedLinear
+    assert any(isinstance(m, DynamicQuantizedLinear) for m in encoder.modules())
+    stats = registry_mod.model_stats()["causal_lm"]
+    assert stats["quantization"] == "int8"
+    assert stats["footprint_bytes"] < registry_mod._footprint_bytes(reference) / 2
+    # embeddings stay close to the float32 ones
+    ids = torch.randint(0, 64, (3, 12))
+    with torch.no_grad():
+        cos = torch.nn.functional.cosine_similarity(
+            encoder(input_ids=ids).last_hidden_state.mean(1),
+            reference.base_model(input_ids=ids).last_hidden_state.mean(1)
+        )
+    assert cos.min() > 0.99
+
+
 def test_plan_returns_reasonable_subqueries():
     query = "How do antibiotics affect biofilms and how does resistance occur?"
     subqueries = plan(query)
@@ -52,31 +360,61 @@ def test_plan_returns_reasonable_subqueries():
     assert any("biofilm" in q.lower() or "resistance" in q.lower() for q in subqueries)
 
 
+def test_planner_fast_path_parsing_and_plan_cache(monkeypatch):
+    import src.agents.planner as planner_mod
+    calls = []
+    def fake_plan_batch(queries):
+        calls.append(list(queries))
+        generated = (
+            "<think>\nThe user asks two things.\n</think>\n"
+            "Return one sub-question per line. Only output the sub-questions.\n"
+            "Question: " + queries[0] + "\n"
+            "1. How do antibiotics affect biofilms?\n"
+            "2) how do antibiotics affect biofilms\n"
+            "- How does resistance occur?\n"
+            "3. Which genes are involved?\n"
+            "4. What role does the matrix play?\n"
+        )
+        return [planner_mod.parse_subqueries(generated, q) for q in queries]
+    monkeypatch.setattr(planner_mod, "_plan_batch", fake_plan_batch)
+    monkeypatch.setattr(planner_mod, "get_batcher", lambda name, fn: None)
+    monkeypatch.setattr(planner_mod, "PLANNER_MAX_SUBQUERIES", 3)
+    monkeypatch.setattr(planner_mod, "_plan_cache", planner_mod.OrderedDict())
+
+    # Simple queries skip the LLM
+    assert plan("What is a biofilm?") == ["What is a biofilm?"]
+    assert calls == []
+
+    complex_query = "How do antibiotics affect biofilms and how does resistance occur?"
+    expected = ["How do antibiotics affect biofilms?", "How does resistance occur?", "Which genes are involved?"]
+    assert plan(complex_query) == expected
+    # Same query modulo case, spacing and punctuation: served from the plan cache
+    assert plan("  how do antibiotics affect biofilms and how does  resistance occur ") == expected
+    assert len(calls) == 1
+
+    monkeypatch.setattr(planner_mod, "PLANNER_MODE", "off")
+    assert plan(complex_query) == [complex_query]
+
+
 def test_reason_returns_contextual_answer(monkeypatch):
     import torch
     # Prevent actual model load
     monkeypatch.setattr(reasoner_mod, '_lazy_load_llm', lambda: None)
+    monkeypatch.setattr(reasoner_mod, 'PREFIX_CACHE', False)
     # Stub the LLM so .generate(...) returns a fake token list
     reasoner_mod._llm = type("M", (), {
         'device': 'cpu',
-        'generate': lambda self, **kwargs: [[0, 1, 2]]
+        'generate': lambda self, **kwargs: torch.tensor([[0, 1, 2, 3]])
     })()
 
-    # Dummy tokenizer: callable, has decode(), eos_token_id
-    class DummyEncoded(dict):
-        def __init__(self):
-            super().__init__()
-            self['input_ids'] = torch.tensor([[0, 1, 2]])
-            self['attention_mask'] = torch.tensor([[1, 1, 1]])
-        def to(self, device):
-            return self
-
+    # Dummy tokenizer: callable, has batch_decode(), eos_token_id
     class DummyTokenizer:
         eos_token_id = 0
-        def __call__(self, prompt, return_tensors, truncation, padding):
-            return DummyEncoded()
-        def decode(self, token_ids, skip_special_tokens=True):
-            return "Some prompt Answer: THE_ANS ---"
+        pad_token_id = 0
+        def __call__(self, prompts, truncation):
+            return {'input_ids': [[0, 1, 2] for _ in prompts]}
+        def batch_decode(self, token_ids, skip_special_tokens=True):
+            return ["Answer: THE_ANS ---" for _ in token_ids]
 
     # Monkey-patch tokenizer
     reasoner_mod._tokenizer_llm = DummyTokenizer()
@@ -88,10 +426,278 @@ def test_reason_returns_contextual_answer(monkeypatch):
 
 
 
+def test_prefix_cache_generation_matches_full_prefill():
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+    from src.agents.batcher import encode_left_padded
+    from src.agents.prefix_cache import PrefixCache
+    vocab = {w: i for i, w in enumerate(["[PAD]", "[UNK]"] + list("abcdefghijklmnopqrstuvwxyz"))}
+    words = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    words.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=words, pad_token="[PAD]")
+    torch.manual_seed(0)
+    model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=len(vocab), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, pad_token_id=0
+    )).double().eval()
+
+    prefix, suffixes = "a b c d e ", ["f g", "h i j k l"]
+    cache = PrefixCache(model, tokenizer, prefix)
+    kwargs = dict(max_new_tokens=6, do_sample=False, pad_token_id=0)
+    cached = model.generate(**cache.build_inputs(suffixes), **kwargs)
+    full = model.generate(**encode_left_padded(tokenizer, [prefix + s for s in suffixes], "cpu"), **kwargs)
+    # same continuations, while only the suffixes were prefilled
+    assert torch.equal(cached[:, -6:], full[:, -6:])
+    # the shared cache is not consumed by a call
+    assert torch.equal(model.generate(**cache.build_inputs(suffixes), **kwargs), cached)
+    # long suffixes fall back to a full prefill with the same result
+    cache.max_suffix_tokens = 3
+    fallback = cache.build_inputs(suffixes)
+    assert "past_key_values" not in fallback
+    assert torch.equal(model.generate(**fallback, **kwargs)[:, -6:], full[:, -6:])
+    assert cache.stats() == {"prefix_tokens": 5, "cached": 2, "full": 1, "split_mismatch": 0}
+
+
+def test_prefix_cache_checks_byte_level_token_boundary():
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+    from src.agents.batcher import encode_left_padded
+    import src.agents.planner as planner_mod
+    from src.agents.prefix_cache import PrefixCache
+    tokenizer = _byte_level_tokenizer()
+    torch.manual_seed(0)
+    model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, pad_token_id=tokenizer.pad_token_id
+    )).double().eval()
+    prompts = [planner_mod.PLAN_PROMPT.format(query=q) for q in ["How do antibiotics affect biofilms?", "How?"]]
+    kwargs = dict(max_new_tokens=4, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+    full = model.generate(**encode_left_padded(tokenizer, prompts, "cpu"), **kwargs)
+
+    # "Question: " + "How" is not how "Question: How" tokenizes: prefilled in full
+    prefix = planner_mod.PLAN_PROMPT[:planner_mod.PLAN_PROMPT.index("{query}")]
+    cache = PrefixCache(model, tokenizer, prefix)
+    inputs = cache.build_inputs([p[len(prefix):] for p in prompts])
+    assert "past_key_values" not in inputs
+    assert inputs["input_ids"][0].tolist() == tokenizer(prompts[0])["input_ids"]
+    assert cache.stats()["split_mismatch"] == 1
+
+    # the planner's prefix ends at a stable boundary and is reused
+    cache = PrefixCache(model, tokenizer, planner_mod.PLAN_PREFIX)
+    inputs = cache.build_inputs([p[len(planner_mod.PLAN_PREFIX):] for p in prompts])
+    assert "past_key_values" in inputs
+    assert torch.equal(model.generate(**inputs, **kwargs)[:, -4:], full[:, -4:])
+    assert cache.stats()["cached"] == 1 and cache.stats()["split_mismatch"] == 0
+
+
+def test_dynamic_batcher_groups_concurrent_calls():
+    import threading
+    from src.agents.batcher import DynamicBatcher
+    batches = []
+    def run_batch(items):
+        batches.append(list(items))
+        if "boom" in items:
+            raise ValueError("bad batch")
+        return [x.upper() for x in items]
+    batcher = DynamicBatcher("test", run_batch, max_batch_size=3, max_wait=0.5)
+    results = {}
+    threads = [threading.Thread(target=lambda x=x: results.update({x: batcher.submit(x)})) for x in "abcd"]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # every caller gets its own result; calls arriving together share a batch
+    assert results == {x: x.upper() for x in "abcd"}
+    assert sorted(len(b) for b in batches) == [1, 3]
+    with pytest.raises(ValueError):
+        batcher.submit("boom")
+    stats = batcher.stats()
+    assert stats["requests"] == 5 and stats["batches"] == 3 and stats["failed_batches"] == 1
+    assert stats["latency_ms"]["p50"] >= stats["queue_wait_ms"]["p50"]
+
+
+def test_reason_stream_surfaces_generate_errors_and_stalls(monkeypatch):
+    import queue
+    import threading
+    import time
+    from transformers.generation.stopping_criteria import StoppingCriteriaList
+    monkeypatch.setattr(reasoner_mod, "_prepare_generation", lambda q, c: {"stopping_criteria": StoppingCriteriaList()})
+    monkeypatch.setattr(reasoner_mod, "_tokenizer_llm", object())
+
+    class FailingLLM:
+        def generate(self, **kwargs):
+            raise RuntimeError("CUDA out of memory")
+    monkeypatch.setattr(reasoner_mod, "_llm", FailingLLM())
+    with pytest.raises(RuntimeError, match="out of memory"):
+        list(reasoner_mod.reason_stream("q", ["ctx"]))
+
+    class StalledLLM:
+        def generate(self, stopping_criteria, **kwargs):
+            # Produces nothing until the reader gives up and sets the stop event
+            while not stopping_criteria[0](None, None):
+                time.sleep(0.01)
+    monkeypatch.setattr(reasoner_mod, "_llm", StalledLLM())
+    monkeypatch.setattr(reasoner_mod, "STREAM_TOKEN_TIMEOUT", 0.05)
+    with pytest.raises(queue.Empty):
+        list(reasoner_mod.reason_stream("q", ["ctx"]))
+
+    # A generate stuck inside one step never checks the stop event: the
+    # reader still gets its error instead of waiting on the thread
+    release = threading.Event()
+    class HungLLM:
+        def generate(self, **kwargs):
+            release.wait(10)
+    monkeypatch.setattr(reasoner_mod, "_llm", HungLLM())
+    started = time.perf_counter()
+    with pytest.raises(queue.Empty):
+        list(reasoner_mod.reason_stream("q", ["ctx"]))
+    assert time.perf_counter() - started < 2
+    release.set()
+
+
+def test_stop_on_sequences_only_inspects_generated_tail():
+    import torch
+
+    class CharTokenizer:
+        def __init__(self):
+            self.decoded_lengths = []
+        def batch_decode(self, rows, skip_special_tokens=True):
+            self.decoded_lengths.append(rows.shape[1])
+            return ["".join(chr(i) for i in row.tolist()) for row in rows]
+
+    tok = CharTokenizer()
+    prompt = [ord(c) for c in "Context --- Question: q\nAnswer:" * 20]
+    criteria = reasoner_mod.StopOnSequences(tok, ["Question:", "---"], prompt_length=len(prompt))
+
+    # The prompt is full of stop strings, but only generated text counts
+    ids = torch.tensor([prompt + [ord(c) for c in "Biofilms"]])
+    assert criteria(ids, None).tolist() == [False]
+    ids = torch.tensor([prompt + [ord(c) for c in "Biofilms.\nQuestion:"]])
+    assert criteria(ids, None).tolist() == [True]
+    # Each step decodes a bounded tail, never the whole sequence
+    assert max(tok.decoded_lengths) == len("Question:") + 1
+
+
+@pytest.mark.parametrize("pieces,expected", [
+    # stop marker split across pieces, plus a repeated "Answer:" cue
+    ([" Answer: Bio", "films resist.\n-", "-- extra"], "Biofilms resist."),
+    (["Antibiotics fail. Question", ": what else"], "Antibiotics fail."),
+    # a leading "I don't know" is the answer, a trailing one is cut
+    (["I don", "'t know."], "I don't know."),
+    (["Yes. I don't ", "know why"], "Yes."),
+])
+def test_answer_trimmer_matches_batch_trimming(pieces, expected):
+    trimmer = reasoner_mod.AnswerTrimmer()
+    out = "".join(trimmer.feed(p) for p in pieces) + trimmer.flush()
+    assert out == expected
+
+
 def test_execute_orchestrates_agents(monkeypatch):
+    monkeypatch.setattr(executor_mod, '_get_answer_cache', lambda: None)
     monkeypatch.setattr(executor_mod, 'plan', lambda q: ['s1', 's2'])
     monkeypatch.setattr(executor_mod, 'init_es_client', lambda: None)
-    monkeypatch.setattr(executor_mod, 'retrieve', lambda sq, es, top_k: [{'text': sq + '_ctx'}])
+    monkeypatch.setattr(executor_mod, 'retrieve_many', lambda sqs, es, top_k: [[{'text': sq + '_ctx'}] for sq in sqs])
+    monkeypatch.setattr(executor_mod, 'assemble_context', lambda hit_lists: [h['text'] for hits in hit_lists for h in hits])
     monkeypatch.setattr(executor_mod, 'reason', lambda q, ctx: 'ANS:' + '|'.join(ctx))
     result = executor_mod.execute("input")
     assert result == "ANS:s1_ctx|s2_ctx"
+
+
+def test_assemble_context_dedupes_merges_and_packs_to_budget():
+    from src.agents.context_assembler import assemble_context
+    class WordTokenizer:
+        def __call__(self, texts, add_special_tokens):
+            return {"input_ids": [t.split() or [0] for t in texts]}
+        def decode(self, ids, skip_special_tokens):
+            return " ".join(ids)
+    def hit(chunk_id, text, score, file_path="f"):
+        return {"file_path": file_path, "section": "S", "chunk_id": chunk_id, "text": text, "score": score}
+    overlap = "shared words across both chunks"
+    hit_lists = [
+        [hit(0, "alpha beta " + overlap, 1.0), hit(5, "low scoring far away chunk", 0.2)],
+        # same chunk again from another subquery, and its right neighbour
+        [hit(0, "alpha beta " + overlap, 3.0), hit(1, overlap + " gamma", 2.0), hit(0, "other file", 2.5, "g")],
+    ]
+    context = assemble_context(hit_lists, max_tokens=100, tokenizer=WordTokenizer())
+    assert context == [
+        "alpha beta shared words across both chunks gamma",   # merged, best score 3.0
+        "other file",
+        "low scoring far away chunk",
+    ]
+    # the budget (blocks + separators) drops what does not fit
+    assert assemble_context(hit_lists, max_tokens=11, tokenizer=WordTokenizer()) == context[:2]
+    # a single block over budget is truncated rather than dropped
+    assert assemble_context(hit_lists, max_tokens=3, tokenizer=WordTokenizer()) == ["alpha beta shared"]
+
+
+def test_reranker_reorders_in_batches_and_falls_back_over_budget(monkeypatch):
+    import time
+    import src.agents.reranker as reranker_mod
+    batches = []
+    def fake_score_pairs(pairs):
+        batches.append(len(pairs))
+        time.sleep(0.02)
+        # relevance = words shared with the query
+        return [float(len(set(q.split()) & set(t.split()))) for q, t in pairs]
+    monkeypatch.setattr(reranker_mod, "_lazy_load", lambda: None)
+    monkeypatch.setattr(reranker_mod, "score_pairs", fake_score_pairs)
+    monkeypatch.setattr(reranker_mod, "RERANK_BATCH_SIZE", 2)
+    monkeypatch.setattr(reranker_mod, "_stats", {"calls": 0, "pairs": 0, "fallbacks": 0, "total_ms": 0.0, "max_ms": 0.0})
+    hit_lists = [
+        [{"text": "unrelated", "score": 9.0}, {"text": "biofilm tolerance", "score": 5.0}, {"text": "biofilm", "score": 4.0}],
+        [{"text": "quorum sensing", "score": 1.0}],
+    ]
+    queries = ["biofilm tolerance", "quorum sensing"]
+
+    reranked = reranker_mod.rerank_many(queries, hit_lists, top_k=2, budget_ms=0)
+    assert batches == [2, 2]
+    assert [h["text"] for h in reranked[0]] == ["biofilm tolerance", "biofilm"]
+    assert reranked[0][0]["score"] == 2.0 and reranked[1][0]["text"] == "quorum sensing"
+
+    # The first batch shows the rest cannot finish in time: search order, cut to top_k
+    batches.clear()
+    fallback = reranker_mod.rerank_many(queries, hit_lists, top_k=2, budget_ms=30)
+    assert batches == [2]
+    assert fallback == [hit_lists[0][:2], hit_lists[1]]
+    assert reranker_mod.reranker_stats()["fallbacks"] == 1
+    assert reranker_mod.reranker_stats()["pairs"] == 6
+
+
+def test_execute_serves_similar_queries_from_answer_cache(monkeypatch):
+    from src.agents.answer_cache import AnswerCache
+    cache = AnswerCache(threshold=0.95, ttl=60, max_entries=4)
+    monkeypatch.setattr(executor_mod, '_get_answer_cache', lambda: cache)
+    vectors = {"what are biofilms": [1.0, 0.0], "What are biofilms?": [0.99, 0.05], "how do microbes grow": [0.0, 1.0]}
+    monkeypatch.setattr(executor_mod, 'embed_text', lambda q: vectors[q])
+    monkeypatch.setattr(executor_mod, 'plan', lambda q: [q])
+    monkeypatch.setattr(executor_mod, 'init_es_client', lambda: None)
+    monkeypatch.setattr(executor_mod, 'retrieve_many', lambda sqs, es, top_k: [[{'text': 'ctx'}]])
+    monkeypatch.setattr(executor_mod, 'assemble_context', lambda hit_lists: ['ctx'])
+    calls = []
+    monkeypatch.setattr(executor_mod, 'reason', lambda q, ctx: calls.append(q) or 'ANS:' + q)
+
+    assert executor_mod.execute("what are biofilms") == "ANS:what are biofilms"
+    assert executor_mod.execute("What are biofilms?") == "ANS:what are biofilms"
+    assert executor_mod.execute("how do microbes grow") == "ANS:how do microbes grow"
+    assert calls == ["what are biofilms", "how do microbes grow"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_answer_cache_expires_and_invalidates_on_index_rebuild(monkeypatch, tmp_path):
+    from src.agents import answer_cache as answer_cache_mod
+    generation = tmp_path / "generation"
+    cache = answer_cache_mod.AnswerCache(threshold=0.9, ttl=100, max_entries=2, generation_file=str(generation))
+    cache.store([1.0, 0.0], "A")
+    assert cache.lookup([1.0, 0.0]) == "A"
+
+    # The indexer (possibly another process) rebuilds the index
+    answer_cache_mod.mark_index_rebuilt(str(generation))
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["invalidations"] == 1
+
+    cache.store([0.0, 1.0], "B")
+    now = answer_cache_mod.time.time()
+    monkeypatch.setattr(answer_cache_mod.time, "time", lambda: now + 101)
+    assert cache.lookup([0.0, 1.0]) is None
+    assert cache.stats()["expired"] == 1
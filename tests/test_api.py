@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api as api_mod
+from src.inference_pool import InferencePool, QueueFullError
+
+
+@pytest.fixture
+def client():
+    return TestClient(api_mod.app)
+
+
+def test_generate_response_runs_rag_on_inference_pool(monkeypatch, client):
+    seen = {}
+    def fake_generate(query):
+        seen["thread"] = threading.current_thread().name
+        return "ctx Answer: Biofilms resist\nantibiotics Question: next", query
+    monkeypatch.setattr(api_mod.rag_model, "generate_response", fake_generate)
+
+    resp = client.post("/generate-response/", json={"query": "Why?"})
+
+    assert resp.status_code == 200
+    assert resp.json() == {"response": "Biofilms resist antibiotics.", "question": "Why?"}
+    assert seen["thread"].startswith("inference")
+
+
+def test_generate_response_returns_429_when_queue_full(monkeypatch, client):
+    pool = InferencePool(max_workers=1, max_queue=0)
+    monkeypatch.setattr(api_mod, "inference_pool", pool)
+    # Occupy the only slot as if a generation were running
+    pool._acquire()
+
+    resp = client.post("/generate-response/", json={"query": "What is a biofilm?"})
+
+    assert resp.status_code == 429
+    assert pool.stats()["rejected"] == 1
+
+
+def test_generate_response_times_out_with_504(monkeypatch, client):
+    monkeypatch.setattr(api_mod, "inference_pool", InferencePool(max_workers=1, max_queue=1))
+    monkeypatch.setattr(api_mod, "REQUEST_TIMEOUT", 0.05)
+    monkeypatch.setattr(api_mod.rag_model, "generate_response", lambda q: time.sleep(0.3) or ("x", q))
+
+    resp = client.post("/generate-response/", json={"query": "slow question"})
+
+    assert resp.status_code == 504
+    assert api_mod.inference_pool.stats()["timed_out"] == 1
+
+
+def test_inference_pool_frees_slot_only_when_work_finishes():
+    pool = InferencePool(max_workers=1, max_queue=0)
+    gate = threading.Event()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(gate.wait, timeout=0.01)
+        # The timed-out call is still running, so capacity is still taken
+        with pytest.raises(QueueFullError):
+            await pool.run(lambda: None)
+        gate.set()
+        await asyncio.sleep(0.05)
+        return await pool.run(lambda: "done")
+
+    assert asyncio.run(scenario()) == "done"
+    pool.shutdown()
+
+
+def test_generate_response_stream_emits_sse_tokens_then_done(monkeypatch, client):
+    monkeypatch.setattr(api_mod.rag_model, "stream_response", lambda q: iter(["Biofilms ", "resist\n", "drugs"]))
+
+    resp = client.post("/generate-response/stream", json={"query": "Why?"})
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    frames = [f for f in resp.text.split("\n\n") if f]
+    assert frames[:3] == [
+        'data: {"token": "Biofilms "}',
+        'data: {"token": "resist\\n"}',
+        'data: {"token": "drugs"}',
+    ]
+    assert frames[3] == 'event: done\ndata: {"response": "Biofilms resist drugs.", "question": "Why?"}'
+
+
+def test_generate_response_stream_reports_errors_as_events(monkeypatch, client):
+    def failing(q):
+        yield "partial"
+        raise RuntimeError("boom")
+    monkeypatch.setattr(api_mod.rag_model, "stream_response", failing)
+
+    resp = client.post("/generate-response/stream", json={"query": "Why?"})
+
+    assert resp.text.endswith('event: error\ndata: {"detail": "boom"}\n\n')
+
+
+def test_api_import_is_light_and_startup_warms_up_in_background(monkeypatch):
+    import os
+    import subprocess
+    import sys
+    import types
+    # Importing the app must not pull in torch/transformers (that is the warm-up's job)
+    code = "import sys, src.api; print(sorted(m for m in ('torch', 'transformers') if m in sys.modules))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+    gate = threading.Event()
+    def fake_warm_up():
+        gate.wait(5)
+        return {"llm": 1.0}
+    monkeypatch.setattr(api_mod, "_pipeline", lambda: types.SimpleNamespace(warm_up=fake_warm_up))
+    monkeypatch.setattr(api_mod, "_warmup", {"state": "pending", "seconds": {}, "error": None})
+    monkeypatch.setattr(api_mod, "WARMUP_ON_STARTUP", True)
+    monkeypatch.setattr(api_mod, "inference_pool", InferencePool(max_workers=1, max_queue=0))
+
+    with TestClient(api_mod.app) as client:
+        # The server answers while the models are still loading
+        resp = client.get("/ready")
+        assert resp.status_code == 503 and resp.json()["state"] == "running"
+        gate.set()
+        for _ in range(100):
+            resp = client.get("/ready")
+            if resp.status_code == 200:
+                break
+            time.sleep(0.01)
+        assert resp.json()["ready"] is True
+        assert resp.json()["seconds"]["llm"] == 1.0
+
+
+def test_elasticsearch_ping_is_quick_and_skipped_for_local_index(monkeypatch):
+    options = []
+    class FakeClient:
+        def options(self, **kwargs):
+            options.append(kwargs)
+            return self
+        async def ping(self):
+            return True
+    monkeypatch.setattr(api_mod, "get_async_es_client", FakeClient)
+    monkeypatch.setattr(api_mod, "RETRIEVAL_BACKEND", "elasticsearch")
+    assert asyncio.run(api_mod._elasticsearch_reachable()) is True
+    assert options == [{"request_timeout": 1, "max_retries": 0, "retry_on_timeout": False}]
+    monkeypatch.setattr(api_mod, "RETRIEVAL_BACKEND", "local")
+    assert asyncio.run(api_mod._elasticsearch_reachable()) is None
+    assert len(options) == 1
+
+
+def test_health_reports_local_index_only_once_loaded(monkeypatch, client, tmp_path):
+    import src.services.local_index as local_mod
+    monkeypatch.setattr(api_mod, "RETRIEVAL_BACKEND", "local")
+    monkeypatch.setattr(local_mod, "_index", None)
+    monkeypatch.setattr(local_mod, "LocalIndex", lambda *a, **k: pytest.fail("index loaded by /health"))
+    resp = client.get("/health")
+    assert resp.status_code == 200
+    assert "chunks" not in resp.json()["retrieval"]
+
+    # a loaded index reports its snapshot without going back to disk
+    loaded = type("Loaded", (), {"stats": lambda self, reload=True: {"chunks": 3, "reloaded": reload}})()
+    monkeypatch.setattr(local_mod, "_index", loaded)
+    retrieval = client.get("/health").json()["retrieval"]
+    assert retrieval["chunks"] == 3 and retrieval["reloaded"] is False
@@ -8,7 +8,7 @@ from src.services.docs_loader import load_documents
 # Indexer
 from src.services.indexer import index_documents
 # Retriever
-from src.services.retriever import retrieve
+from src.services.retriever import retrieve, retrieve_many
 # Delete index
 from src.services.delete_index import delete_index
 
@@ -31,8 +31,23 @@ def test_load_documents_creates_entries_per_section(tmp_path):
     types = sorted(doc["section"] for doc in docs)
     assert types == ["FULL_TEXT", "INTRODUCTION"]
 
+def test_iter_documents_streams_filters_and_shards(monkeypatch, tmp_path):
+    from src.services.docs_loader import iter_documents
+    d = tmp_path / "docs"; (d / "sub").mkdir(parents=True)
+    for name in ["a.txt", "b.txt", "c.md", "sub/d.txt"]:
+        (d / name).write_text(f"text of {name}")
+    docs = iter_documents(str(d))
+    assert next(docs)["file_path"] == "a.txt"  # lazy, in path order
+    assert sorted(doc["file_path"] for doc in iter_documents(str(d), patterns=["*.md", "sub/*.txt"])) == ["c.md", "sub/d.txt"]
+    # shards partition the corpus
+    shards = [{doc["file_path"] for doc in iter_documents(str(d), shard=i, num_shards=2)} for i in range(2)]
+    assert shards[0] | shards[1] == {"a.txt", "b.txt", "sub/d.txt"} and not shards[0] & shards[1]
+    # large files are read through a memory map with the same result
+    monkeypatch.setattr('src.services.docs_loader.DOCS_MMAP_THRESHOLD', 1)
+    assert [doc["text"] for doc in iter_documents(str(d), patterns=["c.md"])] == ["text of c.md"]
+
 # 3) indexer.py → index_documents
-def test_index_documents_uses_bulk_and_chunks(monkeypatch):
+def test_index_documents_uses_bulk_and_chunks(monkeypatch, tmp_path):
     # dummy ES client
     class DummyEs:
         def __init__(self):
@@ -40,17 +55,288 @@ def test_index_documents_uses_bulk_and_chunks(monkeypatch):
         def index(self, **kw): pass
     es = DummyEs()
     # stub dependencies on src.services.indexer
-    monkeypatch.setattr('src.services.indexer.load_documents', lambda folder: [{"file_path":"f","section":"S","text":"abcd"}])
-    monkeypatch.setattr('src.services.indexer.chunk_text', lambda t: ["ab","cd"] )
-    monkeypatch.setattr('src.services.indexer.embed_texts', lambda ch: [[0.1],[0.2]])
+    monkeypatch.setattr('src.services.indexer.iter_documents',
+                        lambda folder, **kw: iter([{"file_path":"f","section":"S","text":"abcd"}]))
+    monkeypatch.setattr('src.services.indexer.chunk_document', lambda t: ["ab","cd"] )
+    monkeypatch.setattr('src.services.indexer.embed_corpus',
+                        lambda items, get_text, stats=None: ((it, [0.1]) for it in items))
     called = {"bulk": False}
-    def fake_bulk(es_arg, actions, stats_only):
+    def fake_streaming_bulk(es_arg, actions, **kwargs):
         called["bulk"] = True
-        return (len(actions), 0)
-    monkeypatch.setattr('src.services.indexer.bulk', fake_bulk)
+        for a in actions:
+            yield True, {"index": {"_id": a["_id"]}}
+    monkeypatch.setattr('src.services.indexer.streaming_bulk', fake_streaming_bulk)
+    monkeypatch.setattr('src.services.indexer.parallel_bulk', fake_streaming_bulk)
+    monkeypatch.setattr('src.services.indexer.mark_index_rebuilt', lambda path: None)
+    monkeypatch.setattr('src.services.indexer.INDEX_MANIFEST_PATH', str(tmp_path / "manifest.json"))
     index_documents(es)
     assert called["bulk"] is True
 
+
+def test_index_documents_incrementally_reindexes_only_changes(monkeypatch, tmp_path):
+    corpus = {"f": "abcd"}
+    monkeypatch.setattr('src.services.indexer.iter_documents',
+                        lambda folder, **kw: ({"file_path": fp, "section": "S", "text": t} for fp, t in corpus.items()))
+    monkeypatch.setattr('src.services.indexer.chunk_document', lambda t: [t[i:i + 2] for i in range(0, len(t), 2)])
+    embedded = []
+    def fake_embed_corpus(items, get_text, stats=None):
+        for item in items:
+            embedded.append(get_text(item))
+            yield item, [0.1]
+    monkeypatch.setattr('src.services.indexer.embed_corpus', fake_embed_corpus)
+    ops = []
+    def fake_bulk(es_arg, actions, stats_only, **kwargs):
+        ops.extend((a["_op_type"], a.get("_source", {}).get("text")) for a in actions)
+        return (len(actions), 0)
+    def fake_streaming_bulk(es_arg, actions, **kwargs):
+        for a in actions:
+            fake_bulk(es_arg, [a], True)
+            yield True, {"index": {"_id": a["_id"]}}
+    monkeypatch.setattr('src.services.indexer.bulk', fake_bulk)
+    monkeypatch.setattr('src.services.indexer.streaming_bulk', fake_streaming_bulk)
+    monkeypatch.setattr('src.services.indexer.parallel_bulk', fake_streaming_bulk)
+    rebuilt = []
+    monkeypatch.setattr('src.services.indexer.mark_index_rebuilt', rebuilt.append)
+    monkeypatch.setattr('src.services.indexer.INDEX_MANIFEST_PATH', str(tmp_path / "manifest.json"))
+
+    index_documents(None)
+    assert embedded == ["ab", "cd"]
+    assert len(rebuilt) == 1
+
+    # Unchanged corpus: nothing is embedded or written, cached answers stay valid
+    embedded.clear(); ops.clear()
+    index_documents(None)
+    assert embedded == [] and ops == []
+    assert len(rebuilt) == 1
+
+    # One chunk changed: only it is embedded, the stale version is deleted
+    corpus["f"] = "abXY"
+    index_documents(None)
+    assert embedded == ["XY"]
+    assert ops == [("index", "XY"), ("delete", None)]
+    assert len(rebuilt) == 2
+
+    # File removed: all of its chunks are deleted
+    ops.clear()
+    del corpus["f"]
+    index_documents(None)
+    assert ops == [("delete", None), ("delete", None)]
+
+    # Deterministic IDs: a full re-index overwrites instead of duplicating
+    from src.services.index_manifest import chunk_doc_id
+    assert chunk_doc_id("f", "S", 0, "ab") == chunk_doc_id("f", "S", 0, "ab") != chunk_doc_id("f", "S", 1, "ab")
+
+
+def test_index_documents_batches_manifest_writes_and_stale_deletes(monkeypatch, tmp_path):
+    import src.services.indexer as indexer_mod
+    corpus = {f"f{i}": "ab" for i in range(10)}
+    monkeypatch.setattr(indexer_mod, 'iter_documents',
+                        lambda folder, **kw: ({"file_path": fp, "section": "S", "text": t} for fp, t in corpus.items()))
+    monkeypatch.setattr(indexer_mod, 'chunk_document', lambda t: [t])
+    monkeypatch.setattr(indexer_mod, 'embed_corpus', lambda items, get_text, stats=None: ((it, [0.1]) for it in items))
+    deletes = []
+    def fake_bulk(es_arg, actions, stats_only, **kwargs):
+        deletes.append(len(actions))
+        return (len(actions), 0)
+    def fake_streaming_bulk(es_arg, actions, **kwargs):
+        for a in actions:
+            yield True, {"index": {"_id": a["_id"]}}
+    monkeypatch.setattr(indexer_mod, 'bulk', fake_bulk)
+    monkeypatch.setattr(indexer_mod, 'streaming_bulk', fake_streaming_bulk)
+    monkeypatch.setattr(indexer_mod, 'parallel_bulk', fake_streaming_bulk)
+    monkeypatch.setattr(indexer_mod, 'mark_index_rebuilt', lambda path: None)
+    monkeypatch.setattr(indexer_mod, 'INDEX_MANIFEST_PATH', str(tmp_path / "manifest.json"))
+    monkeypatch.setattr(indexer_mod, 'INDEX_MANIFEST_FLUSH_FILES', 4)
+    monkeypatch.setattr(indexer_mod, 'INDEX_MANIFEST_FLUSH_SECONDS', 1e9)
+    writes = []
+    real_save = indexer_mod.save_manifest
+    def counting_save(path, index_name, files):
+        writes.append(len(files))
+        real_save(path, index_name, files)
+    monkeypatch.setattr(indexer_mod, 'save_manifest', counting_save)
+
+    index_documents(None)
+    # every 4 finished files plus the end of the run, not once per file
+    assert len(writes) <= 4 and writes[-1] == 10
+
+    # every file changed: the stale chunks are deleted in a few bulk requests
+    corpus.update({fp: "cd" for fp in corpus})
+    index_documents(None)
+    assert sum(deletes) == 10 and len(deletes) <= 3
+    assert indexer_mod.load_manifest(str(tmp_path / "manifest.json"), indexer_mod.INDEX_NAME)["f0"]["complete"]
+
+def test_create_index_uses_backend_dims_and_refuses_other_models(monkeypatch, tmp_path):
+    import src.services.indexer as indexer_mod
+    backend = type("Backend", (), {"name": "sentence-transformers", "model_id": "mini", "dims": 384})()
+    monkeypatch.setattr(indexer_mod, "get_backend", lambda: backend)
+    monkeypatch.setattr(indexer_mod, "embedding_dims", lambda: backend.dims)
+    monkeypatch.setattr(indexer_mod, "INDEX_MANIFEST_PATH", str(tmp_path / "manifest.json"))
+    class DummyIndices:
+        def __init__(self):
+            self.created = None
+        def exists(self, index):
+            return self.created is not None
+        def create(self, index, body):
+            self.created = body
+        def get_mapping(self, index):
+            return {index: self.created}
+    es = type("Es", (), {"indices": DummyIndices()})()
+
+    indexer_mod.create_index(es)
+    mappings = es.indices.created["mappings"]
+    assert mappings["properties"]["vector"]["dims"] == 384
+    assert mappings["_meta"]["embedding_model"] == "mini"
+    indexer_mod.create_index(es)  # same backend: reused
+    backend.model_id, backend.dims = "other", 768
+    with pytest.raises(ValueError):
+        indexer_mod.create_index(es)
+
+
+def test_local_index_backend_indexes_searches_and_reloads(monkeypatch, tmp_path):
+    import numpy as np
+    import src.services.indexer as indexer_mod
+    import src.services.local_index as local_mod
+    import src.services.retriever as retriever_mod
+    texts = {"a": "biofilms resist antibiotics", "b": "gene expression in bacteria", "c": "growth rates of cells"}
+    vectors = {"a": [1.0, 0.0], "b": [0.0, 1.0], "c": [0.7, 0.7]}
+    monkeypatch.setattr(indexer_mod, 'iter_documents',
+                        lambda folder, **kw: iter([{"file_path": "f", "section": "S", "text": "abc"}]))
+    monkeypatch.setattr(indexer_mod, 'chunk_document', lambda t: [texts[c] for c in t])
+    monkeypatch.setattr(indexer_mod, 'embed_corpus', lambda items, get_text, stats=None: (
+        (it, vectors[next(k for k, v in texts.items() if v == it["text"])]) for it in items))
+    monkeypatch.setattr(indexer_mod, 'mark_index_rebuilt', lambda path: None)
+    monkeypatch.setattr(indexer_mod, 'INDEX_MANIFEST_PATH', str(tmp_path / "manifest.json"))
+    # build the IVF structure even for three chunks
+    monkeypatch.setattr(local_mod, 'LOCAL_INDEX_ANN_MIN_DOCS', 1)
+    monkeypatch.setattr(local_mod, 'LOCAL_INDEX_NLIST', 2)
+    local = local_mod.LocalIndex(str(tmp_path / "local"), dtype="float16")
+    local.create({"embedding_dims": 2})
+    index_documents(local)
+    assert local.stats()["chunks"] == 3 and local.stats()["ivf_lists"] == 2
+
+    monkeypatch.setattr(retriever_mod, 'RETRIEVAL_BACKEND', "local")
+    monkeypatch.setattr(retriever_mod, 'get_local_index', lambda: local)
+    monkeypatch.setattr(retriever_mod, 'embed_texts', lambda q: [[1.0, 0.1], [0.0, 1.0]])
+    hits = retrieve_many(["antibiotics", "bacteria genes"], None, 2)
+    assert [h["text"] for h in hits[0]] == [texts["a"], texts["c"]]
+    assert hits[1][0]["text"] == texts["b"] and hits[1][0]["chunk_id"] == 1
+    # the lexical half: BM25 ranks the only matching chunk first
+    assert local.bm25.scores("growth").argmax() == [d["text"] for d in local.docs].index(texts["c"])
+
+    # a second process sees the saved index; removed chunks are deleted
+    monkeypatch.setattr(indexer_mod, 'iter_documents',
+                        lambda folder, **kw: iter([{"file_path": "f", "section": "S", "text": "a"}]))
+    index_documents(local)
+    reloaded = local_mod.LocalIndex(str(tmp_path / "local"))
+    assert [d["text"] for d in reloaded.docs] == [texts["a"]]
+    assert reloaded.vectors.dtype == np.float16
+
+
+def test_local_index_reader_keeps_snapshot_during_save(monkeypatch, tmp_path):
+    import src.services.local_index as local_mod
+    def write(index, texts):
+        list(index.bulk({"_id": t, "_source": {"file_path": t, "section": "", "chunk_id": 0, "text": t, "vector": [1.0, 0.0]}}
+                        for t in texts))
+        index.save()
+    writer = local_mod.LocalIndex(str(tmp_path / "local"))
+    writer.create({"embedding_dims": 2})
+    write(writer, ["old"])
+    reader = local_mod.LocalIndex(str(tmp_path / "local"))
+    write(writer, ["new"])
+
+    # the folder is swapped out from under the reload: the old snapshot stays
+    real_load = local_mod.BM25.load
+    monkeypatch.setattr(local_mod.BM25, "load", lambda folder: (_ for _ in ()).throw(FileNotFoundError(folder)))
+    reader._reload_if_changed()
+    assert [d["text"] for d in reader.docs] == ["old"]
+    monkeypatch.setattr(local_mod.BM25, "load", real_load)
+    reader._reload_if_changed()
+    assert sorted(d["text"] for d in reader.docs) == ["new", "old"]
+
+
+def test_local_index_search_uses_one_snapshot_across_a_save(monkeypatch, tmp_path):
+    import src.services.local_index as local_mod
+    def write(index, vectors):
+        list(index.bulk({"_id": t, "_source": {"file_path": t, "section": "", "chunk_id": 0, "text": t, "vector": v}}
+                        for t, v in vectors.items()))
+        index.save()
+    writer = local_mod.LocalIndex(str(tmp_path / "local"))
+    writer.create({"embedding_dims": 2})
+    write(writer, {"old": [1.0, 0.0]})
+    reader = local_mod.LocalIndex(str(tmp_path / "local"))
+
+    # the indexer saves after the BM25 leg read the index, before the kNN leg
+    real_knn = local_mod.LocalIndex._knn
+    def knn_after_save(snapshot, *args, **kwargs):
+        write(writer, {"new": [0.0, 1.0], "newer": [0.0, 1.0]})
+        reader._reload_if_changed()
+        return real_knn(snapshot, *args, **kwargs)
+    monkeypatch.setattr(local_mod.LocalIndex, "_knn", staticmethod(knn_after_save))
+    hits = reader.search_many(["old"], [[0.0, 1.0]], 3, min_score=0)
+    assert [h["text"] for h in hits[0]] == ["old"]
+    # the next search sees the new snapshot
+    monkeypatch.setattr(local_mod.LocalIndex, "_knn", staticmethod(real_knn))
+    hits = reader.search_many(["new"], [[0.0, 1.0]], 3, min_score=0)
+    assert sorted(h["text"] for h in hits[0]) == ["new", "newer", "old"]
+
+
+def test_bm25_scores_match_lucene():
+    import math
+    from src.services.local_index import BM25
+    bm25 = BM25.build(["apple banana", "apple"])
+    # idf * tf / (tf + k1 * (1 - b + b * dl / avgdl)), as Elasticsearch's explain API reports it
+    assert bm25.scores("banana") == pytest.approx([math.log(2) / 2.5, 0.0])
+    assert bm25.scores("apple") == pytest.approx([math.log(1.2) / 2.5, math.log(1.2) / 1.9])
+
+
+def test_vector_codec_encodes_compact_bulk_documents(monkeypatch):
+    import json
+    import numpy as np
+    import src.services.vector_codec as codec
+    serializer = codec.VectorJsonSerializer()
+    vector = np.array([0.1, -2.5, 1e-7], dtype=np.float32)
+    doc = {"text": "a", "vector": codec.to_stored(vector)}
+    body = serializer.dumps(doc)
+    # same JSON document, float32 values round-trip exactly
+    assert np.array_equal(np.array(json.loads(body)["vector"], dtype=np.float32), vector)
+    assert len(body) < len(json.dumps({"text": "a", "vector": vector.tolist()}))
+
+    monkeypatch.setattr(codec, "VECTOR_STORAGE", "byte")
+    assert codec.vector_mapping(3)["element_type"] == "byte"
+    stored = codec.to_stored(vector)
+    assert stored.dtype == np.int8 and stored.tolist() == [5, -127, 0]
+    assert codec.query_vector([0.1, -2.5, 0.0]) == [5, -127, 0]
+    assert json.loads(serializer.dumps({"vector": stored})) == {"vector": [5, -127, 0]}
+    monkeypatch.setattr(codec, "VECTOR_HEX_ENCODING", True)
+    assert json.loads(serializer.dumps({"vector": stored})) == {"vector": "0581" + "00"}
+
+
+def test_pipeline_runs_stages_concurrently_and_propagates_errors():
+    from src.services.pipeline import Pipeline
+    written = []
+    def write(items):
+        for item in items:
+            written.append(item)
+            yield item
+    pipe = (
+        Pipeline(queue_size=2, log_interval=0)
+        .add("reader", lambda: iter(range(20)))
+        .add("double", lambda xs: (x * 2 for x in xs), workers=3)
+        .add("writer", write)
+    )
+    pipe.run()
+    assert sorted(written) == [x * 2 for x in range(20)]
+    assert pipe.stats() == {"reader": 20, "double": 20, "writer": 20}
+
+    def broken(xs):
+        for x in xs:
+            if x == 5:
+                raise ValueError("bad item")
+            yield x
+    pipe = Pipeline(queue_size=2, log_interval=0).add("reader", lambda: iter(range(100))).add("broken", broken)
+    with pytest.raises(ValueError, match="bad item"):
+        pipe.run()
+
 # 4) retriever.py → retrieve
 def test_retrieve_parses_es_response(monkeypatch):
     fake_resp = {"hits": {"hits":[{"_score":5.5,"_source":{"file_path":"x","section":"Y","chunk_id":1,"text":"T"}}]}}
@@ -61,6 +347,62 @@ def test_retrieve_parses_es_response(monkeypatch):
     results = retrieve("q", E(), top_k=1)
     assert results == [{"file_path":"x","section":"Y","chunk_id":1,"text":"T","score":5.5}]
 
+def test_retrieve_many_embeds_once_and_uses_single_msearch(monkeypatch):
+    embed_calls = []
+    def fake_embed_texts(texts):
+        embed_calls.append(list(texts))
+        return [[float(i)] for i, _ in enumerate(texts)]
+    monkeypatch.setattr('src.services.retriever.embed_texts', fake_embed_texts)
+    class E:
+        def __init__(self):
+            self.calls = []
+        def msearch(self, searches):
+            self.calls.append(searches)
+            return {"responses": [
+                {"hits": {"hits": [{"_score": 1.0, "_source": {"file_path": "a", "section": "S", "chunk_id": 0, "text": "A"}}]}},
+                {"error": {"type": "search_phase_execution_exception"}},
+            ]}
+    es = E()
+    results = retrieve_many(["q1", "q2"], es, top_k=3)
+
+    assert embed_calls == [["q1", "q2"]]
+    assert len(es.calls) == 1
+    searches = es.calls[0]
+    from src.config import INDEX_NAME
+    assert searches[0::2] == [{"index": INDEX_NAME}, {"index": INDEX_NAME}]
+    assert searches[1]["query"]["script_score"]["query"]["bool"]["should"][1]["knn"]["query_vector"] == [0.0]
+    assert results == [[{"file_path": "a", "section": "S", "chunk_id": 0, "text": "A", "score": 1.0}], []]
+
+def test_retrieve_many_rrf_fuses_lexical_and_vector_legs(monkeypatch):
+    import src.services.retriever as retriever
+    monkeypatch.setattr(retriever, "HYBRID_MODE", "rrf")
+    monkeypatch.setattr(retriever, "_leg_stats", {})
+    monkeypatch.setattr(retriever, "embed_texts", lambda texts: [[0.5] for _ in texts])
+    def hit(doc_id, score):
+        return {"_id": doc_id, "_score": score, "_source": {"file_path": doc_id, "section": "S", "chunk_id": 0, "text": doc_id.upper()}}
+    class E:
+        def msearch(self, searches):
+            self.searches = searches
+            return {"responses": [
+                {"took": 4, "hits": {"hits": [hit("a", 9.0), hit("b", 7.0)]}},
+                {"took": 2, "hits": {"hits": [hit("b", 0.9), hit("c", 0.8)]}},
+                {"error": {"type": "search_phase_execution_exception"}},
+                {"took": 3, "hits": {"hits": [hit("c", 0.7)]}},
+            ]}
+    es = E()
+    results = retriever.retrieve_many(["q1", "q2"], es, top_k=2)
+
+    assert len(es.searches) == 8
+    assert es.searches[1]["query"] == {"match": {"text": {"query": "q1"}}}
+    assert es.searches[3]["knn"]["query_vector"] == [0.5]
+    # "b" is in both legs of q1; q2 falls back to its vector leg
+    assert [hit["file_path"] for hit in results[0]] == ["b", "a"]
+    assert results[0][0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert [hit["file_path"] for hit in results[1]] == ["c"]
+    legs = retriever.retrieval_stats()["legs"]
+    assert legs["lexical"] == {"searches": 2, "errors": 1, "max_took_ms": 4, "mean_candidates": 2.0, "mean_took_ms": 4.0}
+    assert legs["vector"]["mean_candidates"] == 1.5
+
 
 def test_delete_index_prints_when_index_missing(monkeypatch, capsys):
     import importlib
@@ -78,8 +420,8 @@ def test_delete_index_prints_when_index_missing(monkeypatch, capsys):
         def __init__(self, *a, **k):
             self.indices = DummyIdx()
 
-    # Patch the Elasticsearch constructor in the module
-    monkeypatch.setattr(mod, "Elasticsearch", DummyEs)
+    # Patch the shared client accessor in the module
+    monkeypatch.setattr(mod, "get_es_client", lambda: DummyEs())
 
     # Call the function under test
     mod.delete_index()
@@ -89,3 +431,21 @@ def test_delete_index_prints_when_index_missing(monkeypatch, capsys):
     assert f"Index '{mod.INDEX_NAME}' does not exist." in out
 
 
+def test_es_client_is_created_once_and_shared(monkeypatch):
+    import src.services.es_client as es_client_mod
+    created = []
+    class DummyEs:
+        def __init__(self, hosts, **kwargs):
+            created.append(kwargs)
+    monkeypatch.setattr(es_client_mod, "Elasticsearch", DummyEs)
+    monkeypatch.setattr(es_client_mod, "_client", None)
+    monkeypatch.setattr(es_client_mod, "_stats", dict.fromkeys(es_client_mod._stats, 0))
+
+    first = es_client_mod.get_es_client()
+    second = es_client_mod.get_es_client()
+
+    assert first is second
+    assert len(created) == 1
+    assert created[0]["connections_per_node"] == es_client_mod.ES_MAX_CONNECTIONS
+    assert created[0]["retry_on_timeout"] == es_client_mod.ES_RETRY_ON_TIMEOUT
+    assert es_client_mod._stats["created"] == 1 and es_client_mod._stats["reused"] == 1
@@ -1,35 +1,222 @@
 #When you run this script pdf documents are converted into txt files
+#
+# PDFs under documents/<domain>/ are extracted in parallel worker processes
+# and each text is written next to its PDF (documents/<domain>/<name>.txt).
+# PDFs that did not change since the last run are skipped, and a PDF that
+# takes longer than --timeout seconds is abandoned so it can't stall the batch.
+# A PDF that crashes its worker process (e.g. a segfault in a C extension)
+# breaks the whole pool: the pool is restarted for the remaining files, and
+# the files that were unfinished at the crash are retried one at a time so
+# only the culprit is recorded as failed.
+#
+#   python text_extracter.py [--workers N] [--timeout SECONDS] [--force]
 
-from pdfminer.high_level import extract_text
+import argparse
+import hashlib
+import json
 import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
 
 # Root documents folder
 documents_root = './documents/'
+# Remembers which PDFs were already extracted (size, mtime and content hash)
+cache_file = os.path.join(documents_root, '.extract_cache.json')
 
-# Auto-detect all subdirectories (e.g., biofilms/, material/, etc.)
-pdf_directories = [
-    d for d in os.listdir(documents_root)
-    if os.path.isdir(os.path.join(documents_root, d))
-]
-
-for pdf_directory in pdf_directories:
-    pdf_paths=[]
-    # List all files in the directory
-    for filename in os.listdir('./documents/'+pdf_directory):
-        if filename.endswith('.pdf'):
-            # Construct the full path to the PDF file
-            pdf_paths.append(os.path.join(pdf_directory, filename))
-    # print(pdf_paths)
-
-    def extract_text_from_pdf(pdf_path):
-        return extract_text(pdf_path)
-
-    dir_length=len(pdf_directory)
-    text_output_paths = [pdf_path[:dir_length]+'texts/'+pdf_path[dir_length:-3]+"txt" for pdf_path in pdf_paths]  # Make sure this is different from pdf_path
-
-    # Write the extracted text to the output file
-    for text_output_path,pdf_path in zip(text_output_paths,pdf_paths):
-        extracted_text = extract_text_from_pdf(pdf_path)
-        with open(text_output_path, 'w', encoding='utf-8') as f:
-            f.write(extracted_text)
 
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout()
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_text_from_pdf(pdf_path, text_output_path, timeout):
+    """
+    Extract one PDF into `text_output_path` (runs in a worker process).
+
+    :return: (pdf_path, pages, seconds, error message or None)
+    """
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    started = time.perf_counter()
+    # SIGALRM interrupts pdfminer's pure-Python parsing (Unix only)
+    use_alarm = timeout > 0 and hasattr(signal, 'SIGALRM')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    pages = 0
+    try:
+        # Same steps as pdfminer.high_level.extract_text, counting pages
+        with open(pdf_path, 'rb') as fp, StringIO() as out:
+            manager = PDFResourceManager(caching=True)
+            device = TextConverter(manager, out, codec='utf-8', laparams=LAParams())
+            interpreter = PDFPageInterpreter(manager, device)
+            for page in PDFPage.get_pages(fp):
+                interpreter.process_page(page)
+                pages += 1
+            device.close()
+            extracted_text = out.getvalue()
+    except ExtractionTimeout:
+        return pdf_path, pages, time.perf_counter() - started, f'timed out after {timeout}s'
+    except Exception as e:
+        return pdf_path, pages, time.perf_counter() - started, str(e) or type(e).__name__
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    # Write the extracted text atomically so an interrupted run never leaves a partial file
+    tmp_path = text_output_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(extracted_text)
+    os.replace(tmp_path, text_output_path)
+    return pdf_path, pages, time.perf_counter() - started, None
+
+
+def find_pdfs(root):
+    """
+    All PDFs in the domain folders under `root` (e.g. biofilms/, material/).
+    """
+    pdf_paths = []
+    for directory, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if filename.lower().endswith('.pdf'):
+                pdf_paths.append(os.path.join(directory, filename))
+    return sorted(pdf_paths)
+
+
+def load_cache():
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_cache(cache):
+    tmp_path = cache_file + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp_path, cache_file)
+
+
+def is_unchanged(pdf_path, text_output_path, entry):
+    """
+    True if the text exists and the PDF matches the cached size and mtime,
+    or (after e.g. a copy that touched the mtime) the cached content hash.
+    """
+    if not entry or not os.path.exists(text_output_path):
+        return False
+    stat = os.stat(pdf_path)
+    if entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return True
+    if entry['size'] == stat.st_size and entry['sha1'] == file_sha1(pdf_path):
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert the PDFs under documents/ into txt files.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='extraction processes')
+    parser.add_argument('--timeout', type=float, default=120, help='seconds per PDF before giving up (0 = no limit)')
+    parser.add_argument('--force', action='store_true', help='re-extract PDFs even if unchanged')
+    args = parser.parse_args()
+
+    cache = {} if args.force else load_cache()
+    todo, skipped = [], 0
+    for pdf_path in find_pdfs(documents_root):
+        key = os.path.relpath(pdf_path, documents_root)
+        text_output_path = pdf_path[:-4] + '.txt'
+        if is_unchanged(pdf_path, text_output_path, cache.get(key)):
+            skipped += 1
+        else:
+            todo.append((key, pdf_path, text_output_path))
+    print(f'{len(todo)} PDFs to extract, {skipped} unchanged.')
+
+    started = time.perf_counter()
+    total_pages, failures, done = 0, [], 0
+    # Files that were unfinished when a worker crashed; each is retried alone
+    suspects = set()
+    remaining = list(todo)
+    while remaining:
+        isolated = remaining[0][0] in suspects
+        batch = remaining[:1] if isolated else [item for item in remaining if item[0] not in suspects]
+        workers = 1 if isolated else max(args.workers, 1)
+        finished = set()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Only a few PDFs per worker are queued at a time, so a crash
+            # leaves few unfinished files to retry
+            queued, futures, broken = iter(batch), {}, False
+            while True:
+                while not broken and len(futures) < 2 * workers:
+                    item = next(queued, None)
+                    if item is None:
+                        break
+                    key, pdf_path, text_output_path = item
+                    try:
+                        futures[pool.submit(extract_text_from_pdf, pdf_path, text_output_path, args.timeout)] = key
+                    except BrokenProcessPool:
+                        broken = True
+                if not futures:
+                    break
+                completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    key = futures.pop(future)
+                    try:
+                        pdf_path, pages, seconds, error = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                        if isolated:
+                            finished.add(key)
+                            done += 1
+                            failures.append((key, 'worker process crashed'))
+                            print(f'[{done}/{len(todo)}] ⚠️ Could not process {key}: worker process crashed')
+                        else:
+                            suspects.add(key)
+                        continue
+                    finished.add(key)
+                    done += 1
+                    if error:
+                        failures.append((key, error))
+                        print(f'[{done}/{len(todo)}] ⚠️ Could not process {key}: {error}')
+                        continue
+                    total_pages += pages
+                    stat = os.stat(pdf_path)
+                    cache[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': file_sha1(pdf_path)}
+                    print(f'[{done}/{len(todo)}] {key}: {pages} pages in {seconds:.1f}s')
+                    # Keep progress if the batch is interrupted
+                    if done % 50 == 0:
+                        save_cache(cache)
+        remaining = [item for item in remaining if item[0] not in finished]
+        if broken and remaining:
+            save_cache(cache)
+            print(f'⚠️ A worker process crashed; restarting the pool for {len(remaining)} remaining PDFs.')
+    save_cache(cache)
+
+    elapsed = time.perf_counter() - started
+    rate = total_pages / elapsed if elapsed > 0 else 0.0
+    print(
+        f'Extracted {len(todo) - len(failures)} PDFs ({total_pages} pages) in {elapsed:.1f}s '
+        f'({rate:.1f} pages/sec), {skipped} unchanged skipped, {len(failures)} failed.'
+    )
+    for key, error in failures:
+        print(f'  failed: {key}: {error}')
+
+
+if __name__ == '__main__':
+    main()